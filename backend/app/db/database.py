@@ -1,16 +1,83 @@
-from sqlalchemy import Column, Integer, String, JSON, Float, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, JSON, Float, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text, event
 import datetime
+import os
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./disinfo_system.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./disinfo_system.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# WAL lets status reads run while the write-behind flushers commit; NORMAL only fsyncs at
+# checkpoints in WAL mode (a power cut can lose the last commits, never corrupt the file)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# Writers wait this long for the lock instead of failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# DB_ASYNC=1 also creates an aiosqlite engine (AsyncSessionLocal) for async code paths
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+
+def sqlite_pragmas(journal_mode=SQLITE_JOURNAL_MODE, synchronous=SQLITE_SYNCHRONOUS,
+                   busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS):
+    return [
+        f"PRAGMA journal_mode={journal_mode}",
+        f"PRAGMA synchronous={synchronous}",
+        f"PRAGMA busy_timeout={busy_timeout_ms}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def apply_pragmas(sync_engine, pragmas):
+    """Runs the PRAGMAs on every new pooled connection (they are per connection, except journal_mode)."""
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def make_engine(url: str = SQLALCHEMY_DATABASE_URL, pragmas=None):
+    """
+    Engine with one connection per thread from the pool. check_same_thread=False only lets
+    a pooled connection be handed to another thread later; sessions are never shared.
+    """
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    )
+    if url.startswith("sqlite"):
+        apply_pragmas(engine, sqlite_pragmas() if pragmas is None else pragmas)
+    return engine
+
+
+def make_async_engine(url: str = SQLALCHEMY_DATABASE_URL, pragmas=None):
+    """aiosqlite engine (optional dependency) with the same PRAGMAs as the sync one."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+                                       connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+    apply_pragmas(async_engine.sync_engine, sqlite_pragmas() if pragmas is None else pragmas)
+    return async_engine
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    try:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        async_engine = make_async_engine()
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    except ImportError as e:
+        print(f"ERROR: DB_ASYNC=1 but the async SQLite driver is missing (pip install aiosqlite): {e}")
+
 Base = declarative_base()
 
 
@@ -22,7 +89,118 @@ class TrainingRun(Base):
     end_time = Column(DateTime)
     f1_score_before = Column(Float)
     f1_score_after = Column(Float)
-    status = Column(String)  # "completed", "failed", "running"
+    status = Column(String)  # "queued", "running", "completed", "failed", "cancelled"
     adapter_path = Column(String)
+    # Orchestrator state machine, persisted so a backend restart can resume the run
+    stage = Column(String)  # idle, training, evaluating, ready_to_promote, deploying, ...
+    training_progress = Column(Integer, default=0)
+    evaluation_progress = Column(Integer, default=0)
+    exact_match_after = Column(Float)
+    report_path = Column(String)  # benchmark report behind f1_score_after / exact_match_after
+    pid = Column(Integer)  # PID of the process driving the current stage
+    host = Column(String)  # host that PID lives on (leaders on other hosts can't check it)
+    log_path = Column(String)
+    telemetry_path = Column(String)  # per-step CSV written by the trainer (see training/telemetry.py)
+    dataset_path = Column(String)
+    # Incremental runs continue from an existing adapter with replayed earlier data
+    train_mode = Column(String, default="full")  # "full" | "incremental"
+    init_adapter = Column(String)
+    replay_rows = Column(Integer)
+    train_seconds = Column(Float)  # trainer wall-clock (train_runtime)
+    cycle_seconds = Column(Float)  # training start -> benchmark done
+    f1_retention = Column(Float)  # f1_score_after / f1_score_before on the old test set
+    deployed_at = Column(DateTime)  # adapter promoted to Ollama (quantization redeploys don't count)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class AnalysisRecord(Base):
+    """One /analyze call with the signals used to pick examples for expert labeling."""
+    __tablename__ = "analyses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    model = Column(String)
+    model_version = Column(String, index=True)  # Ollama model digest at the time of the call
+    source = Column(String)  # "model", "near_dup_cache", "semantic_cache"
+    latency_ms = Column(Float)
+    input_text = Column(String)
+    input_hash = Column(String, index=True)
+    raw_output = Column(String)
+    techniques = Column(JSON)
+    reasoning = Column(String)
+    parse_status = Column(String)  # "Strict Success", "Recovered", "Failed"
+    mean_logprob = Column(Float)
+    sample_disagreement = Column(Float)  # 1 - mean Jaccard vs. sampled generations
+    candidate_disagreement = Column(Float)  # 1 - Jaccard vs. the candidate model
+    uncertainty = Column(Float, index=True)
+    exported = Column(Boolean, default=False)
+
+
+class AnalysisTechnique(Base):
+    """
+    One row per (analysis, technique): a JSON column can't be indexed, and trend queries
+    ("EXAGGERATION per day") should not scan every analysis.
+    """
+    __tablename__ = "analysis_techniques"
+    __table_args__ = (Index("ix_analysis_techniques_technique_time", "technique", "created_at"),)
+
+    id = Column(Integer, primary_key=True)
+    analysis_id = Column(Integer, ForeignKey("analyses.id"), index=True)
+    technique = Column(String)
+    created_at = Column(DateTime)  # copied from the analysis, so the index covers time ranges
+
+
+class Lease(Base):
+    """Leader lease: the holder of an unexpired row owns the job it names (e.g. the training lifecycle)."""
+    __tablename__ = "leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String)  # worker id, "host:pid"
+    expires_at = Column(Float)  # unix time; hosts sharing the lease need synced clocks
+
+
+class SharedState(Base):
+    """Small JSON values published by the leader for every API worker (training status, model generation)."""
+    __tablename__ = "shared_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(JSON)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class OrchestratorCommand(Base):
+    """Training call received by a worker without the lease, executed by the leader."""
+    __tablename__ = "orchestrator_commands"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String)  # start_training, cancel_run, promote, ...
+    payload = Column(JSON)
+    status = Column(String, default="pending", index=True)  # pending, running, done, failed, expired
+    result = Column(JSON)  # handler result, or {"status_code", "detail"} on failure
+    submitted_by = Column(String)
+    claimed_by = Column(String)  # leader that executes it
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime)
+
+
+def migrate(bind):
+    """
+    create_all() never alters existing tables, so columns added to a model later
+    are appended here (SQLite supports ADD COLUMN, which is all we need).
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+            # Same for indexes declared on existing tables
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 Base.metadata.create_all(bind=engine)
+migrate(engine)
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import sessionmaker
+
+from . import database
+
+# Rough mix of what the backend does: the UI polls status, the trainer reports progress,
+# uploads create runs, /analyze flushes history batches
+OPERATION_WEIGHTS = {"status_read": 0.5, "progress_write": 0.35, "run_insert": 0.05, "analysis_batch": 0.1}
+ANALYSIS_BATCH_ROWS = 50
+
+
+def _status_read(db, run_ids):
+    db.execute(select(database.TrainingRun).order_by(database.TrainingRun.id.desc()).limit(1)).scalars().first()
+
+
+def _progress_write(db, run_ids):
+    db.execute(update(database.TrainingRun)
+               .where(database.TrainingRun.id == random.choice(run_ids))
+               .values(training_progress=random.randint(0, 100), updated_at=datetime.utcnow()))
+    db.commit()
+
+
+def _run_insert(db, run_ids):
+    db.add(database.TrainingRun(status="queued", stage="queued"))
+    db.commit()
+
+
+def _analysis_batch(db, run_ids):
+    db.add_all([database.AnalysisRecord(model="bench", input_hash=str(random.random()), techniques=["ANECDOTE"],
+                                        latency_ms=1.0, source="model")
+                for _ in range(ANALYSIS_BATCH_ROWS)])
+    db.commit()
+
+
+OPERATIONS = {"status_read": _status_read, "progress_write": _progress_write,
+              "run_insert": _run_insert, "analysis_batch": _analysis_batch}
+
+
+def _pick(rng):
+    return rng.choices(list(OPERATION_WEIGHTS), weights=list(OPERATION_WEIGHTS.values()))[0]
+
+
+def _prepare(engine, runs=20):
+    database.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        session.add_all([database.TrainingRun(status="running", stage="training") for _ in range(runs)])
+        session.commit()
+        return [r.id for r in session.query(database.TrainingRun.id).all()]
+    finally:
+        session.close()
+
+
+def _summary(name, latencies, errors, seconds):
+    ops = sum(len(v) for v in latencies.values())
+    return {
+        "profile": name,
+        "ops_per_sec": round(ops / seconds, 1),
+        "errors": errors,
+        "operations": {
+            op: {
+                "count": len(values),
+                "p50_ms": round(float(np.percentile(values, 50)) * 1000, 2),
+                "p95_ms": round(float(np.percentile(values, 95)) * 1000, 2),
+                "p99_ms": round(float(np.percentile(values, 99)) * 1000, 2),
+            }
+            for op, values in latencies.items() if values
+        },
+    }
+
+
+def run_threads(name, engine, workers, seconds, seed=0):
+    """`workers` threads, each with its own session per operation (like the backend)."""
+    run_ids = _prepare(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    latencies = {op: [] for op in OPERATIONS}
+    errors = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            op = _pick(rng)
+            started = time.perf_counter()
+            db = factory()
+            try:
+                OPERATIONS[op](db, run_ids)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies[op].append(elapsed)
+            except Exception as e:
+                db.rollback()
+                with lock:
+                    key = type(e.__cause__ or e).__name__ + ": " + str(e.__cause__ or e).split("\n")[0][:60]
+                    errors[key] = errors.get(key, 0) + 1
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    return _summary(name, latencies, errors, seconds)
+
+
+def run_async(name, path, workers, seconds, seed=0):
+    """Same mix from `workers` asyncio tasks on AsyncSession (aiosqlite)."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    url = f"sqlite:///{path}"
+    run_ids = _prepare(database.make_engine(url))
+    async_engine = database.make_async_engine(url)
+    factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    latencies = {op: [] for op in OPERATIONS}
+    errors = {}
+
+    async def worker(index, deadline):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            op = _pick(rng)
+            started = time.perf_counter()
+            async with factory() as db:
+                try:
+                    await db.run_sync(lambda sync_db: OPERATIONS[op](sync_db, run_ids))
+                    latencies[op].append(time.perf_counter() - started)
+                except Exception as e:
+                    await db.rollback()
+                    key = type(e).__name__
+                    errors[key] = errors.get(key, 0) + 1
+
+    async def main():
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(worker(i, deadline) for i in range(workers)))
+        await async_engine.dispose()
+
+    asyncio.run(main())
+    return _summary(name, latencies, errors, seconds)
+
+
+def run(workers=8, seconds=5.0, profiles=("default", "tuned", "async")):
+    """
+    Runs the mix against a fresh database file per profile:
+    default = the old engine (rollback journal, synchronous=FULL), tuned = make_engine()
+    (WAL, synchronous=NORMAL, busy_timeout), async = tuned PRAGMAs on aiosqlite.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in profiles:
+            path = os.path.join(tmp, f"{name}.db")
+            url = f"sqlite:///{path}"
+            if name == "default":
+                engine = create_engine(url, connect_args={"check_same_thread": False})
+                results.append(run_threads(name, engine, workers, seconds))
+            elif name == "tuned":
+                results.append(run_threads(name, database.make_engine(url), workers, seconds))
+            elif name == "async":
+                try:
+                    import aiosqlite  # noqa: F401
+                    import sqlalchemy.ext.asyncio  # noqa: F401  (needs greenlet)
+                except ImportError as e:
+                    print(f"DEBUG: Skipping the async profile: {e}")
+                    continue
+                results.append(run_async(name, path, workers, seconds))
+    return {"workers": workers, "seconds": seconds, "mix": OPERATION_WEIGHTS, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite concurrency benchmark: status reads vs progress/run/analysis writes")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--profiles", type=str, default="default,tuned,async")
+    parser.add_argument("--output", type=str, default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.workers, args.seconds, tuple(p.strip() for p in args.profiles.split(",")))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
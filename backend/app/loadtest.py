@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from .training.core import get_project_root
+
+LOADTEST_RESULTS_DIR = os.getenv("LOADTEST_RESULTS_DIR", os.path.join(get_project_root(), "model", "loadtest-results"))
+# A p95/p99 this much higher (or throughput this much lower) than the baseline fails the run
+LOADTEST_THRESHOLD = float(os.getenv("LOADTEST_THRESHOLD", "0.2"))
+# Latency differences below this are noise, whatever the ratio
+LOADTEST_MIN_DELTA_MS = float(os.getenv("LOADTEST_MIN_DELTA_MS", "5"))
+STARTUP_TIMEOUT_SECONDS = 60
+WORDS = ("rząd ogłosił dziś nowe przepisy które według ekspertów zmienią wszystko czy naprawdę wiemy kto "
+         "na tym skorzysta wszyscy mówią ale nikt nie pyta o koszty szokujące dane pokazują że media ukrywają "
+         "prawdę o szczepionkach podatkach imigrantach klimacie wyborach wojnie cenach energii inflacji").split()
+
+
+def article(i: int) -> str:
+    # Different word mix per request, so neither the near-duplicate nor the semantic cache answers it
+    rng = random.Random(i)
+    return " ".join(rng.choice(WORDS) for _ in range(60 + 40 * (i % 6))) + "."
+
+
+# name -> (method, path, request kwargs for the i-th request)
+SCENARIOS = {
+    "analyze": ("POST", "/analyze", lambda i: {"json": {"text": article(i)}}),
+    "status": ("GET", "/training/status", lambda i: {}),
+    "progress": ("POST", "/training/progress", lambda i: {"json": {"stage": "training", "value": i % 101}}),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LoadTestStack:
+    """
+    The API (uvicorn, its own process) talking to a fake Ollama (another process), both
+    running in a scratch directory with their own SQLite file, so the real database,
+    caches and model folders are never touched.
+    """
+
+    def __init__(self, fake_options: dict = None, env: dict = None):
+        self.fake_options = fake_options or {}
+        self.env = env or {}
+        self.workdir = None
+        self.processes = []
+        self.api_url = None
+
+    def __enter__(self):
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.workdir = tempfile.mkdtemp(prefix="loadtest_")
+        fake_port, api_port = free_port(), free_port()
+        env = dict(os.environ, PYTHONPATH=backend_dir,
+                   DATABASE_URL=f"sqlite:///{os.path.join(self.workdir, 'loadtest.db')}",
+                   INFERENCE_BACKEND="ollama", OLLAMA_UPSTREAMS="",
+                   OLLAMA_URL=f"http://127.0.0.1:{fake_port}/api/chat")
+        env.update({k: str(v) for k, v in self.env.items()})
+        fake_cmd = [sys.executable, "-m", "app.serving.fake_upstream", "--port", str(fake_port)]
+        for key, value in self.fake_options.items():
+            fake_cmd += [f"--{key}", str(value)]
+        api_cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                   "--port", str(api_port), "--log-level", "warning"]
+        log = open(os.path.join(self.workdir, "stack.log"), "w", encoding="utf-8")
+        for cmd in (fake_cmd, api_cmd):
+            self.processes.append(subprocess.Popen(cmd, cwd=self.workdir, env=env, stdout=log, stderr=subprocess.STDOUT))
+        self.api_url = f"http://127.0.0.1:{api_port}"
+        self._wait_ready(f"http://127.0.0.1:{fake_port}/api/tags")
+        self._wait_ready(f"{self.api_url}/training/status")
+        return self
+
+    def _wait_ready(self, url):
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            if any(p.poll() is not None for p in self.processes):
+                break
+            try:
+                if httpx.get(url, timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        with open(os.path.join(self.workdir, "stack.log"), "r", encoding="utf-8") as f:
+            tail = f.read()[-2000:]
+        self.__exit__(None, None, None)
+        raise RuntimeError(f"Load test stack did not come up ({url}):\n{tail}")
+
+    def __exit__(self, *exc):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def summarize(samples, seconds: float) -> dict:
+    """samples: (latency seconds, status code or None for a connection error) per finished request."""
+    ok = np.array([latency for latency, status in samples if status is not None and status < 400]) * 1000
+    statuses = {}
+    for _, status in samples:
+        key = str(status) if status is not None else "error"
+        statuses[key] = statuses.get(key, 0) + 1
+    return {
+        "requests": len(samples),
+        "ok": int(len(ok)),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(ok) / seconds, 2),
+        "p50_ms": round(float(np.percentile(ok, 50)), 2) if len(ok) else None,
+        "p95_ms": round(float(np.percentile(ok, 95)), 2) if len(ok) else None,
+        "p99_ms": round(float(np.percentile(ok, 99)), 2) if len(ok) else None,
+    }
+
+
+async def drive(base_url: str, scenario: str, seconds: float, rps: float = None, concurrency: int = None,
+                warmup_seconds: float = 1.0) -> dict:
+    """
+    Fixed RPS (open loop: requests go out on schedule, however slow the answers) or fixed
+    concurrency (closed loop: `concurrency` clients send the next request once answered).
+    Requests started during the warmup are not counted.
+    """
+    method, path, request_kwargs = SCENARIOS[scenario]
+    samples = []
+    counter = iter(range(10 ** 9))
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        started = time.perf_counter()
+        measure_from = started + warmup_seconds
+        end = measure_from + seconds
+
+        async def one():
+            i = next(counter)
+            sent = time.perf_counter()
+            try:
+                response = await client.request(method, path, **request_kwargs(i))
+                status = response.status_code
+            except httpx.HTTPError:
+                status = None
+            if sent >= measure_from:
+                samples.append((time.perf_counter() - sent, status))
+
+        if rps:
+            tasks = []
+            next_at = started
+            while next_at < end:
+                tasks.append(asyncio.create_task(one()))
+                next_at += 1 / rps
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            await asyncio.gather(*tasks)
+        else:
+            async def client_loop():
+                while time.perf_counter() < end:
+                    await one()
+            await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return summarize(samples, seconds)
+
+
+def run(scenarios, rates=(), concurrencies=(), seconds: float = 10.0, warmup_seconds: float = 1.0,
+        fake_options: dict = None, env: dict = None) -> dict:
+    results = {}
+    with LoadTestStack(fake_options, env) as stack:
+        for scenario in scenarios:
+            levels = [("rps", r) for r in rates] + [("concurrency", c) for c in concurrencies]
+            for kind, level in levels:
+                key = f"{scenario}/{kind}={level:g}"
+                kwargs = {"rps": level} if kind == "rps" else {"concurrency": int(level)}
+                results[key] = asyncio.run(drive(stack.api_url, scenario, seconds, warmup_seconds=warmup_seconds, **kwargs))
+                r = results[key]
+                print(f"{key:<30} {r['throughput_rps']:>8} rps  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+                      f"p99 {r['p99_ms']} ms  statuses {r['statuses']}")
+    return {
+        "date": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "seconds": seconds,
+        "fake_ollama": fake_options or {},
+        "env": env or {},
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = LOADTEST_THRESHOLD,
+            min_delta_ms: float = LOADTEST_MIN_DELTA_MS) -> list:
+    """Regressions of `current` against `baseline` (same scenario/level keys only), as readable lines."""
+    regressions = []
+    for key, now in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if now[metric] is None or before[metric] is None:
+                continue
+            if now[metric] > before[metric] * (1 + threshold) and now[metric] - before[metric] > min_delta_ms:
+                regressions.append(f"{key} {metric}: {before[metric]} -> {now[metric]} ms")
+        if now["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{key} throughput: {before['throughput_rps']} -> {now['throughput_rps']} rps")
+        if now["ok"] < now["requests"] and before["ok"] == before["requests"]:
+            regressions.append(f"{key} errors: {now['requests'] - now['ok']} failed requests ({now['statuses']})")
+    return regressions
+
+
+def latest_result(results_dir: str = LOADTEST_RESULTS_DIR, exclude: str = None):
+    paths = [p for p in glob.glob(os.path.join(results_dir, "loadtest_*.json")) if p != exclude]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def parse_levels(value: str):
+    return [float(v) for v in value.split(",") if v.strip()] if value else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /analyze, /training/status and /training/progress against a fake Ollama")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Run the load test, save the results and compare with a baseline")
+    run_parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS))
+    run_parser.add_argument("--rps", type=str, default="10,50", help="Fixed request rates (open loop)")
+    run_parser.add_argument("--concurrency", type=str, default="1,8", help="Fixed numbers of clients (closed loop)")
+    run_parser.add_argument("--seconds", type=float, default=10.0, help="Measured time per level")
+    run_parser.add_argument("--warmup_seconds", type=float, default=1.0)
+    run_parser.add_argument("--latency_ms", type=float, default=200.0, help="Fake Ollama base latency")
+    run_parser.add_argument("--jitter_ms", type=float, default=50.0)
+    run_parser.add_argument("--latency_dist", type=str, default="lognormal", choices=("uniform", "lognormal", "exponential"))
+    run_parser.add_argument("--tokens_per_second", type=float, default=0.0, help="Fake decoding speed (0 = instant)")
+    run_parser.add_argument("--prompt_tokens_per_second", type=float, default=0.0)
+    run_parser.add_argument("--answer_tokens", type=int, default=0)
+    run_parser.add_argument("--set", type=str, action="append", default=[], help="Extra API env var, e.g. --set BATCH_WINDOW_MS=5")
+    run_parser.add_argument("--output", type=str, default=None, help="Result file (default: results dir, timestamped)")
+    run_parser.add_argument("--baseline", type=str, default="latest", help="Result file to compare with, 'latest' or 'none'")
+    run_parser.add_argument("--threshold", type=float, default=LOADTEST_THRESHOLD)
+    compare_parser = sub.add_parser("compare", help="Compare two saved results")
+    compare_parser.add_argument("current", type=str)
+    compare_parser.add_argument("baseline", type=str)
+    compare_parser.add_argument("--threshold", type=float, default=LOADTEST_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.current, "r", encoding="utf-8") as f:
+            current = json.load(f)
+        baseline_path = args.baseline
+    else:
+        fake_options = {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "latency_dist": args.latency_dist,
+                        "tokens_per_second": args.tokens_per_second,
+                        "prompt_tokens_per_second": args.prompt_tokens_per_second, "answer_tokens": args.answer_tokens}
+        env = dict(item.split("=", 1) for item in args.set)
+        baseline_path = latest_result() if args.baseline == "latest" else (None if args.baseline == "none" else args.baseline)
+        current = run([s.strip() for s in args.scenarios.split(",") if s.strip()], parse_levels(args.rps),
+                      parse_levels(args.concurrency), args.seconds, args.warmup_seconds, fake_options, env)
+        output = args.output or os.path.join(LOADTEST_RESULTS_DIR, f"loadtest_{int(time.time())}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to: {output}")
+
+    if not baseline_path:
+        print("DEBUG: No baseline to compare with; this run can serve as the next one")
+        return
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("fake_ollama") != current.get("fake_ollama") or baseline.get("seconds") != current.get("seconds"):
+        print("WARNING: Baseline was recorded with other fake Ollama settings or duration; comparison may be meaningless")
+    regressions = compare(current, baseline, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION: {line}")
+    print(f"RESULT: {'FAIL' if regressions else 'PASS'} against {baseline_path} (threshold {args.threshold:.0%})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
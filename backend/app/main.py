@@ -1,10 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-import httpx
+from fastapi.responses import StreamingResponse, FileResponse
 from .db import database
 from pydantic import BaseModel
-from typing import Any
+from typing import Any, Optional
+import os
+from .training.truncation import Truncator, load_tokenizer
+from .training.core import get_project_root
+from .training.truncation import TRUNCATION_STRATEGY
+from .training.curation import CurationLog, to_upload_row, queue_entry, input_hash
+from .training.near_dup import MinHashIndex, reference_index
+from .training.semantic_index import SemanticIndex
+from .serving.backends import load_backend, MODEL_NAME
+from .serving.batching import with_batching
+from .serving.admission import AdmissionController, Overloaded, ADMISSION_DEFAULT_DEADLINE_MS
+from .training.analysis_history import (AnalysisWriter, TREND_BUCKETS, list_analyses, technique_trends,
+                                        iter_export_chunks, csv_stream, parquet_stream, parquet_available)
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+import asyncio
+import time
 
 app = FastAPI(title="Disinformation Detector Backend")
 
@@ -17,128 +32,532 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-OLLAMA_URL = "http://localhost:11434/api/chat"
-MODEL_NAME = "bielik-lora-mipd:latest"
+# Ollama over HTTP, in-process llama.cpp or the fake (INFERENCE_BACKEND);
+# concurrent calls are micro-batched when BATCH_WINDOW_MS > 0
+inference_backend = with_batching(load_backend())
+# Adaptive concurrency limit + deadline queue in front of the model; overload gets a quick 503
+ADMISSION_ENABLED = os.getenv("ADMISSION_CONTROL", "1") == "1"
+admission = AdmissionController() if ADMISSION_ENABLED else None
+# Article budget for /analyze; leaves room for the Modelfile system prompt and the answer in a 4k context
+ANALYZE_MAX_INPUT_TOKENS = int(os.getenv("ANALYZE_MAX_INPUT_TOKENS", "3000"))
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", os.path.join(get_project_root(), "model", "bielik-4.5b-base", "tokenizer.json"))
+
+# Same tokenizer + cut as the trainer and the benchmark (char-based estimate without tokenizer.json)
+api_tokenizer = load_tokenizer(TOKENIZER_PATH)
+analyze_truncator = Truncator(api_tokenizer, strategy=TRUNCATION_STRATEGY)
+ANALYZE_LOGPROBS = os.getenv("ANALYZE_LOGPROBS", "1") == "1"
+
+# Near-duplicate (MinHash-LSH) index of analyzed articles: syndicated copies are served from cache
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE", "1") == "1"
+# Newest entries kept (each ~2 KB in memory); all API workers share the file, see MinHashIndex
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "20000"))
+analysis_cache = MinHashIndex(os.path.join("cache", "analysis_minhash.jsonl"), max_items=ANALYSIS_CACHE_MAX_ENTRIES)
+# Same index over the benchmark test set, to keep its near-copies out of training uploads
+TEST_SET_PATH = os.path.join(get_project_root(), "model", "dataset", "mipd_test.jsonl")
+test_set_index = reference_index(TEST_SET_PATH, os.path.join("cache", "test_set_minhash.jsonl"))
+# Every /analyze call lands in the analyses table, inserted in batches off the request path
+analysis_writer = AnalysisWriter()
+curation_log = CurationLog(inference_backend, writer=analysis_writer)
+# Embedding index: close paraphrases of analyzed articles ("fast" mode) + labelled examples as evidence.
+# Lexical (feature-hashed words) unless EMBEDDING_MODEL names a sentence-transformers model
+SEMANTIC_INDEX_ENABLED = os.getenv("SEMANTIC_INDEX", "1") == "1"
+semantic_index = SemanticIndex("cache") if SEMANTIC_INDEX_ENABLED else None
+EVIDENCE_DATASET_PATH = os.path.join(get_project_root(), "model", "dataset", "mipd_train.jsonl")
 
 class AnalysisRequest(BaseModel):
     text: str
+    # "fast" answers from a semantically close earlier analysis when there is one
+    mode: str = "full"
+    # Time budget the client will wait (also X-Request-Deadline-Ms); requests that can't make it get 503
+    deadline_ms: Optional[float] = None
 
 
-def get_db():
-    db = database.SessionLocal()
+@app.on_event("startup")
+async def start_inference_backend():
+    # Health checks of the router's upstreams need the running loop
+    await inference_backend.start()
+
+
+@app.on_event("startup")
+async def index_evidence_dataset():
+    if semantic_index is not None:
+        # Embedding the base training set takes a while the first time; don't block startup
+        asyncio.get_running_loop().run_in_executor(None, semantic_index.index_dataset, EVIDENCE_DATASET_PATH)
+
+
+async def record_cached_answer(text, result, source, started):
+    analysis_writer.add(database.AnalysisRecord(
+        model=MODEL_NAME,
+        model_version=await inference_backend.model_version(),
+        source=source,
+        latency_ms=(time.perf_counter() - started) * 1000,
+        input_text=text,
+        input_hash=input_hash(text),
+        techniques=result.get("discovered_techniques") or [],
+        reasoning=result.get("reasoning"),
+    ))
+
+
+def request_deadline(request: AnalysisRequest, http_request: Request) -> float:
+    budget_ms = request.deadline_ms or http_request.headers.get("X-Request-Deadline-Ms") or ADMISSION_DEFAULT_DEADLINE_MS
     try:
-        yield db
-    finally:
-        db.close()
+        budget_ms = float(budget_ms)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Request-Deadline-Ms must be a number of milliseconds")
+    return time.monotonic() + budget_ms / 1000
+
 
 @app.post("/analyze")
-async def analyze_text(request: AnalysisRequest):
-    payload = {
-        "model": MODEL_NAME,
-        "messages": [{"role": "user", "content": request.text}],
-        "stream": False,
-        "format": "json"
-    }
-    
+async def analyze_text(request: AnalysisRequest, http_request: Request):
+    started = time.perf_counter()
+    deadline = request_deadline(request, http_request)
+    text, clipped = analyze_truncator.truncate(request.text, ANALYZE_MAX_INPUT_TOKENS)
+    if clipped:
+        print(f"DEBUG: Input clipped by {clipped} tokens ({TRUNCATION_STRATEGY}); so far: {analyze_truncator.report.to_dict()}")
+
+    signature = analysis_cache.signature(text) if ANALYSIS_CACHE_ENABLED else None
+    cached = analysis_cache.best_match(signature)
+    if cached is not None and cached[2].get("model") == MODEL_NAME:
+        print(f"DEBUG: Serving cached analysis of a near-identical article ({cached[0][:12]}, similarity {cached[1]:.2f})")
+        await record_cached_answer(text, cached[2]["result"], "near_dup_cache", started)
+        return cached[2]["result"]
+
+    vector, evidence, hit = None, [], None
+    if semantic_index is not None:
+        # Embedding + vector search are CPU work; the event loop keeps serving meanwhile
+        vector, evidence, hit = await run_in_threadpool(semantic_index.lookup, text, MODEL_NAME, request.mode == "fast")
+    if hit is not None:
+        similarity, meta = hit
+        print(f"DEBUG: Fast mode: answering from a similar analyzed article (similarity {similarity:.2f})")
+        await record_cached_answer(text, meta["result"], "semantic_cache", started)
+        return dict(meta["result"], evidence=evidence,
+                    cached_from={"similarity": round(similarity, 3), "preview": meta.get("preview")})
+
     import json
     print("\n--- DEBUG: POŁĄCZENIE Z LLM ---")
-    print(f"MODEL: {MODEL_NAME}")
+    print(f"MODEL: {MODEL_NAME} ({inference_backend.name})")
     print(f"PROMPT: {request.text[:100]}...") # Print first 100 chars
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                OLLAMA_URL,
-                json=payload,
-                timeout=60.0
-            )
-            response.raise_for_status()
-            ollama_data = response.json()
-            
-            # Print physical response from Ollama
-            content = ollama_data.get('message', {}).get('content', '')
-            print(f"RAW CONTENT FROM OLLAMA: {content}")
-            
-            # Try to parse content as JSON if it's a string (fastapi will do it anyway, but we want to log it)
-            parsed_content = json.loads(content) if isinstance(content, str) else content
-            print(f"PARSED CONTENT: {json.dumps(parsed_content, indent=2)}")
-            print("-------------------------------\n")
-            
-            # Note: the frontend expects discovered_techniques field.
-            # If the model returns it inside content, we should return that.
-            return parsed_content
-        except Exception as e:
-            print(f"ERROR DURING LLM CALL: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Ollama error: {str(e)}")
-
-
-# Global orchestrator instance (singleton-ish for this simpliciy level)
-from .training.orchestrator import MLOpsOrchestrator
-# Initialize later to avoid circular imports during startup if needed, 
-# or use a dependency injection pattern.
-# For now, we will instantiate it per request but share state via singleton pattern or database
-# BUT Orchestrator stores state in memory (self.training_progress).
-# So we need a global instance.
+    try:
+        # Token log-probs feed the curation queue
+        if admission is not None:
+            ollama_data = await admission.run(lambda: inference_backend.chat(text, logprobs=ANALYZE_LOGPROBS), deadline)
+        else:
+            ollama_data = await inference_backend.chat(text, logprobs=ANALYZE_LOGPROBS)
+        
+        # Print physical response from the model server
+        content = ollama_data.get('message', {}).get('content', '')
+        print(f"RAW CONTENT FROM MODEL: {content}")
+        # Logged with uncertainty signals for /curation/queue (in the background)
+        curation_log.submit(text, MODEL_NAME, content, ollama_data, source="model",
+                            # The router says which upstream (and model digest) answered
+                            model_version=ollama_data.get("model_version") or await inference_backend.model_version(),
+                            latency_ms=(time.perf_counter() - started) * 1000)
+        
+        # Try to parse content as JSON if it's a string (fastapi will do it anyway, but we want to log it)
+        parsed_content = json.loads(content) if isinstance(content, str) else content
+        print(f"PARSED CONTENT: {json.dumps(parsed_content, indent=2)}")
+        if isinstance(parsed_content, dict) and "discovered_techniques" in parsed_content:
+            # Off the event loop: an insert may compact (rewrite) the cache file
+            await run_in_threadpool(analysis_cache.insert, input_hash(text), signature,
+                                    {"model": MODEL_NAME, "result": parsed_content})
+            if vector is not None:
+                # Appends to the cache file and may retrain the IVF lists
+                await run_in_threadpool(semantic_index.add_analysis, vector, MODEL_NAME, parsed_content, text[:300])
+        print("-------------------------------\n")
+        
+        # Note: the frontend expects discovered_techniques field.
+        # If the model returns it inside content, we should return that.
+        if isinstance(parsed_content, dict):
+            # Nearest expert-labelled examples, shown as evidence next to the answer
+            return dict(parsed_content, evidence=evidence)
+        return parsed_content
+    except Overloaded as e:
+        print(f"DEBUG: Shedding /analyze: {e.reason} (retry after {e.retry_after}s)")
+        raise HTTPException(status_code=503, detail=f"Overloaded: {e.reason}",
+                            headers={"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
+        print("ERROR DURING LLM CALL: deadline exceeded")
+        raise HTTPException(status_code=504, detail="Inference did not finish before the request deadline")
+    except Exception as e:
+        print(f"ERROR DURING LLM CALL: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Inference error ({inference_backend.name}): {str(e)}")
+
+
+# Training lifecycle: exactly one API worker, the holder of the training lease, runs the
+# orchestrator (scheduler, WSL jobs, run state). With `uvicorn --workers N` or several hosts
+# the others hand training calls to it through the shared database (training/coordination.py).
+# The orchestrator module itself is only imported by the worker that wins the lease.
+from .training.coordination import Coordinator, CommandError, COMMAND_TIMEOUT_SECONDS
+from .training.ingestion import UploadIngestor, IngestionError
 orchestrator_instance = None
+coordinator = Coordinator()
+# Uploads are handed to the leader by path: with workers on several hosts this must be a
+# shared volume mounted at the same path everywhere (like the database, model/ and logs/)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+upload_ingestor = UploadIngestor(UPLOAD_DIR, tokenizer=api_tokenizer, contamination_index=test_set_index)
 
-def get_orchestrator(db: Session = Depends(get_db)):
-    global orchestrator_instance
+def deploy_command_timeout():
+    # Promotion = GGUF conversion + `ollama create`, each bounded by the conversion timeout
+    from .training.orchestrator import CONVERSION_TIMEOUT_SECONDS
+    return 2 * CONVERSION_TIMEOUT_SECONDS + 60
+
+def get_orchestrator():
+    # Only the leader has one; everything else goes through training_command()
     if orchestrator_instance is None:
-        orchestrator_instance = MLOpsOrchestrator(db)
-    # Update db session reference
-    orchestrator_instance.db = db
+        raise HTTPException(status_code=503, detail="This worker doesn't own the training lifecycle")
     return orchestrator_instance
 
+def take_training_lease():
+    # Restores the last run: re-queues waiting uploads, re-attaches to a previous leader's processes
+    from .training.orchestrator import MLOpsOrchestrator
+    global orchestrator_instance
+    orchestrator_instance = MLOpsOrchestrator()
+
+def drop_training_lease():
+    global orchestrator_instance
+    if orchestrator_instance is not None:
+        orchestrator_instance.step_down()
+    orchestrator_instance = None
+
+def leader_state():
+    orchestrator = get_orchestrator()
+    return {"training_status": orchestrator.get_status(), "training_queue": orchestrator.scheduler.snapshot()}
+
+def training_snapshot(key: str):
+    """Status/queue from the local orchestrator, or the leader's last published snapshot."""
+    if orchestrator_instance is not None:
+        return leader_state()[key]
+    snapshot = coordinator.shared(key)
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="No training leader has published its state yet",
+                            headers={"Retry-After": "1"})
+    return snapshot
+
+async def training_command(kind: str, wait: bool = True, timeout: float = COMMAND_TIMEOUT_SECONDS, **payload):
+    try:
+        return await coordinator.call(kind, payload, wait=wait, timeout=timeout)
+    except CommandError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.on_event("startup")
+async def start_coordination():
+    coordinator.start(TRAINING_COMMANDS, take_training_lease, drop_training_lease, leader_state, model_refreshed)
+
+@app.on_event("shutdown")
+async def stop_coordination():
+    await coordinator.stop()
+
 @app.post("/training/upload")
 async def upload_training_data(
     file: UploadFile = File(...), 
-    orchestrator: MLOpsOrchestrator = Depends(get_orchestrator)
+    priority: int = 0,
+    mode: str = "full"
 ):
-    import shutil
-    import os
-    
-    upload_dir = "uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, file.filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    if orchestrator.start_manual_training(file_path):
-        return {"status": "started", "file": file.filename}
-    else:
-        raise HTTPException(status_code=400, detail="Training already in progress")
+    # mode=incremental continues from the deployed adapter with replayed earlier examples
+    if mode not in ("full", "incremental"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'incremental'")
+
+    # Streamed + validated while it arrives; a bad file never reaches the GPU queue
+    try:
+        file_path, stats = await upload_ingestor.ingest(file, file.filename)
+    except IngestionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_detail())
+    print(f"DEBUG: Upload {file_path} accepted: {stats['rows']} new rows, {stats['duplicates_skipped']} duplicates skipped")
+    if semantic_index is not None:
+        # Expert labels become evidence for later analyses
+        asyncio.get_running_loop().run_in_executor(None, semantic_index.index_dataset, file_path)
+
+    # Never rejected: the run waits in the GPU queue if another job holds the slot
+    job = await training_command("start_training", file_path=file_path, priority=priority, mode=mode)
+    return {
+        "status": "started" if job["state"] == "running" else "queued",
+        "file": os.path.basename(file_path),
+        "job_id": job["job_id"],
+        "run_id": job["run_id"],
+        "position": job["position"],
+        "stats": stats
+    }
+
+async def start_training_command(payload):
+    orchestrator = get_orchestrator()
+    if not os.path.exists(payload["file_path"]):
+        # Stored by a worker on another host outside shared storage
+        raise HTTPException(status_code=409, detail=f"The training leader can't read {payload['file_path']}; "
+                                                    "UPLOAD_DIR must be shared between API hosts")
+    job = orchestrator.start_manual_training(payload["file_path"], priority=payload["priority"], mode=payload["mode"])
+    if job.state == "failed":
+        raise HTTPException(status_code=500, detail="Failed to start training")
+    return {"state": job.state, "job_id": job.id, "run_id": job.payload["run_id"],
+            "position": orchestrator.scheduler.position(job)}
+
+@app.get("/training/queue")
+async def get_training_queue():
+    return training_snapshot("training_queue")
+
+@app.delete("/training/queue/{job_id}")
+async def cancel_queued_job(job_id: int):
+    return await training_command("cancel_queued_job", job_id=job_id)
+
+async def cancel_queued_job_command(payload):
+    if not get_orchestrator().cancel_queued_job(payload["job_id"]):
+        raise HTTPException(status_code=404, detail="Job is not queued")
+    return {"status": "cancelled"}
 
 @app.get("/training/status")
-async def get_training_status(orchestrator: MLOpsOrchestrator = Depends(get_orchestrator)):
-    return orchestrator.get_status()
+async def get_training_status():
+    return training_snapshot("training_status")
+
+@app.get("/training/leader")
+async def get_training_leader():
+    """Which worker this is and whether it holds the training lease."""
+    return coordinator.status()
+
+def run_telemetry_path(run_id: int):
+    db = database.SessionLocal()
+    try:
+        return db.query(database.TrainingRun.id, database.TrainingRun.telemetry_path) \
+            .filter(database.TrainingRun.id == run_id).first()
+    finally:
+        db.close()
+
+@app.get("/training/runs/{run_id}/telemetry")
+async def training_telemetry(run_id: int, max_points: int = 1000, format: str = "json"):
+    """
+    Per-step series of a run for plotting: step time, dataloader wait, tokens/s, samples/s,
+    loss, LR and peak allocated/reserved GPU memory. Readable while the run is training.
+    format=csv downloads the raw file.
+    """
+    from .training.telemetry import load_telemetry
+
+    row = await run_in_threadpool(run_telemetry_path, run_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    path = row[1]
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No telemetry for this run yet")
+    if format == "csv":
+        return FileResponse(path, media_type="text/csv", filename=f"training_{run_id}_telemetry.csv")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'csv'")
+    telemetry = await run_in_threadpool(load_telemetry, path, max(2, max_points))
+    return {"run_id": run_id, **telemetry}
+
+@app.get("/training/events")
+async def training_events(request: Request):
+    """
+    Server-Sent Events stream of status snapshots. Pushed on every state/progress change,
+    so the frontend no longer polls /training/status.
+    """
+    import json
+
+    # Followers stream the leader's snapshots as they mirror them
+    bus = orchestrator_instance.progress_bus if orchestrator_instance is not None else coordinator.bus
+
+    async def event_stream():
+        async for snapshot in bus.stream():
+            if await request.is_disconnected():
+                break
+            if snapshot is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/training/promote")
-async def promote_model(orchestrator: MLOpsOrchestrator = Depends(get_orchestrator)):
-    if orchestrator.status != "ready_to_promote":
+async def promote_model(run_id: int = None):
+    # Default: the newest evaluated run; the active one may already be the next upload
+    return await training_command("promote", timeout=deploy_command_timeout(), run_id=run_id)
+
+async def promote_command(payload):
+    from .training.orchestrator import DeploymentConflict
+    orchestrator = get_orchestrator()
+    run = orchestrator.promotable_run(payload.get("run_id"))
+    if run is None:
         raise HTTPException(status_code=400, detail="Not ready to promote")
-    
-    await orchestrator.deploy_new_adapter(orchestrator.latest_adapter_path)
+
+    try:
+        deployed = await orchestrator.deploy_new_adapter(run.adapter_path, run.id)
+    except DeploymentConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if deployed:
+        rollout = await model_changed()
+        if rollout is not None:
+            return {"status": "promoted", "run_id": run.id, "rollout": rollout}
     # orchestrator.status = "idle"  <-- Removed to persist success state for UI
-    return {"status": "promoted"}
+    return {"status": "promoted", "run_id": run.id}
+
+def clear_answer_caches():
+    # Cached answers came from the previous adapter
+    analysis_cache.clear()
+    if semantic_index is not None:
+        semantic_index.analyses.clear()
+
+async def model_changed():
+    clear_answer_caches()
+    # New digest for Ollama; the llama.cpp backend loads the new adapter, the router rolls it out
+    rollout = await inference_backend.reload()
+    # The other workers reload when they see the new generation
+    await coordinator.bump_generation()
+    return rollout
+
+async def model_refreshed():
+    # Another worker deployed; the rollout itself already happened there
+    clear_answer_caches()
+    await inference_backend.refresh()
+
+@app.get("/quantization/report")
+async def quantization_report():
+    """Latest quantization sweep: F1/EM, tokens/s, latency and memory per base x adapter precision."""
+    import json
+    from .training.quant_sweep import latest_report
+    path = latest_report(os.path.join(get_project_root(), "model", "benchmark-reports"))
+    if path is None:
+        raise HTTPException(status_code=404, detail="No quantization sweep report yet")
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+@app.post("/quantization/deploy")
+async def deploy_quantization(latency_budget_ms: float = None):
+    """Serves the most accurate base/adapter precision from the latest sweep that fits the latency budget."""
+    return await training_command("deploy_quantization", timeout=deploy_command_timeout(),
+                                  latency_budget_ms=latency_budget_ms)
+
+async def deploy_quantization_command(payload):
+    from .training.orchestrator import DeploymentConflict
+    try:
+        deployed = await get_orchestrator().deploy_quantization(payload["latency_budget_ms"])
+    except DeploymentConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    rollout = await model_changed()
+    if rollout is not None:
+        deployed["rollout"] = rollout
+    return {"status": "deployed", **deployed}
+
+@app.post("/training/cancel")
+async def cancel_training(run_id: int = None):
+    # Kills the trainer/benchmark process tree of the run (default: the active one)
+    return await training_command("cancel_run", run_id=run_id)
+
+async def cancel_run_command(payload):
+    if not get_orchestrator().cancel_run(payload["run_id"]):
+        raise HTTPException(status_code=400, detail="Nothing to cancel")
+    return {"status": "cancelling"}
 
 @app.post("/training/progress")
-async def report_progress(
-    progress_data: dict, 
-    orchestrator: MLOpsOrchestrator = Depends(get_orchestrator)
-):
-    # { "stage": "training"|"evaluation", "value": 50 }
-    orchestrator.update_progress(progress_data['stage'], progress_data['value'])
+async def report_progress(progress_data: dict):
+    # { "stage": "training"|"evaluation", "value": 50, "run_id": 3 }
+    # Fire-and-forget on followers: the trainer only needs the update delivered, in order
+    await training_command("progress", wait=False, stage=progress_data['stage'], value=progress_data['value'],
+                           run_id=progress_data.get('run_id'))
+    return {"status": "ok"}
+
+async def progress_command(payload):
+    get_orchestrator().update_progress(payload["stage"], payload["value"], payload["run_id"])
     return {"status": "ok"}
 
 @app.post("/training/complete")
 async def training_complete(
     adapter_path: str, 
-    orchestrator: MLOpsOrchestrator = Depends(get_orchestrator)
+    run_id: int = None
 ):
-    orchestrator.finish_training_and_evaluate(adapter_path)
+    return await training_command("complete", adapter_path=adapter_path, run_id=run_id)
+
+async def complete_command(payload):
+    get_orchestrator().finish_training_and_evaluate(payload["adapter_path"], payload["run_id"])
     return {"status": "evaluation_started"}
 
+# Executed by the leader, for its own requests and for the ones other workers queued
+TRAINING_COMMANDS = {
+    "start_training": start_training_command,
+    "cancel_queued_job": cancel_queued_job_command,
+    "promote": promote_command,
+    "deploy_quantization": deploy_quantization_command,
+    "cancel_run": cancel_run_command,
+    "progress": progress_command,
+    "complete": complete_command,
+}
+
+@app.get("/curation/queue")
+async def get_curation_queue(limit: int = 50, format: str = "json", mark_exported: bool = False):
+    """
+    Logged /analyze inputs ranked by model uncertainty, i.e. the ones most worth an expert's time.
+    format=jsonl downloads them as a file /training/upload accepts (pre-labelled with the model's answer).
+    """
+    import json
+
+    records = await run_in_threadpool(curation_log.queue, limit)
+    if mark_exported and records:
+        await run_in_threadpool(curation_log.mark_exported, [r.id for r in records])
+
+    if format == "jsonl":
+        body = "".join(json.dumps(to_upload_row(r), ensure_ascii=False) + "\n" for r in records)
+        return StreamingResponse(
+            iter([body]),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": "attachment; filename=curation_queue.jsonl"}
+        )
+    return [queue_entry(r) for r in records]
+
+@app.get("/inference/status")
+async def inference_status():
+    """Serving backend; for the router: per-upstream health, load, latency and model digest."""
+    status = inference_backend.status()
+    if admission is not None:
+        status["admission"] = admission.stats()
+    return status
+
+def analysis_filters(technique: str = None, model_version: str = None, source: str = None,
+                     since: datetime = None, until: datetime = None):
+    return {"technique": technique, "model_version": model_version, "source": source, "since": since, "until": until}
+
+@app.get("/analyses")
+async def get_analyses(limit: int = 50, cursor: int = None, include_text: bool = False,
+                       filters: dict = Depends(analysis_filters)):
+    """Analysis history, newest first; pass next_cursor back as cursor for the next page."""
+    limit = max(1, min(limit, 500))
+    return await run_in_threadpool(list_analyses, database.SessionLocal, limit, cursor, include_text, **filters)
+
+@app.get("/analyses/trends")
+async def get_analysis_trends(bucket: str = "day", filters: dict = Depends(analysis_filters)):
+    """Analyses and per-technique counts per hour/day/week/month."""
+    if bucket not in TREND_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {sorted(TREND_BUCKETS)}")
+    result = await run_in_threadpool(technique_trends, database.SessionLocal, bucket, **filters)
+    result["writer"] = analysis_writer.stats()
+    return result
+
+@app.get("/analyses/export")
+async def export_analyses(format: str = "csv", include_text: bool = False, filters: dict = Depends(analysis_filters)):
+    """Streams the (filtered) history chunk by chunk, so memory stays flat for millions of rows."""
+    chunks = iter_export_chunks(database.SessionLocal, include_text=include_text, **filters)
+    if format == "csv":
+        return StreamingResponse(
+            csv_stream(chunks, include_text),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=analyses.csv"}
+        )
+    if format == "parquet":
+        if not parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow")
+        return StreamingResponse(
+            parquet_stream(chunks, include_text),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": "attachment; filename=analyses.parquet"}
+        )
+    raise HTTPException(status_code=400, detail="format must be 'csv' or 'parquet'")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Several workers serve /analyze in parallel; one of them wins the training lease
+    workers = int(os.getenv("API_WORKERS", "1"))
+    uvicorn.run("app.main:app" if workers > 1 else app, host="0.0.0.0", port=8000, workers=workers)
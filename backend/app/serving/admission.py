@@ -0,0 +1,235 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+
+# "gradient" (latency-gradient, like Netflix's Gradient2) or "aimd"
+ADMISSION_ALGORITHM = os.getenv("ADMISSION_ALGORITHM", "gradient")
+ADMISSION_INITIAL_LIMIT = float(os.getenv("ADMISSION_INITIAL_LIMIT", "4"))
+ADMISSION_MIN_LIMIT = float(os.getenv("ADMISSION_MIN_LIMIT", "1"))
+ADMISSION_MAX_LIMIT = float(os.getenv("ADMISSION_MAX_LIMIT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+# Budget of a request that doesn't send its own deadline
+ADMISSION_DEFAULT_DEADLINE_MS = float(os.getenv("ADMISSION_DEFAULT_DEADLINE_MS", "60000"))
+# AIMD: above this latency the limit backs off
+ADMISSION_LATENCY_TARGET_MS = float(os.getenv("ADMISSION_LATENCY_TARGET_MS", "10000"))
+# Gradient: latency may grow this much over the no-load baseline before the limit shrinks
+GRADIENT_TOLERANCE = float(os.getenv("GRADIENT_TOLERANCE", "1.5"))
+GRADIENT_SMOOTHING = 0.2
+AIMD_BACKOFF = 0.9
+FAILURE_BACKOFF = 0.75
+RETRY_AFTER_MAX_SECONDS = 30
+
+
+class Overloaded(Exception):
+    """Request shed: cannot be served before its deadline (HTTP 503 + Retry-After)."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _granted(future):
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+class GradientLimit:
+    """
+    Limit follows the ratio of the long-term (baseline) to the short-term latency: while
+    requests are as fast as usual it grows by sqrt(limit) per sample, once they slow down
+    because the server queues internally it shrinks towards the concurrency it can take.
+    """
+
+    def __init__(self, initial, min_limit, max_limit, tolerance=GRADIENT_TOLERANCE):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.short_rtt = None
+        self.long_rtt = None
+
+    def update(self, rtt: float, ok: bool, inflight: int):
+        if not ok:
+            self.limit = max(self.min_limit, self.limit * FAILURE_BACKOFF)
+            return
+        self.short_rtt = rtt if self.short_rtt is None else 0.5 * rtt + 0.5 * self.short_rtt
+        self.long_rtt = rtt if self.long_rtt is None else 0.02 * rtt + 0.98 * self.long_rtt
+        # The baseline drifts down quickly, so a one-off slow period doesn't become the new normal
+        if self.long_rtt > self.short_rtt:
+            self.long_rtt = 0.9 * self.long_rtt + 0.1 * self.short_rtt
+        # Don't grow while the limit isn't what holds traffic back
+        if inflight < self.limit / 2:
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = self.limit * (1 - GRADIENT_SMOOTHING) + new_limit * GRADIENT_SMOOTHING
+        self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+
+
+class AimdLimit:
+    """+1 per limit's worth of fast answers, x0.9 (at most once per latency target) when slow or failing."""
+
+    def __init__(self, initial, min_limit, max_limit, target_seconds=ADMISSION_LATENCY_TARGET_MS / 1000):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target = target_seconds
+        self._last_decrease = 0.0
+
+    def update(self, rtt: float, ok: bool, inflight: int):
+        now = time.monotonic()
+        if not ok or rtt > self.target:
+            if now - self._last_decrease > min(self.target, rtt):
+                self.limit = max(self.min_limit, self.limit * (FAILURE_BACKOFF if not ok else AIMD_BACKOFF))
+                self._last_decrease = now
+        elif inflight >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class AdmissionController:
+    """
+    Concurrency limit in front of inference with an earliest-deadline-first queue.
+
+    A request is shed with Overloaded right away when the queue is full or the expected
+    wait plus service time already overshoots its deadline, and later if it is still
+    queued when there is no longer time to serve it. Admitted requests get the rest of
+    their deadline as timeout; their latency (and timeouts/errors) steer the limit.
+    """
+
+    def __init__(self, algorithm: str = ADMISSION_ALGORITHM, initial_limit: float = ADMISSION_INITIAL_LIMIT,
+                 min_limit: float = ADMISSION_MIN_LIMIT, max_limit: float = ADMISSION_MAX_LIMIT,
+                 max_queue: int = ADMISSION_MAX_QUEUE):
+        if algorithm == "gradient":
+            self.limiter = GradientLimit(initial_limit, min_limit, max_limit)
+        elif algorithm == "aimd":
+            self.limiter = AimdLimit(initial_limit, min_limit, max_limit)
+        else:
+            raise ValueError(f"Unknown admission algorithm '{algorithm}' (gradient, aimd)")
+        self.algorithm = algorithm
+        self.max_queue = max_queue
+        self.inflight = 0
+        self.service_ewma = None  # seconds per admitted request
+        self._queue = []  # heap of (deadline, seq, future)
+        self._seq = itertools.count()
+        self.counters = {"admitted": 0, "completed": 0, "shed_on_arrival": 0, "shed_in_queue": 0,
+                         "timeouts": 0, "errors": 0}
+
+    @property
+    def limit(self):
+        return self.limiter.limit
+
+    def _capacity(self):
+        return max(1, int(self.limiter.limit))
+
+    def _expected_service(self):
+        return self.service_ewma or 0.0
+
+    def _retry_after(self):
+        drain = (len(self._queue) + 1) / self._capacity() * self._expected_service()
+        return max(1, min(RETRY_AFTER_MAX_SECONDS, math.ceil(drain)))
+
+    def _shed(self, counter, reason):
+        self.counters[counter] += 1
+        return Overloaded(reason, self._retry_after())
+
+    async def acquire(self, deadline: float):
+        """Waits for a slot; `deadline` is a time.monotonic() value. Raises Overloaded."""
+        now = time.monotonic()
+        service = self._expected_service()
+        if self.inflight < self._capacity() and not self._queue:
+            if now + service > deadline:
+                raise self._shed("shed_on_arrival", "deadline shorter than the expected inference time")
+            self.inflight += 1
+            self.counters["admitted"] += 1
+            return
+
+        if len(self._queue) >= self.max_queue:
+            raise self._shed("shed_on_arrival", "admission queue full")
+        ahead = sum(1 for d, _, _ in self._queue if d <= deadline)
+        expected_wait = (ahead + 1) / self._capacity() * service
+        if now + expected_wait + service > deadline:
+            raise self._shed("shed_on_arrival", "cannot be served before its deadline")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (deadline, next(self._seq), future)
+        heapq.heappush(self._queue, entry)
+        try:
+            # Give up (while still queued) once the remaining time no longer covers the service time
+            await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - service - now))
+        except asyncio.TimeoutError:
+            if _granted(future):
+                return  # got the slot at the last moment
+            future.cancel()
+            self._remove(entry)
+            raise self._shed("shed_in_queue", "deadline passed while queued")
+        except asyncio.CancelledError:
+            # Client went away: hand a slot we may already hold back
+            if _granted(future):
+                self.release(0.0, ok=True, record=False)
+            else:
+                future.cancel()
+                self._remove(entry)
+            raise
+
+    def _remove(self, entry):
+        try:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+        except ValueError:
+            pass
+
+    def release(self, rtt: float, ok: bool = True, timed_out: bool = False, record: bool = True):
+        self.inflight -= 1
+        if record:
+            self.counters["completed" if ok else ("timeouts" if timed_out else "errors")] += 1
+            if ok:
+                self.service_ewma = rtt if self.service_ewma is None else 0.2 * rtt + 0.8 * self.service_ewma
+            self.limiter.update(rtt, ok, self.inflight + 1)
+        self._wake()
+
+    def _wake(self):
+        now = time.monotonic()
+        while self._queue and self.inflight < self._capacity():
+            deadline, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            if deadline - now < self._expected_service():
+                # Would miss it anyway; leave the slot to someone who can make it
+                future.set_exception(self._shed("shed_in_queue", "deadline too close when a slot freed up"))
+                continue
+            self.inflight += 1
+            self.counters["admitted"] += 1
+            future.set_result(True)
+
+    async def run(self, call, deadline: float = None):
+        """Runs `await call(timeout)` under admission; timeout is what is left of the deadline."""
+        deadline = deadline or time.monotonic() + ADMISSION_DEFAULT_DEADLINE_MS / 1000
+        await self.acquire(deadline)
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(call(), max(0.001, deadline - started))
+        except asyncio.TimeoutError:
+            self.release(time.monotonic() - started, ok=False, timed_out=True)
+            raise
+        except Exception:
+            self.release(time.monotonic() - started, ok=False)
+            raise
+        except asyncio.CancelledError:
+            # Client went away mid-inference; says nothing about the model's latency
+            self.release(0.0, ok=True, record=False)
+            raise
+        self.release(time.monotonic() - started, ok=True)
+        return result
+
+    def stats(self) -> dict:
+        return dict(
+            self.counters,
+            algorithm=self.algorithm,
+            limit=round(self.limiter.limit, 2),
+            inflight=self.inflight,
+            queued=len(self._queue),
+            service_ewma_ms=round(self.service_ewma * 1000, 1) if self.service_ewma is not None else None,
+        )
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+from .admission import AdmissionController, Overloaded
+
+
+class SaturatingServer:
+    """
+    Processor-sharing model of a GPU box: up to `capacity` requests run at full speed,
+    beyond that every running request slows down proportionally (like Ollama with more
+    parallel requests than it has slots, or a queue inside the server).
+    """
+
+    def __init__(self, capacity: int, service_ms: float, tick_ms: float = 2.0):
+        self.capacity = capacity
+        self.service = service_ms / 1000
+        self.tick = tick_ms / 1000
+        self._active = {}  # future -> remaining work (seconds at full speed)
+        self._ticker = None
+
+    async def call(self):
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._active[future] = self.service * random.uniform(0.8, 1.2)
+        try:
+            await future
+        finally:
+            self._active.pop(future, None)
+
+    async def _run(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            if not self._active:
+                continue
+            speed = min(1.0, self.capacity / len(self._active))
+            for future in list(self._active):
+                self._active[future] -= elapsed * speed
+                if self._active[future] <= 0 and not future.done():
+                    future.set_result(None)
+                    self._active.pop(future, None)
+
+    def stop(self):
+        if self._ticker:
+            self._ticker.cancel()
+
+
+async def drive(rps, seconds, deadline_ms, capacity, service_ms, algorithm=None, seed=0):
+    """Open-loop Poisson arrivals; `algorithm=None` sends everything straight to the server."""
+    random.seed(seed)
+    server = SaturatingServer(capacity, service_ms)
+    controller = AdmissionController(algorithm=algorithm) if algorithm else None
+    outcomes = []
+    limits = []
+
+    async def one():
+        started = time.monotonic()
+        deadline = started + deadline_ms / 1000
+        try:
+            if controller:
+                await controller.run(server.call, deadline)
+            else:
+                await asyncio.wait_for(server.call(), deadline_ms / 1000)
+            outcomes.append(("ok", time.monotonic() - started))
+        except Overloaded:
+            outcomes.append(("shed", time.monotonic() - started))
+        except asyncio.TimeoutError:
+            outcomes.append(("timeout", time.monotonic() - started))
+
+    tasks = []
+    began = time.monotonic()
+    end = began + seconds
+    while time.monotonic() < end:
+        tasks.append(asyncio.create_task(one()))
+        if controller:
+            limits.append(controller.limit)
+        await asyncio.sleep(random.expovariate(rps))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - began
+    server.stop()
+
+    ok = [t for kind, t in outcomes if kind == "ok"]
+    shed = [t for kind, t in outcomes if kind == "shed"]
+    return {
+        "admission": algorithm or "none",
+        "offered_rps": rps,
+        "requests": len(outcomes),
+        "goodput_rps": round(len(ok) / elapsed, 2),
+        "ok": len(ok),
+        "shed_503": len(shed),
+        "timeouts": sum(1 for kind, _ in outcomes if kind == "timeout"),
+        "ok_p50_ms": round(float(np.percentile(ok, 50)) * 1000, 1) if ok else None,
+        "ok_p99_ms": round(float(np.percentile(ok, 99)) * 1000, 1) if ok else None,
+        "shed_p50_ms": round(float(np.percentile(shed, 50)) * 1000, 1) if shed else None,
+        "mean_limit": round(float(np.mean(limits)), 2) if limits else None,
+        "controller": controller.stats() if controller else None,
+    }
+
+
+def run(load_factors=(0.5, 1.0, 2.0, 4.0), seconds=10.0, deadline_ms=2000.0, capacity=4, service_ms=200.0,
+        algorithms=(None, "gradient", "aimd")):
+    """
+    Goodput (answers within the deadline per second) and latency at multiples of the
+    server's capacity (capacity / service time), with and without admission control.
+    """
+    capacity_rps = capacity / (service_ms / 1000)
+    results = []
+    for factor in load_factors:
+        for algorithm in algorithms:
+            results.append(asyncio.run(drive(capacity_rps * factor, seconds, deadline_ms, capacity,
+                                             service_ms, algorithm)))
+            results[-1]["load_factor"] = factor
+    return {"capacity_rps": capacity_rps, "deadline_ms": deadline_ms, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Goodput and tail latency under overload, with and without admission control")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--deadline_ms", type=float, default=2000.0)
+    parser.add_argument("--capacity", type=int, default=4, help="Requests the simulated server runs at full speed")
+    parser.add_argument("--service_ms", type=float, default=200.0)
+    parser.add_argument("--load_factors", type=str, default="0.5,1,2,4")
+    parser.add_argument("--output", type=str, default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = run(tuple(float(f) for f in args.load_factors.split(",")), args.seconds, args.deadline_ms,
+                 args.capacity, args.service_ms)
+    for r in report["results"]:
+        print(f"load x{r['load_factor']:<4} {r['admission']:<9} goodput {r['goodput_rps']:>6} rps  "
+              f"ok {r['ok']:>5}  503 {r['shed_503']:>5}  timeouts {r['timeouts']:>5}  "
+              f"p50 {r['ok_p50_ms']} ms  p99 {r['ok_p99_ms']} ms  limit {r['mean_limit']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,425 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+
+import httpx
+
+from ..training.core import get_project_root
+
+# "ollama" (default), "llamacpp" (in-process, CPU), "llamaserver" (llama.cpp's HTTP server) or "fake"
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "ollama")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/chat")
+MODEL_NAME = os.getenv("MODEL_NAME", "bielik-lora-mipd:latest")
+OLLAMA_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_TIMEOUT_SECONDS", "60"))
+# The llama.cpp backend serves exactly what `ollama create` would: same GGUFs, prompt and parameters
+MODELFILE_PATH = os.getenv("MODELFILE_PATH", os.path.join(get_project_root(), "model", "Modelfile"))
+LLAMA_THREADS = int(os.getenv("LLAMA_THREADS", str(os.cpu_count() or 4)))
+LLAMA_CTX = int(os.getenv("LLAMA_CTX", "4096"))
+LLAMA_BATCH = int(os.getenv("LLAMA_BATCH", "512"))  # prompt tokens evaluated per forward pass
+# Model copies decoding in parallel; threads are split between them
+LLAMA_PARALLEL = int(os.getenv("LLAMA_PARALLEL", "1"))
+# llama-cpp-python only returns logprobs from a model that keeps the logits of every position
+# (n_ctx x vocab floats per copy), so the llamacpp backend answers without them unless this is set
+LLAMA_LOGITS_ALL = os.getenv("LLAMA_LOGITS_ALL", "0") == "1"
+FAKE_LATENCY_MS = float(os.getenv("FAKE_LATENCY_MS", "0"))
+# llama-server started with `--parallel N` (continuous batching): N requests are decoded in one batch
+LLAMA_SERVER_URL = os.getenv("LLAMA_SERVER_URL", "http://localhost:8080")
+
+FAKE_TECHNIQUES = ("EMOTIONAL_CONTENT", "EXAGGERATION", "ANECDOTE", "FALSE_CAUSE", "CHERRY_PICKING")
+
+
+def parse_modelfile(path: str) -> dict:
+    """FROM / ADAPTER paths (resolved against the Modelfile's folder), PARAMETERs, TEMPLATE and SYSTEM prompt."""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    def resolve(value):
+        return value if os.path.isabs(value) or re.match(r"^[a-zA-Z]:[/\\]", value) else os.path.normpath(os.path.join(base_dir, value))
+
+    spec = {"from": None, "adapter": None, "parameters": {}, "stop": [], "system": "", "template": None}
+    system = re.search(r'^SYSTEM\s+"""(.*?)"""', content, re.DOTALL | re.MULTILINE)
+    if system:
+        spec["system"] = system.group(1).strip()
+    template = re.search(r'^TEMPLATE\s+"""(.*?)"""', content, re.DOTALL | re.MULTILINE)
+    if template:
+        spec["template"] = template.group(1)
+    # Block bodies (prompt text) must not be read as keywords below
+    content = re.sub(r'"""(.*?)"""', '""', content, flags=re.DOTALL)
+    for line in content.splitlines():
+        parts = line.strip().split(None, 1)
+        if len(parts) != 2:
+            continue
+        keyword, value = parts[0].upper(), parts[1].strip()
+        if keyword == "FROM":
+            spec["from"] = resolve(value)
+        elif keyword == "ADAPTER":
+            spec["adapter"] = resolve(value)
+        elif keyword == "PARAMETER":
+            name, _, raw = value.partition(" ")
+            raw = raw.strip().strip('"')
+            if name == "stop":
+                spec["stop"].append(raw)
+            else:
+                try:
+                    spec["parameters"][name] = float(raw) if "." in raw else int(raw)
+                except ValueError:
+                    spec["parameters"][name] = raw
+    return spec
+
+
+def chat_response(model: str, content: str, logprobs=None, **extra) -> dict:
+    """Answer in Ollama's /api/chat shape, which /analyze and the curation log already read."""
+    response = {"model": model, "message": {"role": "assistant", "content": content}, "done": True}
+    if logprobs is not None:
+        response["logprobs"] = logprobs
+    response.update(extra)
+    return response
+
+
+def completion_logprobs(result: dict):
+    """Per-token log-probs of a llama-server /completion result (n_probs > 0), old or new format."""
+    probs = result.get("completion_probabilities")
+    if not probs:
+        return None
+    token_logprobs = []
+    for p in probs:
+        if "logprob" in p:
+            token_logprobs.append({"token": p.get("token"), "logprob": p["logprob"]})
+        else:
+            # Older builds: probabilities of the top candidates next to the sampled token
+            prob = next((c.get("prob") for c in p.get("probs") or [] if c.get("tok_str") == p.get("content")), None)
+            token_logprobs.append({"token": p.get("content"), "logprob": math.log(prob) if prob else None})
+    return token_logprobs
+
+
+def chat_logprobs(choice: dict):
+    """Per-token log-probs of an OpenAI-style chat completion choice (None if it has none)."""
+    if not choice.get("logprobs"):
+        return None
+    return [{"token": t.get("token"), "logprob": t.get("logprob")} for t in choice["logprobs"].get("content") or []]
+
+
+class InferenceBackend:
+    """
+    What /analyze and the curation probes need from a model server. chat() returns an
+    Ollama-style response dict whatever the backend is.
+    """
+    name = "base"
+
+    async def chat(self, text: str, model: str = None, options: dict = None, logprobs: bool = False) -> dict:
+        raise NotImplementedError
+
+    async def chat_batch(self, texts, model: str = None, options: dict = None, logprobs: bool = False) -> list:
+        """
+        One answer (or the exception it raised) per text, in order. The default just runs the
+        single chat() calls concurrently, which is no better than not batching; only backends
+        that override this with a real batched call (llamaserver) are micro-batched, see with_batching().
+        """
+        return await asyncio.gather(*(self.chat(t, model=model, options=options, logprobs=logprobs) for t in texts),
+                                    return_exceptions=True)
+
+    async def model_version(self) -> str:
+        return MODEL_NAME
+
+    async def start(self):
+        """Called once the event loop runs (background tasks such as health checks)."""
+
+    async def reload(self):
+        """Called after a promote, once the Modelfile points at the new adapter."""
+
+    async def refresh(self):
+        """Another API worker deployed a new model (see training/coordination.py); pick it up."""
+        await self.reload()
+
+    async def close(self):
+        pass
+
+    def status(self) -> dict:
+        return {"backend": self.name}
+
+
+class OllamaBackend(InferenceBackend):
+    name = "ollama"
+
+    def __init__(self, url: str = OLLAMA_URL, model: str = MODEL_NAME, timeout: float = OLLAMA_TIMEOUT_SECONDS):
+        self.url = url
+        self.model = model
+        self.timeout = timeout
+        self._version = None
+
+    async def chat(self, text, model=None, options=None, logprobs=False):
+        payload = {
+            "model": model or self.model,
+            "messages": [{"role": "user", "content": text}],
+            "stream": False,
+            "format": "json",
+            # Token log-probs feed the curation queue (ignored by Ollama versions without support)
+            "logprobs": logprobs,
+        }
+        if options:
+            payload["options"] = options
+        async with httpx.AsyncClient() as client:
+            response = await client.post(self.url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+    async def model_version(self):
+        if self._version is None:
+            # Falls back to the tag (not retried on every call) if Ollama doesn't know the digest
+            self._version = self.model
+            try:
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(self.url.rsplit("/api/", 1)[0] + "/api/tags", timeout=5.0)
+                    response.raise_for_status()
+                    for entry in response.json().get("models", []):
+                        if entry.get("name") == self.model:
+                            self._version = f"{self.model}@{entry.get('digest', '')[:12]}"
+            except Exception as e:
+                print(f"ERROR: Could not resolve model digest: {e}")
+        return self._version
+
+    async def reload(self):
+        # `ollama create` already swapped the model; only the digest changed
+        self._version = None
+
+
+class LlamaCppBackend(InferenceBackend):
+    """
+    In-process llama.cpp (llama-cpp-python) on CPU: base GGUF + LoRA GGUF from the Modelfile,
+    ChatML prompt with the Modelfile's SYSTEM text, JSON-constrained output.
+
+    A Llama object decodes one sequence at a time, so LLAMA_PARALLEL copies are loaded and
+    requests take whichever is free (each copy gets LLAMA_THREADS / LLAMA_PARALLEL threads);
+    within a request the prompt is evaluated LLAMA_BATCH tokens per pass.
+    Token logprobs need LLAMA_LOGITS_ALL=1; without it they are left out of the answer.
+    Needs `pip install llama-cpp-python` (optional, not in requirements.txt).
+    """
+    name = "llamacpp"
+
+    def __init__(self, modelfile_path: str = MODELFILE_PATH, model: str = MODEL_NAME, threads: int = LLAMA_THREADS,
+                 n_ctx: int = LLAMA_CTX, n_batch: int = LLAMA_BATCH, parallel: int = LLAMA_PARALLEL,
+                 logits_all: bool = LLAMA_LOGITS_ALL):
+        self.modelfile_path = modelfile_path
+        self.model = model
+        self.threads = threads
+        self.n_ctx = n_ctx
+        self.n_batch = n_batch
+        self.parallel = max(1, parallel)
+        self.logits_all = logits_all
+        self._logprobs_warned = False
+        self.spec = None
+        self._pool = None
+        self._version = None
+        self._load()
+
+    def _load(self):
+        from llama_cpp import Llama
+
+        spec = parse_modelfile(self.modelfile_path)
+        threads_each = max(1, self.threads // self.parallel)
+        instances = [
+            Llama(
+                model_path=spec["from"],
+                lora_path=spec["adapter"],
+                n_ctx=self.n_ctx,
+                n_batch=self.n_batch,
+                n_threads=threads_each,
+                n_threads_batch=threads_each,
+                chat_format="chatml",
+                logits_all=self.logits_all,
+                verbose=False,
+            )
+            for _ in range(self.parallel)
+        ]
+        pool = asyncio.Queue()
+        for instance in instances:
+            pool.put_nowait(instance)
+        self.spec, self._pool = spec, pool
+        self._version = f"{self.model}@{self._fingerprint(spec)}"
+        print(f"DEBUG: llama.cpp backend loaded {spec['from']} + {spec['adapter']} ({self.parallel}x{threads_each} threads)")
+
+    @staticmethod
+    def _fingerprint(spec):
+        digest = hashlib.sha256()
+        for path in (spec["from"], spec["adapter"]):
+            if path and os.path.exists(path):
+                stat = os.stat(path)
+                digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return digest.hexdigest()[:12]
+
+    async def chat(self, text, model=None, options=None, logprobs=False):
+        if model and model != self.model:
+            raise ValueError(f"llama.cpp backend only serves {self.model}")
+        params = dict(self.spec["parameters"])
+        params.update(options or {})
+        if logprobs and not self.logits_all:
+            if not self._logprobs_warned:
+                print("WARNING: llama.cpp backend loaded without LLAMA_LOGITS_ALL=1, answering without logprobs")
+                self._logprobs_warned = True
+            logprobs = False
+        pool = self._pool
+        llama = await pool.get()
+        try:
+            completion = await asyncio.to_thread(
+                llama.create_chat_completion,
+                messages=[{"role": "system", "content": self.spec["system"]}, {"role": "user", "content": text}],
+                temperature=params.get("temperature", 0.1),
+                stop=self.spec["stop"] or None,
+                response_format={"type": "json_object"},
+                # llama-cpp-python only returns logprobs when top_logprobs is set too
+                logprobs=logprobs,
+                top_logprobs=1 if logprobs else None,
+            )
+        finally:
+            pool.put_nowait(llama)
+        choice = completion["choices"][0]
+        usage = completion.get("usage", {})
+        return chat_response(self.model, choice["message"]["content"], chat_logprobs(choice) if logprobs else None,
+                             prompt_eval_count=usage.get("prompt_tokens"), eval_count=usage.get("completion_tokens"))
+
+    async def model_version(self):
+        return self._version
+
+    async def reload(self):
+        # Loads the new adapter next to the old copies, then swaps; in-flight requests finish on the old ones
+        await asyncio.to_thread(self._load)
+
+
+class LlamaServerBackend(InferenceBackend):
+    """
+    llama.cpp's llama-server with the Modelfile's GGUFs loaded, e.g.
+    `llama-server -m base.gguf --lora adapter.gguf --parallel 8 -c 16384`. Single calls go to
+    the OpenAI-compatible chat endpoint; a micro-batch is one /completion request with a
+    prompt array, which the server spreads over its parallel slots and decodes together.
+    Builds without multi-prompt support fall back to concurrent single calls.
+    """
+    name = "llamaserver"
+
+    def __init__(self, base_url: str = LLAMA_SERVER_URL, model: str = MODEL_NAME,
+                 modelfile_path: str = MODELFILE_PATH, timeout: float = OLLAMA_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        # System prompt and sampling parameters come from the same Modelfile Ollama would use
+        self.spec = parse_modelfile(modelfile_path) if os.path.exists(modelfile_path) else {"system": "", "parameters": {}, "stop": []}
+        self._client = None
+        self._batch_supported = True
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        return self._client
+
+    def _prompt(self, text):
+        # ChatML, same as the chat endpoint / LlamaCppBackend render it for Bielik
+        return (f"<|im_start|>system\n{self.spec['system']}<|im_end|>\n"
+                f"<|im_start|>user\n{text}<|im_end|>\n<|im_start|>assistant\n")
+
+    async def chat_batch(self, texts, model=None, options=None, logprobs=False):
+        if len(texts) == 1 or not self._batch_supported:
+            return await super().chat_batch(texts, model=model, options=options, logprobs=logprobs)
+        params = dict(self.spec["parameters"])
+        params.update(options or {})
+        payload = {
+            "prompt": [self._prompt(t) for t in texts],
+            "temperature": params.get("temperature", 0.1),
+            "stop": list(self.spec["stop"]) + ["<|im_end|>"],
+            "json_schema": {"type": "object"},
+            "n_probs": 1 if logprobs else 0,
+        }
+        try:
+            response = await self._get_client().post("/completion", json=payload)
+            response.raise_for_status()
+            results = response.json()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in (400, 404, 422):
+                return [e] * len(texts)
+            results = None
+        except Exception as e:
+            return [e] * len(texts)
+        if isinstance(results, dict):
+            results = [results]
+        if not isinstance(results, list) or len(results) != len(texts):
+            print("ERROR: llama-server did not answer a prompt array, batching falls back to single calls")
+            self._batch_supported = False
+            return await super().chat_batch(texts, model=model, options=options, logprobs=logprobs)
+        # Newer builds tag each result with its prompt's index
+        if all("index" in r for r in results):
+            results = sorted(results, key=lambda r: r["index"])
+        return [chat_response(self.model, r.get("content", ""), completion_logprobs(r) if logprobs else None,
+                              prompt_eval_count=r.get("tokens_evaluated"), eval_count=r.get("tokens_predicted"))
+                for r in results]
+
+    async def chat(self, text, model=None, options=None, logprobs=False):
+        params = dict(self.spec["parameters"])
+        params.update(options or {})
+        payload = {
+            "messages": [{"role": "system", "content": self.spec["system"]}, {"role": "user", "content": text}],
+            "temperature": params.get("temperature", 0.1),
+            "response_format": {"type": "json_object"},
+            "logprobs": logprobs,
+        }
+        if self.spec["stop"]:
+            payload["stop"] = self.spec["stop"]
+        response = await self._get_client().post("/v1/chat/completions", json=payload)
+        response.raise_for_status()
+        data = response.json()
+        choice = data["choices"][0]
+        usage = data.get("usage", {})
+        return chat_response(self.model, choice["message"]["content"], chat_logprobs(choice) if logprobs else None,
+                             prompt_eval_count=usage.get("prompt_tokens"), eval_count=usage.get("completion_tokens"))
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+class FakeBackend(InferenceBackend):
+    """
+    Deterministic stand-in for load tests and local development: the techniques and the
+    "log-probs" are derived from a hash of the text, so the same input always gets the same answer.
+    """
+    name = "fake"
+
+    def __init__(self, model: str = MODEL_NAME, latency_ms: float = FAKE_LATENCY_MS):
+        self.model = model
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    async def chat(self, text, model=None, options=None, logprobs=False):
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+        rng = random.Random(seed)
+        techniques = sorted(t for t in FAKE_TECHNIQUES if rng.random() < 0.3)
+        content = json.dumps({
+            "reasoning": "Odpowiedź testowa (fake backend).",
+            "discovered_techniques": techniques,
+        }, ensure_ascii=False)
+        token_logprobs = [{"token": "x", "logprob": -rng.random() * 0.5} for _ in range(8)] if logprobs else None
+        return chat_response(model or self.model, content, token_logprobs)
+
+    async def model_version(self):
+        return f"{self.model}@fake"
+
+
+def load_backend(name: str = INFERENCE_BACKEND) -> InferenceBackend:
+    if name == "ollama":
+        from .router import RouterBackend, OLLAMA_UPSTREAMS
+        # Several Ollama boxes behind one router; a single one is called directly
+        if OLLAMA_UPSTREAMS:
+            return RouterBackend(OLLAMA_UPSTREAMS)
+        return OllamaBackend()
+    if name == "llamacpp":
+        return LlamaCppBackend()
+    if name == "llamaserver":
+        return LlamaServerBackend()
+    if name == "fake":
+        return FakeBackend()
+    raise ValueError(f"Unknown INFERENCE_BACKEND '{name}' (ollama, llamacpp, llamaserver, fake)")
@@ -0,0 +1,130 @@
+import asyncio
+import os
+
+from .backends import InferenceBackend
+
+# How long the first request of a batch waits for company; 0 turns micro-batching off.
+# Only backends with a real batched call (chat_batch override, i.e. llamaserver) are batched.
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "0"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+# Batches in flight at once (the backend's slots are shared between them)
+BATCH_MAX_INFLIGHT = int(os.getenv("BATCH_MAX_INFLIGHT", "2"))
+
+
+class MicroBatcher:
+    """
+    Collects concurrent chat() calls for up to `window_ms` (or until `max_batch` are waiting)
+    and dispatches them with one backend.chat_batch() call; every caller gets its own answer
+    or exception back. While all `max_inflight` batches are busy, requests keep piling up and
+    leave together once a slot frees. Different model/options/logprobs go into separate batches.
+    """
+
+    def __init__(self, backend, window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_SIZE,
+                 max_inflight: int = BATCH_MAX_INFLIGHT):
+        self.backend = backend
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.max_inflight = max(1, max_inflight)
+        self._pending = {}  # key -> [(text, future)]
+        self._full = {}  # key -> event set once a whole batch is waiting
+        self._slots = None
+        self.batches = 0
+        self.requests = 0
+        self.batch_sizes = {}  # size -> count
+
+    async def chat(self, text: str, model: str = None, options: dict = None, logprobs: bool = False) -> dict:
+        key = (model, tuple(sorted((options or {}).items())), logprobs)
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((text, future))
+        if len(batch) == 1:
+            self._full[key] = asyncio.Event()
+            asyncio.create_task(self._collect(key))
+        if len(batch) >= self.max_batch:
+            self._full[key].set()
+        return await future
+
+    async def _collect(self, key):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_inflight)
+        try:
+            await asyncio.wait_for(self._full[key].wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        async with self._slots:
+            pending = self._pending.pop(key, [])
+            self._full.pop(key, None)
+            batch, rest = pending[:self.max_batch], pending[self.max_batch:]
+            for text, future in rest:
+                # Overflow starts the next batch (its own window is already over, so it goes next)
+                self._pending.setdefault(key, []).append((text, future))
+            if rest:
+                self._full[key] = asyncio.Event()
+                self._full[key].set()
+                asyncio.create_task(self._collect(key))
+            await self._dispatch(key, batch)
+
+    async def _dispatch(self, key, batch):
+        model, options, logprobs = key
+        # Callers that gave up while waiting don't take a place in the batch
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+        try:
+            results = await self.backend.chat_batch([text for text, _ in batch], model=model,
+                                                    options=dict(options) or None, logprobs=logprobs)
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else None,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+        }
+
+
+class BatchingBackend:
+    """
+    Wraps an InferenceBackend so single chat() calls go through a MicroBatcher; everything
+    else (model_version, reload, status, ...) is the wrapped backend's.
+    """
+
+    def __init__(self, backend, window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_SIZE,
+                 max_inflight: int = BATCH_MAX_INFLIGHT):
+        self.backend = backend
+        self.batcher = MicroBatcher(backend, window_ms, max_batch, max_inflight)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    async def chat(self, text, model=None, options=None, logprobs=False):
+        return await self.batcher.chat(text, model=model, options=options, logprobs=logprobs)
+
+    def status(self) -> dict:
+        return dict(self.backend.status(), batching=self.batcher.stats())
+
+
+def with_batching(backend, window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_SIZE):
+    """The backend itself when batching is off (window 0 or batch size 1) or can't help."""
+    if window_ms <= 0 or max_batch <= 1:
+        return backend
+    if type(backend).chat_batch is InferenceBackend.chat_batch:
+        # Its chat_batch() is just concurrent single calls: the window would only add latency
+        print(f"DEBUG: {backend.name} backend has no batched call, micro-batching stays off")
+        return backend
+    print(f"DEBUG: Micro-batching {backend.name} requests ({window_ms:g} ms window, up to {max_batch})")
+    return BatchingBackend(backend, window_ms, max_batch)
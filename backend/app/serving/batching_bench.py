@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+from .backends import InferenceBackend, FakeBackend, load_backend
+from .batching import MicroBatcher
+
+
+class SimulatedEngine(InferenceBackend):
+    """
+    One GPU decoding one batch at a time: a batch of n costs step_ms + item_ms * n, so single
+    requests pay the full fixed cost each (weights streamed from memory per step) while a
+    batch shares it. Answers come from FakeBackend.
+    """
+    name = "simulated"
+
+    def __init__(self, step_ms: float = 60.0, item_ms: float = 6.0):
+        self.step = step_ms / 1000
+        self.item = item_ms / 1000
+        self.fake = FakeBackend()
+        self._engine = asyncio.Lock()
+
+    async def chat_batch(self, texts, model=None, options=None, logprobs=False):
+        async with self._engine:
+            await asyncio.sleep(self.step + self.item * len(texts))
+        return [await self.fake.chat(t, model=model, logprobs=logprobs) for t in texts]
+
+    async def chat(self, text, model=None, options=None, logprobs=False):
+        return (await self.chat_batch([text], model=model, options=options, logprobs=logprobs))[0]
+
+
+async def drive(backend, rps: float, seconds: float, window_ms: float, max_batch: int, seed: int = 0):
+    """Open-loop Poisson arrivals of single /analyze-like calls; window 0 sends them one by one."""
+    rng = random.Random(seed)
+    batcher = MicroBatcher(backend, window_ms, max_batch) if window_ms > 0 else None
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            text = f"Artykuł testowy {i}: " + "bardzo ważna wiadomość " * rng.randint(5, 40)
+            await (batcher.chat(text) if batcher else backend.chat(text))
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors += 1
+
+    tasks = []
+    began = time.perf_counter()
+    i = 0
+    while time.perf_counter() - began < seconds:
+        tasks.append(asyncio.create_task(one(i)))
+        i += 1
+        await asyncio.sleep(rng.expovariate(rps))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - began
+    ms = np.array(latencies) * 1000 if latencies else np.array([0.0])
+    return {
+        "window_ms": window_ms,
+        "offered_rps": rps,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "errors": errors,
+        "mean_batch_size": batcher.stats()["mean_batch_size"] if batcher else 1.0,
+    }
+
+
+def run(windows=(0, 2, 5, 10, 20, 50), rates=(10, 20, 40, 80), seconds=5.0, max_batch=8,
+        backend_name="simulated", step_ms=60.0, item_ms=6.0):
+    """Throughput and latency for every (batching window, offered load) pair."""
+    results = []
+    for window_ms in windows:
+        for rps in rates:
+            async def once():
+                backend = SimulatedEngine(step_ms, item_ms) if backend_name == "simulated" else load_backend(backend_name)
+                await backend.start()
+                try:
+                    return await drive(backend, rps, seconds, window_ms, max_batch)
+                finally:
+                    await backend.close()
+            results.append(asyncio.run(once()))
+            r = results[-1]
+            print(f"window {window_ms:>5g} ms  offered {rps:>5g} rps  throughput {r['throughput_rps']:>7} rps  "
+                  f"p50 {r['p50_ms']:>8} ms  p99 {r['p99_ms']:>8} ms  batch {r['mean_batch_size']}  errors {r['errors']}")
+    return {"backend": backend_name, "max_batch": max_batch, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput vs latency of /analyze micro-batching per batching window")
+    parser.add_argument("--backend", type=str, default="simulated",
+                        help="'simulated' (GPU cost model) or an INFERENCE_BACKEND name (ollama, llamaserver, llamacpp, fake)")
+    parser.add_argument("--windows", type=str, default="0,2,5,10,20,50", help="Batching windows in ms (0 = no batching)")
+    parser.add_argument("--rates", type=str, default="10,20,40,80", help="Offered loads in requests per second")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--max_batch", type=int, default=8)
+    parser.add_argument("--step_ms", type=float, default=60.0, help="Simulated fixed cost of one decoding step")
+    parser.add_argument("--item_ms", type=float, default=6.0, help="Simulated extra cost per request in a batch")
+    parser.add_argument("--output", type=str, default=None, help="Write the curves as JSON")
+    args = parser.parse_args()
+
+    report = run(tuple(float(w) for w in args.windows.split(",")), tuple(float(r) for r in args.rates.split(",")),
+                 args.seconds, args.max_batch, args.backend, args.step_ms, args.item_ms)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import hashlib
+import random
+
+from fastapi import FastAPI, HTTPException, Request, Response
+
+from .backends import FakeBackend, MODEL_NAME
+
+LATENCY_DISTRIBUTIONS = ("uniform", "lognormal", "exponential")
+CHARS_PER_TOKEN = 4
+
+
+def create_fake_upstream(latency_ms: float = 0.0, jitter_ms: float = 0.0, failure_rate: float = 0.0,
+                         model: str = MODEL_NAME, seed: int = 0, latency_dist: str = "uniform",
+                         tokens_per_second: float = 0.0, prompt_tokens_per_second: float = 0.0,
+                         answer_tokens: int = 0) -> FastAPI:
+    """
+    Ollama look-alike for router and load tests: /api/chat answers like FakeBackend,
+    failing with 500 for a `failure_rate` share of calls.
+
+    Each answer takes a sampled base latency plus the time to read the prompt and
+    generate the answer. The base latency is `latency_ms` + uniform jitter, a
+    lognormal with median `latency_ms` (sigma = jitter_ms / latency_ms), or
+    `latency_ms` + an exponential tail with mean `jitter_ms`. Prompt reading runs at
+    `prompt_tokens_per_second` and generation at `tokens_per_second`, with
+    `answer_tokens` tokens per answer or the fake answer's own length; 0 means instant.
+    Timing fields (eval_count, eval_duration, ...) are filled like Ollama's.
+    /api/tags, /api/blobs and /api/create behave enough like Ollama for a rollout.
+    """
+    if latency_dist not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution '{latency_dist}' {LATENCY_DISTRIBUTIONS}")
+    app = FastAPI(title="Fake Ollama upstream")
+    backend = FakeBackend(model=model)
+    rng = random.Random(seed)
+
+    def base_latency():
+        if latency_dist == "lognormal" and latency_ms > 0:
+            return latency_ms * rng.lognormvariate(0.0, jitter_ms / latency_ms)
+        if latency_dist == "exponential" and jitter_ms > 0:
+            return latency_ms + rng.expovariate(1 / jitter_ms)
+        return latency_ms + rng.uniform(0, jitter_ms)
+    state = {"digest": hashlib.sha256(b"initial").hexdigest(), "blobs": set(), "down": False, "chats": 0}
+    app.state.fake = state
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        state["chats"] += 1
+        if state["down"]:
+            raise HTTPException(status_code=503, detail="down")
+        text = body["messages"][-1]["content"]
+        answer = await backend.chat(text, model=body.get("model"), logprobs=bool(body.get("logprobs")))
+        prompt_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        eval_tokens = answer_tokens or max(1, len(answer["message"]["content"]) // CHARS_PER_TOKEN)
+        prompt_seconds = prompt_tokens / prompt_tokens_per_second if prompt_tokens_per_second else 0.0
+        eval_seconds = eval_tokens / tokens_per_second if tokens_per_second else 0.0
+        total_seconds = base_latency() / 1000 + prompt_seconds + eval_seconds
+        await asyncio.sleep(total_seconds)
+        if rng.random() < failure_rate:
+            raise HTTPException(status_code=500, detail="injected failure")
+        answer.update(prompt_eval_count=prompt_tokens, prompt_eval_duration=int(prompt_seconds * 1e9),
+                      eval_count=eval_tokens, eval_duration=int(eval_seconds * 1e9),
+                      total_duration=int(total_seconds * 1e9))
+        return answer
+
+    @app.get("/api/tags")
+    async def tags():
+        if state["down"]:
+            raise HTTPException(status_code=503, detail="down")
+        return {"models": [{"name": model, "digest": state["digest"]}]}
+
+    @app.head("/api/blobs/{digest}")
+    async def has_blob(digest: str):
+        return Response(status_code=200 if digest in state["blobs"] else 404)
+
+    @app.post("/api/blobs/{digest}")
+    async def push_blob(digest: str, request: Request):
+        sha = hashlib.sha256()
+        async for chunk in request.stream():
+            sha.update(chunk)
+        if f"sha256:{sha.hexdigest()}" != digest:
+            raise HTTPException(status_code=400, detail="digest mismatch")
+        state["blobs"].add(digest)
+        return Response(status_code=201)
+
+    @app.post("/api/create")
+    async def create(request: Request):
+        body = await request.json()
+        referenced = list(body.get("files", {}).values()) + list(body.get("adapters", {}).values())
+        missing = [d for d in referenced if d not in state["blobs"]]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"missing blobs {missing}")
+        # Same files -> same digest, like Ollama's manifest digest
+        state["digest"] = hashlib.sha256("".join(sorted(referenced)).encode()).hexdigest()
+        return {"status": "success"}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Ollama server for router and load tests")
+    parser.add_argument("--port", type=int, default=11501)
+    parser.add_argument("--latency_ms", type=float, default=50.0)
+    parser.add_argument("--jitter_ms", type=float, default=0.0)
+    parser.add_argument("--failure_rate", type=float, default=0.0)
+    parser.add_argument("--latency_dist", type=str, default="uniform", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--tokens_per_second", type=float, default=0.0, help="Decoding speed (0 = instant)")
+    parser.add_argument("--prompt_tokens_per_second", type=float, default=0.0, help="Prompt evaluation speed (0 = instant)")
+    parser.add_argument("--answer_tokens", type=int, default=0, help="Generated tokens per answer (0 = length of the fake answer)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    uvicorn.run(create_fake_upstream(args.latency_ms, args.jitter_ms, args.failure_rate, seed=args.seed,
+                                     latency_dist=args.latency_dist, tokens_per_second=args.tokens_per_second,
+                                     prompt_tokens_per_second=args.prompt_tokens_per_second,
+                                     answer_tokens=args.answer_tokens),
+                host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+import httpx
+
+from .backends import InferenceBackend, OllamaBackend, parse_modelfile, MODEL_NAME, MODELFILE_PATH
+
+# Comma-separated Ollama base URLs, each optionally with a concurrency cap: "http://gpu1:11434|4,http://gpu2:11434"
+OLLAMA_UPSTREAMS = [u.strip() for u in os.getenv("OLLAMA_UPSTREAMS", "").split(",") if u.strip()]
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "4"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+# Consecutive failed requests before an upstream is taken out of rotation
+EJECT_AFTER_FAILURES = int(os.getenv("EJECT_AFTER_FAILURES", "3"))
+# First ejection lasts this long, doubling while the upstream keeps failing (capped)
+EJECT_BASE_SECONDS = float(os.getenv("EJECT_BASE_SECONDS", "10"))
+EJECT_MAX_SECONDS = float(os.getenv("EJECT_MAX_SECONDS", "300"))
+# How long a request waits for a free slot when every upstream is at its cap
+ROUTER_QUEUE_TIMEOUT = float(os.getenv("ROUTER_QUEUE_TIMEOUT", "30"))
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class NoUpstreamAvailable(RuntimeError):
+    pass
+
+
+def parse_upstream(spec: str):
+    url, _, cap = spec.partition("|")
+    return url.rstrip("/"), int(cap) if cap else UPSTREAM_MAX_CONCURRENCY
+
+
+class Upstream:
+    """One Ollama server: its client, in-flight count, health and the model digest it holds."""
+
+    def __init__(self, base_url: str, max_concurrency: int = UPSTREAM_MAX_CONCURRENCY, model: str = MODEL_NAME):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.client = OllamaBackend(url=f"{base_url}/api/chat", model=model)
+        self.outstanding = 0
+        self.failures = 0  # consecutive
+        self.ejections = 0  # consecutive, for the backoff
+        self.ejected_until = 0.0
+        self.stale = False  # holds another model version than the last rollout
+        self.model_version = None
+        self.latency_ewma = None
+        self.served = 0
+        self.errors = 0
+
+    @property
+    def ejected(self):
+        return time.monotonic() < self.ejected_until
+
+    def available(self):
+        return not self.ejected and self.outstanding < self.max_concurrency
+
+    def eject(self, reason: str):
+        self.ejections += 1
+        seconds = min(EJECT_MAX_SECONDS, EJECT_BASE_SECONDS * 2 ** (self.ejections - 1))
+        self.ejected_until = time.monotonic() + seconds
+        print(f"DEBUG: Ejecting upstream {self.base_url} for {seconds:.0f}s: {reason}")
+
+    def readmit(self):
+        if self.ejected_until:
+            print(f"DEBUG: Upstream {self.base_url} healthy again, readmitted")
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.failures = 0
+
+    def record_success(self, seconds: float):
+        self.failures = 0
+        self.served += 1
+        self.latency_ewma = seconds if self.latency_ewma is None else (
+            LATENCY_EWMA_ALPHA * seconds + (1 - LATENCY_EWMA_ALPHA) * self.latency_ewma)
+
+    def record_failure(self, error):
+        self.failures += 1
+        self.errors += 1
+        if self.failures >= EJECT_AFTER_FAILURES and not self.ejected:
+            self.eject(f"{self.failures} failed requests ({error})")
+
+    def status(self) -> dict:
+        return {
+            "url": self.base_url,
+            "healthy": not self.ejected,
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - time.monotonic()), 1),
+            "stale": self.stale,
+            "model_version": self.model_version,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "served": self.served,
+            "errors": self.errors,
+        }
+
+
+class RouterBackend(InferenceBackend):
+    """
+    Spreads /analyze over several Ollama servers.
+
+    Each request goes to the upstream with the fewest requests in flight (ties: lower
+    latency EWMA), never above its cap; when all are at their cap it waits for a slot.
+    EJECT_AFTER_FAILURES failed requests or a failed health check take an upstream out of
+    rotation with exponential backoff; the health loop (GET /api/tags) readmits it and
+    reads the model digest it holds. After a promote, reload() pushes the Modelfile's
+    model to every upstream; the ones left on another digest stop getting traffic.
+    """
+    name = "router"
+
+    def __init__(self, upstreams, model: str = MODEL_NAME, modelfile_path: str = MODELFILE_PATH,
+                 health_interval: float = HEALTH_CHECK_INTERVAL, queue_timeout: float = ROUTER_QUEUE_TIMEOUT):
+        self.model = model
+        self.modelfile_path = modelfile_path
+        self.health_interval = health_interval
+        self.queue_timeout = queue_timeout
+        self.upstreams = [Upstream(*parse_upstream(u), model=model) if isinstance(u, str) else u for u in upstreams]
+        self.expected_version = None
+        self.last_rollout = None
+        self._slot_freed = None
+        self._health_task = None
+        self._blob_digests = {}  # (path, size, mtime) -> sha256, GGUFs are GBs
+
+    async def start(self):
+        self._slot_freed = asyncio.Condition()
+        await self.check_health()
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+
+    def _candidates(self):
+        live = [u for u in self.upstreams if u.available()]
+        fresh = [u for u in live if not u.stale]
+        # Stale upstreams only serve when nothing else can
+        return fresh or live
+
+    def _pick(self, exclude=()):
+        candidates = [u for u in self._candidates() if u not in exclude]
+        if not candidates:
+            return None
+        best = min(u.outstanding for u in candidates)
+        tied = [u for u in candidates if u.outstanding == best]
+        fastest = min((u.latency_ewma or 0.0) for u in tied)
+        return random.choice([u for u in tied if (u.latency_ewma or 0.0) == fastest])
+
+    async def _acquire(self, exclude=()):
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        deadline = time.monotonic() + self.queue_timeout
+        async with self._slot_freed:
+            while True:
+                upstream = self._pick(exclude)
+                if upstream is not None:
+                    upstream.outstanding += 1
+                    return upstream
+                if not any(not u.ejected and u not in exclude for u in self.upstreams):
+                    raise NoUpstreamAvailable("All inference upstreams are ejected")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoUpstreamAvailable("All inference upstreams are at their concurrency cap")
+                try:
+                    await asyncio.wait_for(self._slot_freed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _release(self, upstream):
+        async with self._slot_freed:
+            upstream.outstanding -= 1
+            self._slot_freed.notify()
+
+    async def chat(self, text, model=None, options=None, logprobs=False):
+        tried = []
+        while True:
+            upstream = await self._acquire(exclude=tried)
+            started = time.monotonic()
+            try:
+                response = await upstream.client.chat(text, model=model, options=options, logprobs=logprobs)
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                upstream.record_failure(e)
+                tried.append(upstream)
+                # Connection problems and 5xx are retried once on another upstream
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                if not retryable or len(tried) > 1 or len(tried) >= len(self.upstreams):
+                    raise
+                continue
+            finally:
+                await self._release(upstream)
+            upstream.record_success(time.monotonic() - started)
+            # Which box and model version answered, for the analyses table
+            response["upstream"] = upstream.base_url
+            response["model_version"] = upstream.model_version or self.model
+            return response
+
+    async def model_version(self):
+        return self.expected_version or next((u.model_version for u in self.upstreams if u.model_version), self.model)
+
+    async def check_health(self):
+        await asyncio.gather(*(self._check(u) for u in self.upstreams))
+        if self.expected_version is None:
+            versions = [u.model_version for u in self.upstreams if u.model_version and not u.ejected]
+            # Until a rollout says otherwise, the most common digest is the current one
+            if versions:
+                self.expected_version = max(set(versions), key=versions.count)
+        for upstream in self.upstreams:
+            upstream.stale = bool(self.expected_version and upstream.model_version
+                                  and upstream.model_version != self.expected_version)
+
+    async def _check(self, upstream):
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.get(f"{upstream.base_url}/api/tags", timeout=HEALTH_CHECK_TIMEOUT)
+                response.raise_for_status()
+                models = response.json().get("models", [])
+        except Exception as e:
+            if not upstream.ejected:
+                upstream.eject(f"health check failed ({e})")
+            return
+        upstream.readmit()
+        upstream.model_version = next((f"{self.model}@{m.get('digest', '')[:12]}"
+                                       for m in models if m.get("name") == self.model), None)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"ERROR: Upstream health check loop: {e}")
+
+    async def reload(self):
+        """Rolls the Modelfile's model (new ADAPTER) out to every upstream, one at a time."""
+        report = await self.rollout()
+        self.last_rollout = report
+        return report
+
+    async def refresh(self):
+        # The leader already rolled the model out to the upstreams; just learn the new digest
+        self.expected_version = None
+        await self.check_health()
+
+    async def rollout(self) -> dict:
+        spec = parse_modelfile(self.modelfile_path)
+        files = {"base": spec["from"], "adapter": spec["adapter"]}
+        digests = {}
+        for role, path in files.items():
+            if path:
+                digests[role] = await asyncio.to_thread(self._file_digest, path)
+
+        results = {}
+        for upstream in self.upstreams:
+            try:
+                async with httpx.AsyncClient(timeout=None) as client:
+                    for role, path in files.items():
+                        if path:
+                            await self._push_blob(client, upstream, path, digests[role])
+                    body = {
+                        "model": self.model,
+                        "files": {os.path.basename(spec["from"]): digests["base"]},
+                        "system": spec["system"],
+                        "parameters": dict(spec["parameters"], **({"stop": spec["stop"]} if spec["stop"] else {})),
+                        "stream": False,
+                    }
+                    if spec["adapter"]:
+                        body["adapters"] = {os.path.basename(spec["adapter"]): digests["adapter"]}
+                    if spec["template"]:
+                        body["template"] = spec["template"]
+                    response = await client.post(f"{upstream.base_url}/api/create", json=body)
+                    response.raise_for_status()
+                await self._check(upstream)
+                results[upstream.base_url] = {"ok": True, "model_version": upstream.model_version}
+            except Exception as e:
+                print(f"ERROR: Rollout to {upstream.base_url} failed: {e}")
+                results[upstream.base_url] = {"ok": False, "error": str(e)}
+
+        versions = [r["model_version"] for r in results.values() if r.get("ok") and r.get("model_version")]
+        if versions:
+            self.expected_version = versions[0]
+        for upstream in self.upstreams:
+            upstream.stale = upstream.model_version != self.expected_version
+        print(f"DEBUG: Rollout of {self.expected_version}: {results}")
+        return {"model_version": self.expected_version, "upstreams": results}
+
+    def _file_digest(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key not in self._blob_digests:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                    digest.update(block)
+            self._blob_digests[key] = f"sha256:{digest.hexdigest()}"
+        return self._blob_digests[key]
+
+    async def _push_blob(self, client, upstream, path, digest):
+        # The base GGUF is already there after the first rollout; only new adapters get uploaded
+        exists = await client.head(f"{upstream.base_url}/api/blobs/{digest}")
+        if exists.status_code == 200:
+            return
+
+        async def chunks():
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                    yield block
+
+        response = await client.post(f"{upstream.base_url}/api/blobs/{digest}", content=chunks())
+        response.raise_for_status()
+
+    def status(self) -> dict:
+        return {
+            "backend": self.name,
+            "expected_version": self.expected_version,
+            "upstreams": [u.status() for u in self.upstreams],
+            "last_rollout": self.last_rollout,
+        }
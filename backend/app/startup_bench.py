@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Wall time (interpreter start + imports) each entry point may take; the check fails above it
+STARTUP_BUDGET_API_MS = float(os.getenv("STARTUP_BUDGET_API_MS", "3000"))
+STARTUP_BUDGET_CLI_MS = float(os.getenv("STARTUP_BUDGET_CLI_MS", "1500"))
+# Libraries that must only load on the code paths that really run a model
+HEAVY_MODULES = ("torch", "unsloth", "transformers", "trl", "datasets", "peft", "sklearn",
+                 "sentence_transformers", "llama_cpp", "pyarrow")
+
+# name -> python arguments; the API is imported, the CLIs are asked for --help
+TARGETS = {
+    "api": ["-c", "import app.main"],
+    "benchmark": ["-m", "app.training.benchmark", "--help"],
+    "trainer": ["-m", "app.training.trainer", "--help"],
+    "converter": ["-m", "app.training.converter", "--help"],
+    "quant_sweep": ["-m", "app.training.quant_sweep", "--help"],
+    "semantic_bench": ["-m", "app.training.semantic_bench", "--help"],
+    "db_bench": ["-m", "app.db.db_bench", "--help"],
+    "admission_bench": ["-m", "app.serving.admission_bench", "--help"],
+    "batching_bench": ["-m", "app.serving.batching_bench", "--help"],
+}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def parse_importtime(stderr: str):
+    """(self_us, cumulative_us, depth, module) per line of `python -X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            rows.append((int(match.group(1)), int(match.group(2)), (len(match.group(3)) - 1) // 2, match.group(4)))
+    return rows
+
+
+def measure(args, cwd: str, env: dict) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=cwd, env=env,
+                          capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    rows = parse_importtime(proc.stderr)
+    modules = {module for _, _, _, module in rows}
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(cum for _, cum, depth, _ in rows if depth == 0) / 1000, 1),
+        "returncode": proc.returncode,
+        "heavy_imports": sorted(m for m in HEAVY_MODULES if m in modules),
+        "slowest": [{"module": module, "cumulative_ms": round(cum / 1000, 1)}
+                    for _, cum, depth, module in sorted(rows, key=lambda r: -r[1]) if depth == 0][:5],
+    }
+
+
+def run(targets=None, repeat: int = 3, api_budget_ms: float = STARTUP_BUDGET_API_MS,
+        cli_budget_ms: float = STARTUP_BUDGET_CLI_MS, workdir: str = None) -> dict:
+    """
+    Best of `repeat` fresh interpreters per entry point, checked against its budget and the heavy-import list.
+    `workdir` is where they run (default backend/, like the API); the API creates cache/ and uploads/ there.
+    """
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # The API must come up without a model server or GPU
+    env = dict(os.environ, INFERENCE_BACKEND=os.getenv("INFERENCE_BACKEND", "fake"),
+               PYTHONPATH=os.pathsep.join(p for p in (backend_dir, os.getenv("PYTHONPATH")) if p))
+    results = {}
+    for name in targets or TARGETS:
+        runs = [measure(TARGETS[name], workdir or backend_dir, env) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["wall_ms"])
+        budget = api_budget_ms if name == "api" else cli_budget_ms
+        problems = []
+        if best["returncode"] != 0:
+            problems.append(f"exited with {best['returncode']}")
+        if best["wall_ms"] > budget:
+            problems.append(f"{best['wall_ms']:.0f} ms over the {budget:.0f} ms budget")
+        if best["heavy_imports"]:
+            problems.append(f"imports {', '.join(best['heavy_imports'])} at startup")
+        results[name] = dict(best, budget_ms=budget, ok=not problems, problems=problems)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup time of the API and the CLIs (python -X importtime), fails over budget")
+    parser.add_argument("--targets", type=str, default=",".join(TARGETS), help="Comma-separated subset of the entry points")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per target (best one counts)")
+    parser.add_argument("--api_budget_ms", type=float, default=STARTUP_BUDGET_API_MS)
+    parser.add_argument("--cli_budget_ms", type=float, default=STARTUP_BUDGET_CLI_MS)
+    parser.add_argument("--output", type=str, default=None, help="Write the measurements as JSON")
+    args = parser.parse_args()
+
+    results = run([t.strip() for t in args.targets.split(",") if t.strip()], args.repeat,
+                  args.api_budget_ms, args.cli_budget_ms)
+    for name, r in results.items():
+        slowest = ", ".join(f"{s['module']} {s['cumulative_ms']:.0f}" for s in r["slowest"][:3])
+        print(f"{'OK  ' if r['ok'] else 'FAIL'} {name:<16} {r['wall_ms']:>8.0f} ms (budget {r['budget_ms']:.0f})  "
+              f"imports {r['import_ms']:>7.0f} ms  slowest: {slowest}")
+        for problem in r["problems"]:
+            print(f"ERROR: {name}: {problem}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    # Non-zero exit so CI / a pre-commit hook catches a startup regression
+    sys.exit(0 if all(r["ok"] for r in results.values()) else 1)
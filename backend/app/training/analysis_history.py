@@ -0,0 +1,295 @@
+import atexit
+import csv
+import io
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from ..db import database
+
+# Write-behind: /analyze only appends to a list, a thread inserts the batch in one transaction
+ANALYSIS_FLUSH_INTERVAL = float(os.getenv("ANALYSIS_FLUSH_INTERVAL", "1.0"))
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "200"))
+# Upper bound on rows waiting for the database; beyond it new rows are dropped (and counted)
+ANALYSIS_MAX_PENDING = int(os.getenv("ANALYSIS_MAX_PENDING", "20000"))
+EXPORT_CHUNK_ROWS = 5000
+
+TREND_BUCKETS = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "week": "%Y-W%W",
+    "month": "%Y-%m",
+}
+EXPORT_COLUMNS = ["id", "created_at", "model", "model_version", "source", "input_hash", "techniques",
+                  "parse_status", "latency_ms", "uncertainty"]
+
+
+class AnalysisWriter:
+    """
+    Batches AnalysisRecord inserts (plus their AnalysisTechnique rows) off the request path.
+
+    add() never touches SQLite; a background thread flushes every `flush_interval`
+    seconds, or as soon as `batch_size` rows are waiting, like RunStateStore does for
+    training progress.
+    """
+
+    def __init__(self, session_factory=None, flush_interval: float = ANALYSIS_FLUSH_INTERVAL,
+                 batch_size: int = ANALYSIS_BATCH_SIZE, max_pending: int = ANALYSIS_MAX_PENDING):
+        self.session_factory = session_factory or database.SessionLocal
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="analysis-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, record):
+        if record.created_at is None:
+            # Time of the call, not of the flush
+            record.created_at = datetime.utcnow()
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append(record)
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            db = self.session_factory()
+            try:
+                db.add_all(batch)
+                db.flush()  # assigns the ids the technique rows point at
+                db.add_all([
+                    database.AnalysisTechnique(analysis_id=record.id, technique=technique, created_at=record.created_at)
+                    for record in batch
+                    for technique in set(record.techniques or [])
+                ])
+                db.commit()
+                self.written += len(batch)
+            except Exception as e:
+                db.rollback()
+                self.dropped += len(batch)
+                print(f"ERROR: Failed to persist {len(batch)} analyses: {e}")
+            finally:
+                db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"pending": pending, "written": self.written, "dropped": self.dropped}
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def _filtered(query, technique=None, model_version=None, source=None, since=None, until=None):
+    Record = database.AnalysisRecord
+    if technique:
+        # Served by the (technique, created_at) index
+        tagged = select(database.AnalysisTechnique.analysis_id).where(database.AnalysisTechnique.technique == technique)
+        if since:
+            tagged = tagged.where(database.AnalysisTechnique.created_at >= since)
+        if until:
+            tagged = tagged.where(database.AnalysisTechnique.created_at < until)
+        query = query.filter(Record.id.in_(tagged))
+    if model_version:
+        query = query.filter(Record.model_version == model_version)
+    if source:
+        query = query.filter(Record.source == source)
+    if since:
+        query = query.filter(Record.created_at >= since)
+    if until:
+        query = query.filter(Record.created_at < until)
+    return query
+
+
+def to_entry(record, include_text: bool = False) -> dict:
+    entry = {
+        "id": record.id,
+        "created_at": record.created_at.isoformat() if record.created_at else None,
+        "model": record.model,
+        "model_version": record.model_version,
+        "source": record.source,
+        "input_hash": record.input_hash,
+        "techniques": record.techniques or [],
+        "parse_status": record.parse_status,
+        "latency_ms": record.latency_ms,
+        "uncertainty": record.uncertainty,
+    }
+    if include_text:
+        entry["input_text"] = record.input_text
+    return entry
+
+
+def list_analyses(session_factory, limit: int = 50, cursor: int = None, include_text: bool = False, **filters):
+    """
+    Newest first, keyset-paginated on id: pass the returned next_cursor to get the next
+    page (OFFSET would re-scan every skipped row on large tables).
+    """
+    db = session_factory()
+    try:
+        query = _filtered(db.query(database.AnalysisRecord), **filters)
+        if cursor is not None:
+            query = query.filter(database.AnalysisRecord.id < cursor)
+        records = query.order_by(database.AnalysisRecord.id.desc()).limit(limit + 1).all()
+        has_more = len(records) > limit
+        records = records[:limit]
+        return {
+            "items": [to_entry(r, include_text) for r in records],
+            "next_cursor": records[-1].id if has_more else None,
+        }
+    finally:
+        db.close()
+
+
+def technique_trends(session_factory, bucket: str = "day", technique=None, model_version=None, source=None,
+                     since=None, until=None) -> dict:
+    """Analyses per time bucket and, per bucket, how many of them got each technique."""
+    fmt = TREND_BUCKETS[bucket]
+    Record, Tag = database.AnalysisRecord, database.AnalysisTechnique
+    db = session_factory()
+    try:
+        tag_bucket = func.strftime(fmt, Tag.created_at)
+        tag_query = db.query(tag_bucket, Tag.technique, func.count())
+        if model_version or source:
+            tag_query = tag_query.join(Record, Record.id == Tag.analysis_id)
+            if model_version:
+                tag_query = tag_query.filter(Record.model_version == model_version)
+            if source:
+                tag_query = tag_query.filter(Record.source == source)
+        if technique:
+            tag_query = tag_query.filter(Tag.technique == technique)
+        if since:
+            tag_query = tag_query.filter(Tag.created_at >= since)
+        if until:
+            tag_query = tag_query.filter(Tag.created_at < until)
+
+        record_bucket = func.strftime(fmt, Record.created_at)
+        totals_query = _filtered(db.query(record_bucket, func.count()), model_version=model_version,
+                                 source=source, since=since, until=until)
+
+        buckets = {}
+        for key, total in totals_query.group_by(record_bucket).all():
+            buckets[key] = {"bucket": key, "analyses": total, "techniques": {}}
+        for key, name, count in tag_query.group_by(tag_bucket, Tag.technique).all():
+            buckets.setdefault(key, {"bucket": key, "analyses": 0, "techniques": {}})["techniques"][name] = count
+        return {"bucket": bucket, "series": [buckets[k] for k in sorted(buckets)]}
+    finally:
+        db.close()
+
+
+def iter_export_chunks(session_factory, include_text: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS, **filters):
+    """Lists of export rows, oldest first; each chunk is one keyset query in its own session."""
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            query = _filtered(db.query(database.AnalysisRecord), **filters)
+            records = (query.filter(database.AnalysisRecord.id > last_id)
+                       .order_by(database.AnalysisRecord.id.asc()).limit(chunk_rows).all())
+            rows = [to_entry(r, include_text) for r in records]
+        finally:
+            db.close()
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield rows
+
+
+def csv_stream(chunks, include_text: bool = False):
+    columns = EXPORT_COLUMNS + (["input_text"] if include_text else [])
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for rows in chunks:
+        for row in rows:
+            writer.writerow(dict(row, techniques="|".join(row["techniques"])))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _DrainSink:
+    """Write-only file whose bytes can be taken out while tell() keeps counting (for footer offsets)."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def parquet_stream(chunks, include_text: bool = False):
+    """One row group per chunk, yielded as soon as it is written (needs pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [
+        ("id", pa.int64()), ("created_at", pa.string()), ("model", pa.string()),
+        ("model_version", pa.string()), ("source", pa.string()), ("input_hash", pa.string()),
+        ("techniques", pa.list_(pa.string())), ("parse_status", pa.string()),
+        ("latency_ms", pa.float64()), ("uncertainty", pa.float64()),
+    ]
+    if include_text:
+        fields.append(("input_text", pa.string()))
+    schema = pa.schema(fields)
+
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    for rows in chunks:
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
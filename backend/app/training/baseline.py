@@ -0,0 +1,116 @@
+import json
+import os
+import re
+import time
+
+BASELINE_REPORT_NAME = "current_baseline_report.txt"
+BASELINE_METRICS_NAME = "current_baseline_metrics.json"
+
+# "Exact-Match Accuracy: 0.7318 (1113/1521)"
+EM_PATTERN = re.compile(r"Exact-Match Accuracy: (\d+\.\d+)")
+# "Mean Document-Level F1 (excluding empty gold-label docs): 0.2847"
+F1_PATTERN = re.compile(r"Mean Document-Level F1 \(excluding empty gold-label docs\): (\d+\.\d+)")
+
+
+def parse_report(content: str) -> dict:
+    """Extracts the headline metrics from a text benchmark report."""
+    result = {'f1': 0.0, 'em': 0.0}
+    match_em = EM_PATTERN.search(content)
+    if match_em:
+        result['em'] = float(match_em.group(1))
+    match_f1 = F1_PATTERN.search(content)
+    if match_f1:
+        result['f1'] = float(match_f1.group(1))
+    return result
+
+
+def metrics_sidecar_path(report_path: str) -> str:
+    """benchmark_report_123.txt -> benchmark_report_123.json"""
+    return os.path.splitext(report_path)[0] + ".json"
+
+
+def load_report_metrics(report_path: str) -> dict:
+    """
+    Reads metrics for a benchmark report, preferring the JSON sidecar written by the
+    benchmark and falling back to parsing the text report (older reports have no sidecar).
+    """
+    sidecar = metrics_sidecar_path(report_path)
+    if os.path.exists(sidecar):
+        with open(sidecar, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {'f1': float(data.get('f1', 0.0)), 'em': float(data.get('em', 0.0))}
+
+    with open(report_path, "r", encoding="utf-8") as f:
+        return parse_report(f.read())
+
+
+def write_json_atomic(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class BaselineMetricsStore:
+    """
+    Baseline metrics kept in memory and backed by a JSON file in the reports directory.
+
+    get() is an in-memory read; the file's mtime is re-checked at most every
+    `check_interval` seconds so manual edits or another process' deployment are still
+    picked up. On first use without a JSON file the legacy text report is parsed once
+    and the JSON file is written from it.
+    """
+
+    def __init__(self, reports_dir: str, check_interval: float = 5.0):
+        self.reports_dir = reports_dir
+        self.metrics_path = os.path.join(reports_dir, BASELINE_METRICS_NAME)
+        self.report_path = os.path.join(reports_dir, BASELINE_REPORT_NAME)
+        self.check_interval = check_interval
+        self._metrics = {'f1': 0.0, 'em': 0.0}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._migrate_legacy_report()
+        self._reload()
+
+    def get(self) -> dict:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._reload()
+        return self._metrics
+
+    def update(self, metrics: dict, source_report: str = None):
+        data = {
+            'f1': float(metrics.get('f1', 0.0)),
+            'em': float(metrics.get('em', 0.0)),
+            'source_report': source_report,
+            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        os.makedirs(self.reports_dir, exist_ok=True)
+        write_json_atomic(self.metrics_path, data)
+        self._metrics = {'f1': data['f1'], 'em': data['em']}
+        self._mtime = os.path.getmtime(self.metrics_path)
+
+    def _reload(self):
+        try:
+            mtime = os.path.getmtime(self.metrics_path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.metrics_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._metrics = {'f1': float(data.get('f1', 0.0)), 'em': float(data.get('em', 0.0))}
+            self._mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not load baseline metrics from {self.metrics_path}: {e}")
+
+    def _migrate_legacy_report(self):
+        if os.path.exists(self.metrics_path) or not os.path.exists(self.report_path):
+            return
+        try:
+            self.update(load_report_metrics(self.report_path), source_report=self.report_path)
+            print(f"DEBUG: Baseline metrics migrated from {self.report_path}")
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not migrate baseline report {self.report_path}: {e}")
@@ -2,6 +2,18 @@ import os
 import sys
 import subprocess
 
+# What convert_lora_to_gguf.py can write; k-quants only exist for full models (llama-quantize)
+LORA_OUTTYPES = ("f32", "f16", "bf16", "q8_0", "auto")
+
+
+def lora_outtype(quant_method: str) -> str:
+    """--outtype for the adapter; k-quant requests (q4_k_m, ...) fall back to q8_0, the smallest LoRA type."""
+    quant_method = quant_method.lower()
+    if quant_method in LORA_OUTTYPES:
+        return quant_method
+    print(f"DEBUG: {quant_method} is a base-model quantization (llama-quantize); LoRA adapter written as q8_0")
+    return "q8_0"
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
@@ -58,6 +70,7 @@ def main():
         "python3",
         script_path,
         "--outfile", args.output,
+        "--outtype", lora_outtype(args.quant_method),
         args.adapter 
     ]
 
@@ -0,0 +1,453 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from ..db import database
+from .progress_bus import ProgressBus
+
+# sqlite: lease + command queue in the shared database, for `uvicorn --workers N` or several hosts.
+#   Several hosts also need the same shared paths everywhere (UPLOAD_DIR, model/, logs/); a leader only
+#   checks PIDs recorded on its own host (TrainingRun.host) and keeps other hosts' runs adopted.
+# local: single-process stand-in, this worker always owns the training lifecycle
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "sqlite")
+# A leader that stops renewing is replaced after this long; renewed every third of it
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+# How often the leader picks up commands / followers mirror the leader's state
+COORDINATION_POLL_SECONDS = float(os.getenv("COORDINATION_POLL_SECONDS", "0.2"))
+COMMAND_TIMEOUT_SECONDS = float(os.getenv("COMMAND_TIMEOUT_SECONDS", "30"))
+# Finished commands are kept this long for debugging
+COMMAND_RETENTION_SECONDS = 600
+# Terminal command states; "expired": the submitter stopped waiting before a leader claimed it
+FINISHED_COMMAND_STATES = ("done", "failed", "expired")
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+TRAINING_LEASE = "training-orchestrator"
+
+
+class CommandError(Exception):
+    """A command failed on the leader (or never got an answer); carries the HTTP status to return."""
+
+    def __init__(self, status_code: int, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class LocalStore:
+    """In-process stand-in for SqlStore: one worker, so it always holds every lease."""
+
+    def __init__(self):
+        self._state = {}
+
+    def acquire(self, name: str, holder: str, seconds: float) -> bool:
+        return True
+
+    def release(self, name: str, holder: str):
+        pass
+
+    def put(self, key: str, value):
+        self._state[key] = value
+
+    def get(self, key: str):
+        return self._state.get(key)
+
+    def submit(self, kind: str, payload: dict, submitted_by: str) -> int:
+        raise RuntimeError("Local coordination has no leader to hand commands to")
+
+    def result(self, command_id: int):
+        return None
+
+    def expire(self, command_id: int) -> bool:
+        return False
+
+    def claim(self, holder: str, limit: int = 32):
+        return []
+
+    def fail_orphaned(self, holder: str) -> int:
+        return 0
+
+    def finish(self, command_id: int, ok: bool, result):
+        pass
+
+    def purge(self, older_than_seconds: float):
+        pass
+
+
+class SqlStore:
+    """
+    Lease, shared state and command queue in the application database.
+
+    The lease is taken with a single conditional UPDATE (ours, or expired), which SQLite
+    serializes under its write lock and other databases under a row lock, so two workers
+    can never both renew it. Commands are claimed the same way (pending -> running),
+    and a submitter that gives up withdraws its command the same way (pending -> expired).
+    """
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or database.SessionLocal
+
+    def acquire(self, name: str, holder: str, seconds: float) -> bool:
+        now = time.time()
+        db = self.session_factory()
+        try:
+            updated = db.query(database.Lease).filter(
+                database.Lease.name == name,
+                or_(database.Lease.holder == holder, database.Lease.expires_at < now)
+            ).update({"holder": holder, "expires_at": now + seconds}, synchronize_session=False)
+            if not updated:
+                if db.query(database.Lease.name).filter(database.Lease.name == name).first() is not None:
+                    db.rollback()
+                    return False
+                db.add(database.Lease(name=name, holder=holder, expires_at=now + seconds))
+            db.commit()
+            return True
+        except IntegrityError:
+            # Another worker inserted the first lease row at the same time
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def release(self, name: str, holder: str):
+        db = self.session_factory()
+        try:
+            db.query(database.Lease).filter(database.Lease.name == name, database.Lease.holder == holder) \
+                .update({"expires_at": 0.0}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def put(self, key: str, value):
+        db = self.session_factory()
+        try:
+            db.merge(database.SharedState(key=key, value=value, updated_at=datetime.utcnow()))
+            db.commit()
+        finally:
+            db.close()
+
+    def get(self, key: str):
+        db = self.session_factory()
+        try:
+            row = db.query(database.SharedState.value).filter(database.SharedState.key == key).first()
+            return row[0] if row is not None else None
+        finally:
+            db.close()
+
+    def submit(self, kind: str, payload: dict, submitted_by: str) -> int:
+        db = self.session_factory()
+        try:
+            command = database.OrchestratorCommand(kind=kind, payload=payload, submitted_by=submitted_by,
+                                                   created_at=datetime.utcnow())
+            db.add(command)
+            db.commit()
+            return command.id
+        finally:
+            db.close()
+
+    def result(self, command_id: int):
+        """(status, result) once the command is done or failed, else None."""
+        db = self.session_factory()
+        try:
+            row = db.query(database.OrchestratorCommand.status, database.OrchestratorCommand.result) \
+                .filter(database.OrchestratorCommand.id == command_id).first()
+            if row is None or row[0] in ("pending", "running"):
+                return None
+            return row[0], row[1]
+        finally:
+            db.close()
+
+    def expire(self, command_id: int) -> bool:
+        """Withdraws a command no leader has claimed yet; False once one has."""
+        db = self.session_factory()
+        try:
+            updated = db.query(database.OrchestratorCommand).filter(
+                database.OrchestratorCommand.id == command_id,
+                database.OrchestratorCommand.status == "pending"
+            ).update({"status": "expired", "finished_at": datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+    def claim(self, holder: str, limit: int = 32):
+        """Oldest pending commands as (id, kind, payload), marked running by `holder`."""
+        db = self.session_factory()
+        try:
+            rows = db.query(database.OrchestratorCommand.id, database.OrchestratorCommand.kind,
+                            database.OrchestratorCommand.payload) \
+                .filter(database.OrchestratorCommand.status == "pending") \
+                .order_by(database.OrchestratorCommand.id).limit(limit).all()
+            claimed = []
+            for command_id, kind, payload in rows:
+                # Conditional, so a leader that is just being replaced can't run it twice
+                if db.query(database.OrchestratorCommand).filter(
+                        database.OrchestratorCommand.id == command_id,
+                        database.OrchestratorCommand.status == "pending"
+                ).update({"status": "running", "claimed_by": holder}, synchronize_session=False):
+                    claimed.append((command_id, kind, payload or {}))
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def fail_orphaned(self, holder: str) -> int:
+        """
+        Fails commands still running under an earlier leader: it lost the lease (or died)
+        before finishing them. They aren't requeued since a half-done promotion or
+        training start mustn't run twice; the submitter gets the error instead.
+        """
+        db = self.session_factory()
+        try:
+            failed = db.query(database.OrchestratorCommand).filter(
+                database.OrchestratorCommand.status == "running",
+                or_(database.OrchestratorCommand.claimed_by != holder,
+                    database.OrchestratorCommand.claimed_by.is_(None))
+            ).update({"status": "failed", "finished_at": datetime.utcnow(),
+                      "result": {"status_code": 503, "detail": "The training leader changed before the command finished"}},
+                     synchronize_session=False)
+            db.commit()
+            return failed
+        finally:
+            db.close()
+
+    def finish(self, command_id: int, ok: bool, result):
+        db = self.session_factory()
+        try:
+            db.query(database.OrchestratorCommand).filter(database.OrchestratorCommand.id == command_id).update(
+                {"status": "done" if ok else "failed", "result": result, "finished_at": datetime.utcnow()},
+                synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def purge(self, older_than_seconds: float):
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+        db = self.session_factory()
+        try:
+            db.query(database.OrchestratorCommand).filter(
+                database.OrchestratorCommand.status.in_(FINISHED_COMMAND_STATES),
+                database.OrchestratorCommand.finished_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+def load_store(name: str = COORDINATION_BACKEND):
+    if name == "sqlite":
+        return SqlStore()
+    if name == "local":
+        return LocalStore()
+    raise ValueError(f"Unknown COORDINATION_BACKEND: {name}")
+
+
+class Coordinator:
+    """
+    Leader election between API workers for the training lifecycle.
+
+    A lease thread keeps (or tries to take) the TRAINING_LEASE. The leader runs the
+    orchestrator: it executes commands other workers queued, publishes the status/queue
+    snapshot to the shared store and bumps the model generation after a deployment.
+    Followers answer status reads from that snapshot (mirrored into `bus` for SSE) and
+    hand every training call to the leader through call(). Every worker reloads its
+    inference backend and caches when the model generation changes.
+    """
+
+    def __init__(self, store=None, worker_id: str = WORKER_ID, lease_seconds: float = LEADER_LEASE_SECONDS,
+                 poll_seconds: float = COORDINATION_POLL_SECONDS):
+        self.store = store or load_store()
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.is_leader = False
+        # Followers' copy of the leader's status snapshots
+        self.bus = ProgressBus()
+        self.handlers = {}
+        self.on_elected = None
+        self.on_demoted = None
+        self.leader_state = None
+        self.on_model_changed = None
+        self.generation = None
+        self._generation_seen = False
+        self._loop = None
+        self._stop = threading.Event()
+        self._lease_thread = None
+        self._task = None
+        self._lease_expires = 0.0
+        self._published = {}
+        self._last_purge = 0.0
+        self._orphans_checked = False
+
+    def start(self, handlers: dict, on_elected, on_demoted, leader_state, on_model_changed):
+        """
+        handlers: kind -> async fn(payload) -> dict, run on the leader.
+        leader_state: () -> {key: snapshot} published by the leader on change.
+        """
+        self.handlers = handlers
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.leader_state = leader_state
+        self.on_model_changed = on_model_changed
+        self._loop = asyncio.get_running_loop()
+        # First election inline, so a single worker owns the orchestrator before serving
+        self._set_role(self._renew())
+        self._lease_thread = threading.Thread(target=self._lease_loop, name="leader-lease", daemon=True)
+        self._lease_thread.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+        if self.is_leader:
+            # Hand over right away instead of after the lease runs out
+            await self._loop.run_in_executor(None, self.store.release, TRAINING_LEASE, self.worker_id)
+
+    async def call(self, kind: str, payload: dict, wait: bool = True, timeout: float = COMMAND_TIMEOUT_SECONDS):
+        """Runs a training command here when we lead, else queues it for the leader (and waits for the result)."""
+        if self.is_leader:
+            return await self.handlers[kind](payload)
+        loop = asyncio.get_running_loop()
+        command_id = await loop.run_in_executor(None, self.store.submit, kind, payload, self.worker_id)
+        if not wait:
+            return {"queued": command_id}
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_seconds)
+            finished = await loop.run_in_executor(None, self.store.result, command_id)
+            if finished is not None:
+                return self._command_result(finished)
+        # Withdraw it, so a leader showing up later doesn't run a command we already answered
+        if await loop.run_in_executor(None, self.store.expire, command_id):
+            raise CommandError(504, f"No answer from the training leader for {kind} (command {command_id} withdrawn)")
+        # Claimed meanwhile: it may have just finished
+        finished = await loop.run_in_executor(None, self.store.result, command_id)
+        if finished is not None:
+            return self._command_result(finished)
+        raise CommandError(504, f"{kind} is still running on the training leader (command {command_id})")
+
+    @staticmethod
+    def _command_result(finished):
+        status, result = finished
+        if status == "failed":
+            raise CommandError(result.get("status_code", 500), result.get("detail"))
+        return result
+
+    def shared(self, key: str):
+        """Latest snapshot the leader published under `key` (None before the first one)."""
+        return self._published.get(key)
+
+    async def bump_generation(self):
+        """Called by the leader after a deployment; every worker reloads its model."""
+        current = await self._loop.run_in_executor(None, self.store.get, "model_generation")
+        self.generation, self._generation_seen = (current or 0) + 1, True
+        await self._loop.run_in_executor(None, self.store.put, "model_generation", self.generation)
+
+    def status(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "backend": type(self.store).__name__,
+            "leader": self.is_leader,
+            "lease_seconds": self.lease_seconds,
+            "model_generation": self.generation,
+        }
+
+    def _renew(self) -> bool:
+        try:
+            held = self.store.acquire(TRAINING_LEASE, self.worker_id, self.lease_seconds)
+        except OperationalError as e:
+            print(f"ERROR: Could not renew the training lease: {e}")
+            # Keep leading until our last lease would have run out, with a third as margin
+            return self.is_leader and time.time() < self._lease_expires - self.lease_seconds / 3
+        if held:
+            self._lease_expires = time.time() + self.lease_seconds
+        return held
+
+    def _lease_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            held = self._renew()
+            if held != self.is_leader:
+                self._loop.call_soon_threadsafe(self._set_role, held)
+
+    def _set_role(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            print(f"DEBUG: Worker {self.worker_id} took the training lease")
+            self._published = {}
+            self._orphans_checked = False
+            self.on_elected()
+        else:
+            print(f"DEBUG: Worker {self.worker_id} lost the training lease")
+            self.on_demoted()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if self.is_leader:
+                    await self._lead(loop)
+                else:
+                    await self._follow(loop)
+                generation = await loop.run_in_executor(None, self.store.get, "model_generation")
+                if generation != self.generation:
+                    # The first reading is just where this worker starts from
+                    changed = self._generation_seen
+                    self.generation, self._generation_seen = generation, True
+                    if changed and self.on_model_changed is not None:
+                        print(f"DEBUG: Model generation {generation}, reloading the inference backend")
+                        await self.on_model_changed()
+                self._generation_seen = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Coordination loop failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _lead(self, loop):
+        if not self._orphans_checked:
+            # Before claiming anything: what is still running now belongs to a previous leader
+            orphaned = await loop.run_in_executor(None, self.store.fail_orphaned, self.worker_id)
+            if orphaned:
+                print(f"DEBUG: Failed {orphaned} command(s) left running by the previous leader")
+            self._orphans_checked = True
+        for command_id, kind, payload in await loop.run_in_executor(None, self.store.claim, self.worker_id):
+            # Own task each, so a long promotion doesn't hold up progress updates
+            asyncio.create_task(self._execute(command_id, kind, payload))
+
+        for key, value in self.leader_state().items():
+            if self._published.get(key) != value:
+                await loop.run_in_executor(None, self.store.put, key, value)
+                self._published[key] = value
+
+        if time.monotonic() - self._last_purge > 60:
+            self._last_purge = time.monotonic()
+            await loop.run_in_executor(None, self.store.purge, COMMAND_RETENTION_SECONDS)
+
+    async def _execute(self, command_id: int, kind: str, payload: dict):
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise CommandError(400, f"Unknown command: {kind}")
+            ok, result = True, await handler(payload)
+        except Exception as e:
+            # HTTPException and CommandError both carry status_code/detail
+            ok, result = False, {"status_code": getattr(e, "status_code", 500), "detail": getattr(e, "detail", str(e))}
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.store.finish, command_id, ok, result)
+        except Exception as e:
+            print(f"ERROR: Could not store the result of command {command_id} ({kind}): {e}")
+
+    async def _follow(self, loop):
+        for key in ("training_status", "training_queue"):
+            value = await loop.run_in_executor(None, self.store.get, key)
+            if value is not None:
+                self._published[key] = value
+        if self._published.get("training_status") is not None:
+            self.bus.publish(self._published["training_status"])
@@ -0,0 +1,198 @@
+import json
+import os
+import re
+
+# Plain-Python helpers shared by the benchmark (WSL, torch) and the backend (no torch):
+# prompt building, output parsing and scoring. Nothing here may import an ML library.
+
+
+def get_project_root():
+    current_dir = os.getcwd()
+    if os.path.basename(current_dir) == "backend":
+        return os.path.dirname(current_dir)
+    return current_dir
+
+
+def parse_model_output(response_text: str):
+    """
+    Extracts the technique tags from a model answer, with support for Dict format
+    {"discovered_techniques": []} and Markdown stripping.
+    Returns (tags, parsing_status, reasoning) with status 'Strict Success', 'Recovered' or 'Failed'.
+    """
+    parsed_tags = []
+    parsing_status = 'Failed'
+    reasoning = None
+
+    # 0. Pre-processing: Strip Markdown (Crucial for Strict Success)
+    clean_text = response_text.replace("```json", "").replace("```", "").strip()
+
+    # Attempt 1: Strict JSON parsing
+    try:
+        parsed_output = json.loads(clean_text)
+
+        # CASE A: Output is the expected Dictionary
+        if isinstance(parsed_output, dict):
+            # Extract the specific key we trained on
+            parsed_tags = parsed_output.get("discovered_techniques", [])
+            reasoning = parsed_output.get("reasoning")
+            # Check if the inner content is actually a list
+            if not isinstance(parsed_tags, list):
+                 # Try to force it if it's a string representation
+                 parsed_tags = []
+            parsing_status = 'Strict Success'
+
+        # CASE B: Model outputted a raw List (unlikely but possible)
+        elif isinstance(parsed_output, list):
+            parsed_tags = parsed_output
+            parsing_status = 'Strict Success'
+
+        else:
+            raise ValueError("Parsed output is not a Dict or List.")
+
+    except (json.JSONDecodeError, ValueError):
+        # Attempt 2: Regex-based correction
+        # We look for the list explicitly
+        match = re.search(r'\[(.*?)\]', clean_text, re.DOTALL)
+        if match:
+            extracted_content = f"[{match.group(1)}]"
+            try:
+                parsed_output_recovered = json.loads(extracted_content)
+                if isinstance(parsed_output_recovered, list):
+                    parsed_tags = parsed_output_recovered
+                    parsing_status = 'Recovered'
+            except (json.JSONDecodeError, ValueError):
+                pass
+
+    return [str(tag) for tag in parsed_tags if tag is not None], parsing_status, reasoning
+
+
+def tag_jaccard(a, b) -> float:
+    """Overlap of two tag sets; two empty answers agree completely."""
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def evaluate_response(response_text: str, ground_truth_tags: list):
+    """
+    Evaluates response with support for Dict format {"discovered_techniques": []}
+    and Markdown stripping.
+    """
+    parsed_tags, parsing_status, _ = parse_model_output(response_text)
+
+    # Clean tags and convert to sets for easier set operations
+    parsed_tags_set = set(str(tag) for tag in parsed_tags if tag is not None)
+    ground_truth_tags_set = set(str(tag) for tag in ground_truth_tags if tag is not None)
+
+    # --- Document-level F1 calculation (as per user definition) ---
+    # TP = |pred ∩ gold|
+    tp_doc = len(parsed_tags_set.intersection(ground_truth_tags_set))
+    # FP = |pred − gold|
+    fp_doc = len(parsed_tags_set.difference(ground_truth_tags_set))
+    # FN = |gold − pred|
+    fn_doc = len(ground_truth_tags_set.difference(parsed_tags_set))
+
+    # F1_doc = 0 if TP=FP=FN=0, else 2*TP / (2*TP + FP + FN)
+    if tp_doc == 0 and fp_doc == 0 and fn_doc == 0:
+        f1_doc = 0.0 # Per user instruction for when both sets are empty
+    else:
+        f1_doc = (2 * tp_doc) / (2 * tp_doc + fp_doc + fn_doc)
+
+    # Exact-match accuracy
+    exact_match = (parsed_tags_set == ground_truth_tags_set)
+
+    return {
+        'parsing_status': parsing_status,
+        'parsed_tags': list(parsed_tags_set), # Store as list for consistency
+        'f1_doc': f1_doc,
+        'exact_match': exact_match,
+        'has_gold_labels': bool(ground_truth_tags_set), # To identify documents with non-empty gold labels
+        'ground_truth': list(ground_truth_tags_set),
+        'predicted': list(parsed_tags_set),
+        'raw_output': response_text
+    }
+
+
+def summarize_results(results) -> dict:
+    """Benchmark metrics over evaluate_response() results: F1 on docs with gold labels, EM, parsing rate."""
+    total = len(results)
+    with_gold = [r for r in results if r['has_gold_labels']]
+    return {
+        "f1": sum(r['f1_doc'] for r in with_gold) / len(with_gold) if with_gold else 0.0,
+        "em": sum(1 for r in results if r['exact_match']) / total if total else 0.0,
+        "f1_all_docs": sum(r['f1_doc'] for r in results) / total if total else 0.0,
+        "parsing_success_rate": sum(1 for r in results if r['parsing_status'] == 'Strict Success') / total if total else 0.0,
+        "total_docs": total,
+        "non_empty_gold_docs": len(with_gold),
+    }
+
+
+SYSTEM_INSTRUCTION = '''
+Jesteś ekspertem w dziedzinie analizy mediów i lingwistyki, specjalizującym się w wykrywaniu propagandy, manipulacji poznawczej i błędów logicznych w tekstach w języku polskim.
+
+**Twoje zadanie:**
+Przeanalizuj dostarczony tekst wejściowy w języku polskim, aby zidentyfikować konkretne techniki manipulacji. Musisz oprzeć swoją analizę wyłącznie na dostarczonym tekście, szukając wzorców, które mają na celu wpłynięcie na opinię czytelnika za pomocą środków irracjonalnych lub zwodniczych.
+
+**Dozwolone kategorie manipulacji:**
+Jesteś ściśle ograniczony do klasyfikowania technik w następujących kategoriach. Nie używaj żadnych innych tagów.
+
+1.  **REFERENCE_ERROR**: Cytaty, które nie popierają tezy, są zmyślone lub pochodzą z niewiarygodnych źródeł.
+2.  **WHATABOUTISM**: Dyskredytowanie stanowiska oponenta poprzez zarzucanie mu hipokryzji, bez bezpośredniego odparcia jego argumentów.
+3.  **STRAWMAN**: Przeinaczenie argumentu oponenta (stworzenie "chochoła"), aby łatwiej go było zaatakować.
+4.  **EMOTIONAL_CONTENT**: Używanie języka nasyconego emocjami (strach, gniew, litość, radość) w celu ominięcia racjonalnego, krytycznego myślenia.
+5.  **CHERRY_PICKING**: Zatajanie dowodów lub ignorowanie danych, które zaprzeczają argumentowi, przy jednoczesnym przedstawianiu tylko danych potwierdzających.
+6.  **FALSE_CAUSE**: Błędne zidentyfikowanie przyczyny zjawiska (np. mylenie korelacji z przyczynowością).
+7.  **MISLEADING_CLICKBAIT**: Nagłówki lub wstępy, które sensacyjnie wyolbrzymiają lub fałszywie przedstawiają faktyczną treść tekstu.
+8.  **ANECDOTE**: Wykorzystywanie odosobnionych historii osobistych lub pojedynczych przykładów jako ważnego dowodu na ogólny trend lub fakt naukowy.
+9.  **LEADING_QUESTIONS**: Pytania sformułowane w sposób sugerujący konkretną odpowiedź lub zawierające nieudowodnione założenie.
+10. **EXAGGERATION**: Hiperboliczne stwierdzenia, które wyolbrzymiają fakty, aby wywołać reakcję.
+11. **QUOTE_MINING**: Wyrywanie cytatów z kontekstu w celu zniekształcenia intencji pierwotnego autora.
+
+**Format wyjściowy:**
+Musisz odpowiedzieć pojedynczym, poprawnym obiektem JSON zawierającym dwa klucze:
+1.  `"reasoning"`: Spójny akapit w **języku polskim** wyjaśniający, które techniki znaleziono i dlaczego. Musisz przytoczyć konkretną logikę lub fragmenty tekstu, aby uzasadnić swoją klasyfikację.
+2.  `"discovered_techniques"`: Lista ciągów znaków (stringów) zawierająca dokładnie te tagi, które zdefiniowano powyżej. Jeśli nie znaleziono żadnych technik, zwróć pustą listę.
+
+**Przykładowa struktura:**
+{
+    "reasoning": "Tekst stosuje [Nazwa Techniki], ponieważ autor sugeruje, że...",
+    "discovered_techniques": ["NAZWA_TECHNIKI"]
+}
+    '''
+
+
+def render_prompt(user_message, tokenizer):
+    # Construct the ChatML formatted prompt
+    messages = [
+        {"role": "system", "content": SYSTEM_INSTRUCTION},
+        {"role": "user", "content": user_message},
+    ]
+    # We don't add generation prompt here because unsloth handles it or we do it manually? 
+    # Notebook says: add_generation_prompt=True
+    return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+
+def gold_tags(output_text: str) -> list:
+    """Technique tags of a dataset answer (the `output` field); [] when it isn't valid JSON."""
+    try:
+        clean_json = output_text.replace("```json", "").replace("```", "").strip()
+        return json.loads(clean_json)['discovered_techniques']
+    except Exception:
+        return []
+
+
+def format_prompt(example, tokenizer, truncator=None, max_prompt_tokens=None):
+    # Combine instruction for system message and input for the user message
+    user_message = example['input']
+    example['clipped_tokens'] = 0
+    if truncator is not None and max_prompt_tokens:
+        # Same token-aware cut as in training; the article gets what the system prompt leaves
+        budget = max_prompt_tokens - truncator.count(render_prompt("", tokenizer))
+        user_message, example['clipped_tokens'] = truncator.truncate(user_message, budget)
+
+    example['prompt'] = render_prompt(user_message, tokenizer)
+
+    # Parse tags from output for ground truth
+    example['tags'] = gold_tags(example['output'])
+    return example
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+from datetime import datetime
+
+from ..db import database
+from .analysis_history import AnalysisWriter
+from .core import parse_model_output, tag_jaccard
+from .ingestion import TECHNIQUES
+
+# Extra generations per probed call (0 = only the free signals: parse status, logprobs)
+CURATION_SAMPLES = int(os.getenv("CURATION_SAMPLES", "0"))
+CURATION_SAMPLE_TEMPERATURE = float(os.getenv("CURATION_SAMPLE_TEMPERATURE", "0.8"))
+# Share of /analyze calls that get the extra generations (they cost GPU time)
+CURATION_PROBE_RATE = float(os.getenv("CURATION_PROBE_RATE", "0.2"))
+# Ollama model to compare against, e.g. the not yet promoted adapter
+CANDIDATE_MODEL = os.getenv("CANDIDATE_MODEL", "")
+
+PARSE_UNCERTAINTY = {"Strict Success": 0.0, "Recovered": 0.5, "Failed": 1.0}
+
+
+def input_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def mean_logprob(ollama_data: dict):
+    """Mean token log-prob of an Ollama answer, when the server returned them (logprobs=true)."""
+    logprobs = ollama_data.get("logprobs") or []
+    values = [entry.get("logprob") for entry in logprobs if isinstance(entry, dict) and entry.get("logprob") is not None]
+    return sum(values) / len(values) if values else None
+
+
+def uncertainty_score(parse_status, avg_logprob=None, sample_disagreement=None, candidate_disagreement=None) -> float:
+    """Mean of the available signals, each scaled to 0 (confident) .. 1 (unsure)."""
+    signals = [PARSE_UNCERTAINTY.get(parse_status, 1.0)]
+    if avg_logprob is not None:
+        # exp(mean logprob) is the geometric-mean token probability
+        signals.append(1.0 - math.exp(avg_logprob))
+    if sample_disagreement is not None:
+        signals.append(sample_disagreement)
+    if candidate_disagreement is not None:
+        signals.append(candidate_disagreement)
+    return sum(signals) / len(signals)
+
+
+class CurationLog:
+    """
+    Logs /analyze traffic with cheap uncertainty signals and ranks it for expert labeling.
+
+    Parse status and token log-probs come with the answer for free. Disagreement
+    between sampled generations (and with CANDIDATE_MODEL) needs extra model calls,
+    so it runs in the background after the response was sent, and only for a
+    CURATION_PROBE_RATE share of calls.
+    """
+
+    def __init__(self, backend, session_factory=None, samples: int = CURATION_SAMPLES,
+                 probe_rate: float = CURATION_PROBE_RATE, candidate_model: str = CANDIDATE_MODEL,
+                 writer: AnalysisWriter = None):
+        # serving.backends.InferenceBackend, the same one /analyze uses
+        self.backend = backend
+        self.session_factory = session_factory or database.SessionLocal
+        self.writer = writer or AnalysisWriter(self.session_factory)
+        self.samples = samples
+        self.probe_rate = probe_rate
+        self.candidate_model = candidate_model
+        self._tasks = set()
+
+    def submit(self, text: str, model: str, raw_output: str, ollama_data: dict, **fields):
+        """
+        Schedules logging of one call without delaying the response.
+        `fields` are extra AnalysisRecord columns (model_version, latency_ms, ...).
+        """
+        # Probes can take a while; the row keeps the time of the call
+        fields.setdefault("created_at", datetime.utcnow())
+        task = asyncio.create_task(self._record(text, model, raw_output, ollama_data, fields))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _record(self, text, model, raw_output, ollama_data, fields):
+        try:
+            tags, parse_status, reasoning = parse_model_output(raw_output or "")
+            avg_logprob = mean_logprob(ollama_data)
+
+            sample_disagreement = candidate_disagreement = None
+            if random.random() < self.probe_rate:
+                if self.samples > 0:
+                    options = {"temperature": CURATION_SAMPLE_TEMPERATURE}
+                    sampled = await asyncio.gather(*(self._chat(model, text, options) for _ in range(self.samples)))
+                    agreements = [tag_jaccard(tags, parse_model_output(s)[0]) for s in sampled if s is not None]
+                    if agreements:
+                        sample_disagreement = 1.0 - sum(agreements) / len(agreements)
+                if self.candidate_model and self.candidate_model != model:
+                    answer = await self._chat(self.candidate_model, text, {"temperature": 0.0})
+                    if answer is not None:
+                        candidate_disagreement = 1.0 - tag_jaccard(tags, parse_model_output(answer)[0])
+
+            record = database.AnalysisRecord(
+                model=model,
+                input_text=text,
+                input_hash=input_hash(text),
+                raw_output=raw_output,
+                techniques=tags,
+                reasoning=reasoning,
+                parse_status=parse_status,
+                mean_logprob=avg_logprob,
+                sample_disagreement=sample_disagreement,
+                candidate_disagreement=candidate_disagreement,
+                uncertainty=uncertainty_score(parse_status, avg_logprob, sample_disagreement, candidate_disagreement),
+                **fields,
+            )
+            # Batched insert by the writer thread
+            self.writer.add(record)
+        except Exception as e:
+            print(f"ERROR: Could not log analysis for curation: {e}")
+
+    async def _chat(self, model, text, options):
+        try:
+            response = await self.backend.chat(text, model=model, options=options)
+            return response.get("message", {}).get("content", "")
+        except Exception as e:
+            print(f"ERROR: Curation probe on {model} failed: {e}")
+            return None
+
+    def queue(self, limit: int = 50, include_exported: bool = False):
+        """Most uncertain logged inputs first, one entry per distinct input."""
+        db = self.session_factory()
+        try:
+            # Answers served from a cache carry no uncertainty signals
+            query = db.query(database.AnalysisRecord).filter(database.AnalysisRecord.uncertainty.isnot(None))
+            if not include_exported:
+                query = query.filter(database.AnalysisRecord.exported.isnot(True))
+            query = query.order_by(database.AnalysisRecord.uncertainty.desc(), database.AnalysisRecord.id.desc())
+
+            records, seen = [], set()
+            for record in query.yield_per(200):
+                if record.input_hash in seen:
+                    continue
+                seen.add(record.input_hash)
+                db.expunge(record)
+                records.append(record)
+                if len(records) >= limit:
+                    break
+            return records
+        finally:
+            db.close()
+
+    def mark_exported(self, ids):
+        db = self.session_factory()
+        try:
+            (db.query(database.AnalysisRecord)
+             .filter(database.AnalysisRecord.id.in_(list(ids)))
+             .update({"exported": True}, synchronize_session=False))
+            db.commit()
+        finally:
+            db.close()
+
+
+def to_upload_row(record) -> dict:
+    """
+    JSONL row in the format /training/upload accepts. The model's answer is the pre-label
+    the expert corrects; unknown tags are dropped so the file passes validation as is.
+    """
+    output = {
+        "reasoning": record.reasoning or "",
+        "discovered_techniques": [t for t in (record.techniques or []) if t in TECHNIQUES],
+    }
+    return {"input": record.input_text, "output": json.dumps(output, ensure_ascii=False)}
+
+
+def queue_entry(record) -> dict:
+    return {
+        "id": record.id,
+        "created_at": record.created_at.isoformat() if record.created_at else None,
+        "uncertainty": record.uncertainty,
+        "parse_status": record.parse_status,
+        "mean_logprob": record.mean_logprob,
+        "sample_disagreement": record.sample_disagreement,
+        "candidate_disagreement": record.candidate_disagreement,
+        "techniques": record.techniques,
+        "input_preview": (record.input_text or "")[:200],
+    }
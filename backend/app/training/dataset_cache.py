@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import random
+import shutil
+import time
+
+# Bump when the preprocessing below changes so old caches aren't reused
+CACHE_FORMAT_VERSION = 1
+BATCHING_MODES = ("default", "group_by_length", "packing")
+CLIP_REPORT_NAME = "clip_report.json"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(dataset_path: str, tokenizer, template_id: str, max_seq_length: int) -> str:
+    """Dataset content + tokenizer + chat template + formatting/truncation -> cache directory name."""
+    parts = {
+        "version": CACHE_FORMAT_VERSION,
+        "dataset": file_sha256(dataset_path),
+        "tokenizer": getattr(tokenizer, "name_or_path", type(tokenizer).__name__),
+        "vocab_size": len(tokenizer),
+        "chat_template": getattr(tokenizer, "chat_template", None) or "",
+        "template_id": template_id,
+        "max_seq_length": max_seq_length,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+def padding_ratio(lengths, batch_size: int) -> float:
+    """Share of pad tokens when `lengths` are batched in the given order and padded to the longest."""
+    padded = real = 0
+    for i in range(0, len(lengths), batch_size):
+        batch = lengths[i:i + batch_size]
+        padded += max(batch) * len(batch)
+        real += sum(batch)
+    return 1.0 - real / padded if padded else 0.0
+
+
+def grouped_order(lengths, batch_size: int, seed: int = 3407):
+    """
+    Approximates transformers' LengthGroupedSampler: shuffle, then sort by length inside
+    megabatches of 50 batches, so batches hold similar lengths without a fixed order.
+    """
+    indices = list(range(len(lengths)))
+    random.Random(seed).shuffle(indices)
+    megabatch = batch_size * 50
+    ordered = []
+    for i in range(0, len(indices), megabatch):
+        ordered.extend(sorted(indices[i:i + megabatch], key=lambda j: -lengths[j]))
+    return ordered
+
+
+def pack_examples(dataset, max_seq_length: int, separator_id: int = None):
+    """
+    First-fit-decreasing packing of whole examples into rows of up to `max_seq_length`
+    tokens. Examples are never split, so every packed row still ends on an example boundary.
+
+    Examples in a row are joined with `separator_id` (EOS) and get their own position_ids
+    starting at 0. The attention mask still covers the whole row: only attention kernels
+    that split rows on position_ids (flash-attention varlen) keep an example from attending
+    to the ones before it; elsewhere the EOS is the only boundary the model sees.
+    """
+    lengths = dataset["length"]
+    input_ids = dataset["input_ids"]
+    joint = 1 if separator_id is not None else 0
+    bins = []  # [free_tokens, [row indices]]
+    for idx in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        for b in bins:
+            if b[0] >= lengths[idx] + joint:
+                b[0] -= lengths[idx] + joint
+                b[1].append(idx)
+                break
+        else:
+            bins.append([max_seq_length - lengths[idx], [idx]])
+
+    packed = {"input_ids": [], "attention_mask": [], "position_ids": [], "length": []}
+    for _, members in bins:
+        ids, positions = [], []
+        for n, idx in enumerate(members):
+            example = list(input_ids[idx])
+            if n > 0 and joint:
+                # The separator ends the previous example, so it takes the next position there
+                ids.append(separator_id)
+                positions.append(positions[-1] + 1)
+            ids.extend(example)
+            positions.extend(range(len(example)))
+        packed["input_ids"].append(ids)
+        packed["attention_mask"].append([1] * len(ids))
+        packed["position_ids"].append(positions)
+        packed["length"].append(len(ids))
+    from datasets import Dataset
+    return Dataset.from_dict(packed)
+
+
+class TokenizedDatasetCache:
+    """
+    Memory-mapped Arrow cache of chat-formatted, tokenized training examples.
+
+    The trainer used to re-run apply_chat_template, truncation and tokenization on every
+    run; now they run once per (dataset, tokenizer, template) and later runs on the same
+    upload just map the saved Arrow files.
+    """
+
+    def __init__(self, cache_dir: str = "./model/dataset_cache"):
+        self.cache_dir = cache_dir
+
+    def load(self, dataset_path: str, tokenizer, format_fn, template_id: str, max_seq_length: int,
+             clip_report=None):
+        """
+        `format_fn(input_text, output_text) -> str` renders one example with the chat template.
+        `clip_report` (truncation.ClipReport) is filled by format_fn while building and is
+        stored with the cache, so a cache hit still reports clipping.
+        Returns (dataset with input_ids/attention_mask/length, stats dict).
+        """
+        from datasets import load_from_disk
+
+        started = time.perf_counter()
+        key = cache_key(dataset_path, tokenizer, template_id, max_seq_length)
+        path = os.path.join(self.cache_dir, key)
+
+        if os.path.isdir(path):
+            dataset = load_from_disk(path)
+            cache_hit = True
+        else:
+            dataset = self._build(dataset_path, tokenizer, format_fn, max_seq_length, path, clip_report)
+            cache_hit = False
+
+        elapsed = time.perf_counter() - started
+        lengths = dataset["length"]
+        stats = {
+            "cache_key": key,
+            "cache_hit": cache_hit,
+            "examples": len(dataset),
+            "tokens": sum(lengths),
+            "max_length": max(lengths) if lengths else 0,
+            "preprocess_seconds": round(elapsed, 2),
+            "preprocess_tokens_per_sec": round(sum(lengths) / elapsed, 1) if elapsed > 0 else None,
+        }
+        clip_path = os.path.join(path, CLIP_REPORT_NAME)
+        if os.path.exists(clip_path):
+            with open(clip_path, "r", encoding="utf-8") as f:
+                stats["clipping"] = json.load(f)
+        print(f"DEBUG: Dataset cache {'hit' if cache_hit else 'miss'} ({key}): "
+              f"{stats['examples']} examples, {stats['tokens']} tokens in {stats['preprocess_seconds']}s")
+        return dataset, stats
+
+    def _build(self, dataset_path, tokenizer, format_fn, max_seq_length, path, clip_report):
+        from datasets import load_dataset, load_from_disk
+
+        raw = load_dataset("json", data_files=dataset_path, split="train")
+
+        def tokenize(examples):
+            texts = [format_fn(i, o) for i, o in zip(examples["input"], examples["output"])]
+            encoded = tokenizer(texts, truncation=True, max_length=max_seq_length, add_special_tokens=False)
+            encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+            return encoded
+
+        dataset = raw.map(tokenize, batched=True, remove_columns=raw.column_names)
+
+        # Write to a temp dir first so an interrupted run never leaves a half cache behind
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        dataset.save_to_disk(tmp_path)
+        if clip_report is not None:
+            with open(os.path.join(tmp_path, CLIP_REPORT_NAME), "w", encoding="utf-8") as f:
+                json.dump(clip_report.to_dict(), f)
+        os.replace(tmp_path, path)
+        return load_from_disk(path)
+
+
+def prepare_batching(dataset, mode: str, batch_size: int, max_seq_length: int, separator_id: int = None):
+    """
+    Applies the batching mode and compares padding against the old path (arrival order).
+    group_by_length itself is done by the Trainer's sampler; here it is only simulated
+    for the report. `separator_id` joins packed examples (see pack_examples).
+    Returns (dataset to train on, stats dict).
+    """
+    if mode not in BATCHING_MODES:
+        raise ValueError(f"Unknown batching mode: {mode}")
+
+    lengths = dataset["length"]
+    stats = {
+        "batching": mode,
+        "batch_size": batch_size,
+        "padding_ratio_default": round(padding_ratio(lengths, batch_size), 4),
+    }
+    if mode == "group_by_length":
+        order = grouped_order(lengths, batch_size)
+        stats["padding_ratio"] = round(padding_ratio([lengths[i] for i in order], batch_size), 4)
+    elif mode == "packing":
+        dataset = pack_examples(dataset, max_seq_length, separator_id)
+        stats["padding_ratio"] = round(padding_ratio(dataset["length"], batch_size), 4)
+        stats["packed_rows"] = len(dataset)
+    else:
+        stats["padding_ratio"] = stats["padding_ratio_default"]
+    return dataset, stats
@@ -1,6 +1,5 @@
 import json
 import re
-from sklearn.metrics import f1_score
 from typing import List, Dict
 
 class AutoBenchmarker:
@@ -44,6 +43,7 @@ class AutoBenchmarker:
         }
 
     def calculate_f1(self, predicted: List[str], actual: List[str]) -> float:
+        from sklearn.metrics import f1_score
         predicted = [str(t) for t in predicted]
         actual = [str(t) for t in actual]
         
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import Counter
+
+from .truncation import CharTokenizer
+
+# Tags the model is trained on (see the system prompt in benchmark.format_prompt)
+TECHNIQUES = (
+    "REFERENCE_ERROR", "WHATABOUTISM", "STRAWMAN", "EMOTIONAL_CONTENT", "CHERRY_PICKING",
+    "FALSE_CAUSE", "MISLEADING_CLICKBAIT", "ANECDOTE", "LEADING_QUESTIONS", "EXAGGERATION",
+    "QUOTE_MINING",
+)
+
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_REPORTED_ERRORS = 20
+TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096)
+# Dedup index, kept next to the uploads
+HASH_INDEX_NAME = "example_hashes.txt"
+
+
+class IngestionError(Exception):
+    def __init__(self, status_code: int, message: str, errors: list = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.errors = errors or []
+
+    def to_detail(self):
+        return {"message": self.message, "errors": self.errors}
+
+
+def strip_code_fence(text: str) -> str:
+    return text.replace("```json", "").replace("```", "").strip()
+
+
+def token_bucket(n_tokens: int) -> str:
+    lower = 0
+    for upper in TOKEN_BUCKETS:
+        if n_tokens < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+def example_hash(input_text: str, output_text: str) -> str:
+    # Whitespace-normalized so re-exports of the same example still match
+    key = json.dumps([" ".join(input_text.split()), " ".join(output_text.split())], ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def validate_example(line: str):
+    """
+    Checks one JSONL line against the training format:
+    {"input": "<article>", "output": "{\"reasoning\": ..., \"discovered_techniques\": [...]}"}
+    Returns (row, tags); raises ValueError with a readable reason otherwise.
+    """
+    try:
+        row = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"invalid JSON ({e})")
+    if not isinstance(row, dict):
+        raise ValueError("row is not a JSON object")
+
+    for key in ("input", "output"):
+        if not isinstance(row.get(key), str) or not row[key].strip():
+            raise ValueError(f"'{key}' must be a non-empty string")
+
+    try:
+        output = json.loads(strip_code_fence(row["output"]))
+    except ValueError:
+        raise ValueError("'output' is not a JSON object")
+    if not isinstance(output, dict) or "discovered_techniques" not in output:
+        raise ValueError("'output' has no 'discovered_techniques'")
+
+    tags = output["discovered_techniques"]
+    if not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        raise ValueError("'discovered_techniques' must be a list of strings")
+    unknown = sorted(set(tags) - set(TECHNIQUES))
+    if unknown:
+        raise ValueError(f"unknown techniques: {', '.join(unknown)}")
+    return row, tags
+
+
+class ExampleHashIndex:
+    """
+    Content hashes of every example trained on so far, kept in memory and appended to a
+    text file (one hash per line) so deduplication survives restarts. The training leader
+    appends them once a run completes; refresh() picks up what other processes appended.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._hashes = set()
+        self._offset = 0
+        self.refresh()
+
+    def refresh(self):
+        with self._lock:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) <= self._offset:
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            # Whole lines only; one still being written is read next time
+            end = data.rfind(b"\n") + 1
+            self._offset += end
+            self._hashes.update(line.strip() for line in data[:end].decode("utf-8").splitlines() if line.strip())
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._hashes
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add_many(self, digests):
+        with self._lock:
+            new = [d for d in digests if d not in self._hashes]
+            if not new:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(new) + "\n")
+            self._hashes.update(new)
+
+
+def record_trained_examples(dataset_path: str) -> int:
+    """
+    Adds the examples of an upload whose run completed to the dedup index next to it.
+    Until then the same file can be uploaded again, e.g. after a failed or cancelled run.
+    """
+    digests = []
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                digests.append(example_hash(row["input"], row["output"]))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+    ExampleHashIndex(os.path.join(os.path.dirname(dataset_path), HASH_INDEX_NAME)).add_many(digests)
+    return len(digests)
+
+
+class UploadIngestor:
+    """
+    Streams an uploaded JSONL dataset to disk in chunks and validates it line by line
+    while it arrives, so a broken file is rejected before any GPU job is queued.
+
+    Only new examples are written: rows trained on in an earlier completed run (or
+    earlier in the same file) are dropped by content hash. The file lands under its final name only
+    after the whole upload passed; the returned stats describe what will be trained on.
+    """
+
+    def __init__(self, upload_dir: str = "uploads", max_bytes: int = MAX_UPLOAD_MB * 1024 * 1024,
+                 hash_index: ExampleHashIndex = None, tokenizer=None, contamination_index=None):
+        self.upload_dir = upload_dir
+        # truncation.load_tokenizer() result; lengths are estimated from characters without one
+        self.tokenizer = tokenizer or CharTokenizer()
+        # near_dup.MinHashIndex over the benchmark test set; near-copies are kept out of training
+        self.contamination_index = contamination_index
+        self.max_bytes = max_bytes
+        self.hash_index = hash_index or ExampleHashIndex(os.path.join(upload_dir, HASH_INDEX_NAME))
+
+    async def ingest(self, upload, filename: str):
+        """
+        `upload` is anything with an async read(size) (FastAPI's UploadFile).
+        Returns (path, stats); the file is stored as <name>_<random hex>.jsonl.
+        """
+        filename = os.path.basename(filename or "")
+        if not filename.endswith(".jsonl"):
+            raise IngestionError(400, "Only .jsonl files are accepted")
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        # Runs that completed since the last upload (possibly on another worker)
+        await asyncio.to_thread(self.hash_index.refresh)
+        # Unique per upload: runs (queued or finished), the replay buffer and the semantic index
+        # keep pointing at their file, and the curation export always has the same name
+        final_path = os.path.join(self.upload_dir, f"{filename[:-len('.jsonl')]}_{uuid.uuid4().hex[:12]}.jsonl")
+        part_path = os.path.join(self.upload_dir, f".{uuid.uuid4().hex}.part")
+
+        state = {
+            "line_no": 0, "rows": 0, "duplicates": 0, "errors": [], "invalid": 0,
+            "seen": set(), "labels": Counter(), "token_hist": Counter(),
+            "input_tokens": 0, "max_input_tokens": 0, "contaminated": [],
+        }
+        received = 0
+        tail = b""
+        try:
+            with open(part_path, "wb") as out:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        raise IngestionError(413, f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+
+                    lines = (tail + chunk).split(b"\n")
+                    tail = lines.pop()
+                    # Parsing and disk writes run off the event loop
+                    accepted = await asyncio.to_thread(self._process_lines, lines, state)
+                    if accepted:
+                        await asyncio.to_thread(out.write, accepted)
+                if tail.strip():
+                    accepted = await asyncio.to_thread(self._process_lines, [tail], state)
+                    if accepted:
+                        await asyncio.to_thread(out.write, accepted)
+
+            if state["invalid"]:
+                raise IngestionError(422, f"{state['invalid']} invalid row(s) in {filename}", state["errors"])
+            if state["rows"] == 0:
+                if state["contaminated"] and not state["duplicates"]:
+                    message = "All new examples are near-copies of test set documents"
+                elif state["duplicates"] or state["contaminated"]:
+                    message = "All examples were uploaded before or overlap the test set"
+                else:
+                    message = "The file contains no examples"
+                raise IngestionError(422, message)
+
+            os.replace(part_path, final_path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+        return final_path, self._stats(state, received)
+
+    def _process_lines(self, lines, state) -> bytes:
+        accepted = []
+        for raw in lines:
+            state["line_no"] += 1
+            line = raw.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            try:
+                row, tags = validate_example(line)
+            except ValueError as e:
+                state["invalid"] += 1
+                if len(state["errors"]) < MAX_REPORTED_ERRORS:
+                    state["errors"].append({"line": state["line_no"], "error": str(e)})
+                continue
+            # Keep validating after the first error so the user gets all problems at once,
+            # but stop collecting rows that won't be used
+            if state["invalid"]:
+                continue
+
+            digest = example_hash(row["input"], row["output"])
+            if digest in self.hash_index or digest in state["seen"]:
+                state["duplicates"] += 1
+                continue
+            state["seen"].add(digest)
+
+            if self.contamination_index is not None:
+                match = self.contamination_index.best_match(self.contamination_index.signature(row["input"]))
+                if match is not None:
+                    # Training on a near-copy of a test article would inflate the benchmark F1
+                    state["contaminated"].append({"line": state["line_no"], "test_doc": match[0],
+                                                  "similarity": round(match[1], 3)})
+                    continue
+
+            state["rows"] += 1
+            for tag in tags:
+                state["labels"][tag] += 1
+            if not tags:
+                state["labels"]["NONE"] += 1
+            n_tokens = len(self.tokenizer.encode(row["input"]))
+            state["token_hist"][token_bucket(n_tokens)] += 1
+            state["input_tokens"] += n_tokens
+            state["max_input_tokens"] = max(state["max_input_tokens"], n_tokens)
+            accepted.append(json.dumps({"input": row["input"], "output": row["output"]}, ensure_ascii=False))
+
+        return ("\n".join(accepted) + "\n").encode("utf-8") if accepted else b""
+
+    def _stats(self, state, received):
+        buckets = [token_bucket(0)] + [token_bucket(b) for b in TOKEN_BUCKETS]
+        return {
+            "bytes": received,
+            "rows": state["rows"],
+            "duplicates_skipped": state["duplicates"],
+            "test_contamination_skipped": len(state["contaminated"]),
+            "test_contamination": state["contaminated"][:MAX_REPORTED_ERRORS],
+            "known_examples": len(self.hash_index),
+            "label_distribution": dict(state["labels"].most_common()),
+            "token_length_histogram": {b: state["token_hist"].get(b, 0) for b in buckets},
+            "mean_input_tokens": round(state["input_tokens"] / state["rows"], 1),
+            "max_input_tokens": state["max_input_tokens"],
+            "tokenizer": self.tokenizer.name,
+        }
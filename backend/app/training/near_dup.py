@@ -0,0 +1,261 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+NUM_PERM = 128
+LSH_BANDS = 16  # 16 bands x 8 rows: candidates from ~0.7 Jaccard upwards
+SHINGLE_WORDS = 5
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.85"))
+# A capped index compacts once it holds this much more than max_items
+COMPACT_SLACK = 1.25
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_words(text: str) -> list:
+    """Lowercased words without punctuation, so reformatted copies shingle the same."""
+    return _WORD.findall(text.lower())
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    words = normalize_words(text)
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def file_fingerprint(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MinHashIndex:
+    """
+    MinHash signatures of article shingles with banded LSH buckets for near-duplicate lookup.
+
+    Syndicated copies that only differ in headers, footers or whitespace share most of
+    their 5-word shingles, so their estimated Jaccard similarity stays high where an
+    exact hash misses them. Inserts are appended to a JSONL file (one signature per line),
+    so adding an item never rewrites the index; loading replays the file.
+
+    With `max_items`, the index is compacted once it holds COMPACT_SLACK times that:
+    the newest `max_items` keys are kept and the file is rewritten with just them.
+    Several processes may share the file (API workers): each appends its inserts in one
+    write and compaction replays the file first, so other workers' entries survive it;
+    only entries appended while the file is being rewritten are lost, and a worker sees
+    other workers' entries after its next compaction or restart.
+    """
+
+    def __init__(self, path: str = None, num_perm: int = NUM_PERM, bands: int = LSH_BANDS,
+                 threshold: float = NEAR_DUP_THRESHOLD, seed: int = 1, max_items: int = None):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_items = max_items
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE_PRIME
+        self._b = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE_PRIME
+        self._lock = threading.Lock()
+        self._keys = []
+        self._signatures = []
+        self._meta = []
+        self._buckets = [{} for _ in range(bands)]
+        self.header = {}
+        if path and os.path.exists(path) and not self._load():
+            self.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def signature(self, text: str):
+        """uint32[num_perm] MinHash of the text's shingles, or None for texts without words."""
+        grams = shingles(text)
+        if not grams:
+            return None
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        # Universal hashing (a*x + b) mod p per permutation; uint64 overflow wraps, like datasketch
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def insert(self, key: str, signature, meta: dict = None):
+        self.insert_many([(key, signature, meta)])
+
+    def insert_many(self, items):
+        """items: iterable of (key, signature, meta); one append to the file for all of them."""
+        entries = []
+        with self._lock:
+            for key, signature, meta in items:
+                if signature is None:
+                    continue
+                self._add(key, signature, meta or {})
+                entries.append(self._encode(key, signature, meta or {}))
+            if self.path and entries:
+                self._append(entries)
+            if self.max_items and len(self._keys) > self.max_items * COMPACT_SLACK:
+                self._compact()
+
+    def query(self, signature, threshold: float = None):
+        """[(key, similarity, meta)] of indexed items at or above the threshold, best first."""
+        if signature is None:
+            return []
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            candidates = set()
+            for band, bucket in enumerate(self._buckets):
+                candidates.update(bucket.get(self._band_key(signature, band), ()))
+            matches = []
+            for idx in candidates:
+                similarity = float(np.mean(self._signatures[idx] == signature))
+                if similarity >= threshold:
+                    matches.append((self._keys[idx], similarity, self._meta[idx]))
+        return sorted(matches, key=lambda m: -m[1])
+
+    def best_match(self, signature, threshold: float = None):
+        matches = self.query(signature, threshold)
+        return matches[0] if matches else None
+
+    def clear(self, header: dict = None):
+        with self._lock:
+            self._keys, self._signatures, self._meta = [], [], []
+            self._buckets = [{} for _ in range(self.bands)]
+            self.header = header or {}
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"header": self._full_header()}) + "\n")
+
+    def _compact(self):
+        # The file has every worker's inserts; without one, memory is all there is
+        entries = self._read() if self.path and os.path.exists(self.path) else None
+        if entries is None:
+            entries = list(zip(self._keys, self._signatures, self._meta))
+        latest = {}
+        for key, signature, meta in entries:
+            # Re-inserted keys move to the end, like a fresh insert
+            latest.pop(key, None)
+            latest[key] = (signature, meta)
+        kept = list(latest.items())[-self.max_items:]
+        self._keys, self._signatures, self._meta = [], [], []
+        self._buckets = [{} for _ in range(self.bands)]
+        for key, (signature, meta) in kept:
+            self._add(key, signature, meta)
+        if self.path:
+            self._rewrite()
+        print(f"DEBUG: Compacted {self.path or 'index'}: kept {len(kept)} of {len(entries)} entries")
+
+    def _rewrite(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"header": self._full_header()}) + "\n")
+                for key, signature, meta in zip(self._keys, self._signatures, self._meta):
+                    f.write(json.dumps(self._encode(key, signature, meta), ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # e.g. another process holds the file open on Windows; the next compaction tries again
+            print(f"ERROR: Could not compact {self.path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _encode(key, signature, meta):
+        return {"key": key, "sig": base64.b64encode(signature.tobytes()).decode("ascii"), "meta": meta}
+
+    def _band_key(self, signature, band):
+        return signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _add(self, key, signature, meta):
+        idx = len(self._keys)
+        self._keys.append(key)
+        self._signatures.append(signature)
+        self._meta.append(meta)
+        for band in range(self.bands):
+            self._buckets[band].setdefault(self._band_key(signature, band), []).append(idx)
+
+    def _full_header(self):
+        return dict(self.header, num_perm=self.num_perm, bands=self.bands)
+
+    def _append(self, entries):
+        new_file = not os.path.exists(self.path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lines = [json.dumps({"header": self._full_header()})] if new_file else []
+        lines += [json.dumps(entry, ensure_ascii=False) for entry in entries]
+        # One write, so lines of workers appending to the same file don't interleave
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _load(self):
+        entries = self._read()
+        if entries is None:
+            return False
+        for entry in entries:
+            self._add(*entry)
+        if self.max_items and len(self._keys) > self.max_items:
+            self._compact()
+        return True
+
+    def _read(self):
+        """(key, signature, meta) per entry of the file; None when it was built with other settings."""
+        entries = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line after a crash
+                    continue
+                if "header" in entry:
+                    header = entry["header"]
+                    if header.get("num_perm") != self.num_perm or header.get("bands") != self.bands:
+                        print(f"DEBUG: {self.path} was built with other MinHash settings, discarding it")
+                        return None
+                    self.header = {k: v for k, v in header.items() if k not in ("num_perm", "bands")}
+                    continue
+                signature = np.frombuffer(base64.b64decode(entry["sig"]), dtype=np.uint32)
+                entries.append((entry["key"], signature, entry.get("meta") or {}))
+        return entries
+
+
+def reference_index(source_path: str, index_path: str, threshold: float = NEAR_DUP_THRESHOLD) -> MinHashIndex:
+    """
+    Index over the inputs of a JSONL dataset (the benchmark test set), rebuilt only when
+    the dataset file changed since the persisted index was written.
+    """
+    index = MinHashIndex(index_path, threshold=threshold)
+    if not os.path.exists(source_path):
+        print(f"DEBUG: {source_path} not found, contamination check disabled")
+        return index
+
+    fingerprint = file_fingerprint(source_path)
+    if index.header.get("source_sha256") == fingerprint:
+        return index
+
+    index.clear(header={"source": source_path, "source_sha256": fingerprint})
+    items = []
+    with open(source_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict) and isinstance(row.get("input"), str):
+                items.append((f"{os.path.basename(source_path)}:{line_no}", index.signature(row["input"]), None))
+    index.insert_many(items)
+    print(f"DEBUG: Indexed {len(index)} documents of {source_path} for contamination checks")
+    return index
@@ -1,258 +1,653 @@
 import os
 import json
-import subprocess
+import asyncio
 import httpx
 from datetime import datetime
-from sqlalchemy.orm import Session
-from ..db import database
+from .progress_bus import ProgressBus
+from .baseline import BaselineMetricsStore, load_report_metrics, BASELINE_REPORT_NAME
+from .run_store import RunStateStore, TERMINAL_STAGES, RUN_HOST, on_this_host, pid_alive
+from .scheduler import GpuScheduler
+from .replay import build_replay_mix, latest_checkpoint
+from .ingestion import record_trained_examples
+from .supervisor import ProcessSupervisor, ProcessResult, kill_process_tree
+from .core import get_project_root
+from .truncation import TRUNCATION_STRATEGY
+
+# Upper bounds for supervised processes (seconds)
+TRAINING_TIMEOUT_SECONDS = int(os.getenv("TRAINING_TIMEOUT_SECONDS", str(6 * 3600)))
+BENCHMARK_TIMEOUT_SECONDS = int(os.getenv("BENCHMARK_TIMEOUT_SECONDS", str(2 * 3600)))
+CONVERSION_TIMEOUT_SECONDS = int(os.getenv("CONVERSION_TIMEOUT_SECONDS", str(3600)))
+# Precision of the promoted adapter GGUF (k-quants end up as q8_0, see converter.lora_outtype)
+ADAPTER_QUANT_METHOD = os.getenv("ADAPTER_QUANT_METHOD", "q4_k_m")
+# default | group_by_length | packing (see dataset_cache.prepare_batching)
+TRAINING_BATCHING = os.getenv("TRAINING_BATCHING", "default")
+TRAINING_BATCH_SIZE = int(os.getenv("TRAINING_BATCH_SIZE", "1"))
+# Incremental runs: fewer epochs and a lower LR on top of the current adapter
+INCREMENTAL_EPOCHS = float(os.getenv("INCREMENTAL_EPOCHS", "1"))
+INCREMENTAL_LEARNING_RATE = float(os.getenv("INCREMENTAL_LEARNING_RATE", "1e-4"))
+# Snapshot of the adapter that is live in Ollama (model/latest/adapter is overwritten by every run)
+DEPLOYED_ADAPTER_DIR = os.path.join("model", "deployed", "adapter")
+# One output directory per run, so a queued run can't overwrite an adapter still waiting for promotion
+TRAINING_OUTPUT_DIR = os.path.join("model", "runs")
+
+
+class DeploymentConflict(Exception):
+    """Another deployment is running, or the training lifecycle is busy with a run."""
+
+def to_wsl(path):
+    # WSL Path Converter
+    return path.replace("\\", "/").replace("c:", "/mnt/c").replace("C:", "/mnt/c")
+
+def get_host_ip():
+    # Dynamically get Host IP for WSL to call back
+    import socket
+    try:
+        # This usually gets the LAN IP (e.g. 192.168.x.x) which is reachable from WSL
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return "127.0.0.1" # Fallback
+
+# Original training set, always part of the replay mix (the API runs from backend/, the dataset is in the project root)
+REPLAY_BASE_DATASET = os.getenv("REPLAY_BASE_DATASET", os.path.join(get_project_root(), "model", "dataset", "mipd_train.jsonl"))
 
 class MLOpsOrchestrator:
-    def __init__(self, db: Session):
-        self.db = db
-        # Runtime state (in-memory for simplicity, use Redis for prod)
+    def __init__(self):
+        # No session of its own: the run store / writers open one per operation on their thread
+        # Status snapshots are pushed to SSE subscribers instead of being polled
+        self.progress_bus = ProgressBus()
+        # Runtime state lives in memory for fast reads and is mirrored into TrainingRun
+        self.run_store = RunStateStore()
+        self.current_run_id = None
+        self._status = "idle"
         self.training_progress = 0
         self.evaluation_progress = 0
         self.baseline_f1_non_empty = 0.0
         self.baseline_exact_match = 0.0
         self.new_f1_non_empty = 0.0
         self.new_exact_match = 0.0
-        self.status = "idle" # idle, training, evaluating, ready_to_promote
         self.latest_adapter_path = None
+        self.train_mode = "full"
+        self.cycle_seconds = None
+        self.f1_retention = None
+        # Baseline only changes on deployment, so it is kept in memory (JSON-backed)
+        self.reports_dir = os.path.join(get_project_root(), "model", "benchmark-reports")
+        self.baseline_store = BaselineMetricsStore(self.reports_dir)
+        # Training and benchmark jobs wait for a GPU slot instead of being rejected
+        self.scheduler = GpuScheduler(self.launch_job)
+        # Trainer, benchmark and converter run as supervised asyncio subprocesses
+        self.supervisor = ProcessSupervisor()
+        self.run_jobs = {}  # run_id -> job currently owning the GPU for that run
+        # Run id (or "quantization") being deployed; set before the first await, so deploys never overlap
+        self.deploying = None
+        # idle, training, evaluating, ready_to_promote, deploying, deployment_success, deployment_error
+        self.restore_state()
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        # Every state transition is persisted right away and pushed to subscribers
+        self._status = value
+        self.persist_state(immediate=True)
+        self.publish_status()
+
+    def persist_state(self, immediate: bool = False, **extra):
+        self.run_store.update(
+            self.current_run_id,
+            immediate=immediate,
+            stage=self._status,
+            training_progress=self.training_progress,
+            evaluation_progress=self.evaluation_progress,
+            f1_score_after=self.new_f1_non_empty,
+            exact_match_after=self.new_exact_match,
+            adapter_path=self.latest_adapter_path,
+            cycle_seconds=self.cycle_seconds,
+            f1_retention=self.f1_retention,
+            **extra
+        )
+
+    def restore_state(self):
+        """
+        Reloads the last run after a backend restart and reconciles it with the
+        processes that are (or are no longer) running.
+        """
+        run = self.run_store.latest_run()
+        if run is not None and run.stage:
+            self.restore_run(run)
+        else:
+            self.publish_status()
+
+        # Conversion and `ollama create` died with the previous backend; promotion can be retried
+        for stuck in self.run_store.runs_in_stage("deploying"):
+            print(f"DEBUG: Run {stuck.id} was interrupted during deployment, back to ready_to_promote")
+            self.set_run_stage(stuck.id, "ready_to_promote")
+
+        # Uploads that were still waiting for the GPU go back into the queue
+        for queued_run in self.run_store.runs_in_stage("queued"):
+            job = self.scheduler.submit("training", {"run_id": queued_run.id, "file_path": queued_run.dataset_path,
+                                                     "mode": queued_run.train_mode or "full"})
+            print(f"DEBUG: Re-queued run {queued_run.id} as job {job.id}")
+
+    def restore_run(self, run):
+
+        self.current_run_id = run.id
+        self.training_progress = run.training_progress or 0
+        self.evaluation_progress = run.evaluation_progress or 0
+        self.new_f1_non_empty = run.f1_score_after or 0.0
+        self.new_exact_match = run.exact_match_after or 0.0
+        self.latest_adapter_path = run.adapter_path
+        self.load_cycle_report(run)
+
+        if run.stage in TERMINAL_STAGES:
+            self._status = run.stage
+            self.publish_status()
+            return
+
+        if run.stage == "deploying":
+            # Handed back to ready_to_promote by restore_state()
+            self._status = run.stage
+        elif not on_this_host(run):
+            # Its PID means nothing here: neither reconcile it as dead nor hand its GPU to the next job.
+            # Trainer callbacks still reach us; a cancel frees the slot if that process is gone.
+            print(f"ERROR: Run {run.id} is {run.stage} on host {run.host} (PID {run.pid}), this leader runs on "
+                  f"{RUN_HOST} and can't watch it; POST /training/cancel if it is no longer running")
+            self._status = run.stage
+            self.publish_status()
+            kind = "training" if run.stage == "training" else "benchmark"
+            self.run_jobs[run.id] = self.scheduler.adopt(kind, {"run_id": run.id, "adapter_path": run.adapter_path})
+        elif pid_alive(run.pid):
+            print(f"DEBUG: Run {run.id} is still {run.stage} (PID {run.pid}), re-attaching")
+            self._status = run.stage
+            self.publish_status()
+            # The orphaned process still holds the GPU
+            kind = "training" if run.stage == "training" else "benchmark"
+            job = self.scheduler.adopt(kind, {"run_id": run.id, "adapter_path": run.adapter_path})
+            self.run_jobs[run.id] = job
+            self.watch_orphaned_process(run.id, run.pid, run.start_time, job)
+        else:
+            self._status = run.stage
+            self.reconcile_finished_run(run.id, run.start_time)
+
+    def watch_orphaned_process(self, run_id: int, pid: int, started_at: datetime, job):
+        """Polls a process started by a previous backend instance until it exits."""
+        import threading
+        import time
+
+        def watch():
+            while pid_alive(pid):
+                time.sleep(5)
+            # A trainer that called /training/complete has already handed over to the benchmark
+            if self.run_jobs.get(run_id) is job:
+                self.run_jobs.pop(run_id, None)
+                if self.current_run_id == run_id:
+                    self.reconcile_finished_run(run_id, started_at)
+                self.scheduler.complete(job, success=self.status != "idle")
+
+        threading.Thread(target=watch, daemon=True).start()
+
+    def reconcile_finished_run(self, run_id: int, started_at: datetime):
+        if self.status == "training":
+            # A finished trainer calls /training/complete before exiting, so this one died
+            print(f"ERROR: Training process of run {run_id} exited without completing")
+            self.status = "idle"
+        elif self.status == "evaluating":
+            # Benchmark output went to the old backend's pipe; fall back to the metrics sidecar
+            report_json = self.find_benchmark_metrics(since=started_at)
+            if report_json:
+                metrics = load_report_metrics(report_json)
+                self.new_f1_non_empty = metrics['f1']
+                self.new_exact_match = metrics['em']
+                self.evaluation_progress = 100
+                print(f"DEBUG: Recovered evaluation of run {run_id} from {report_json}")
+                self.run_store.update(run_id, report_path=os.path.splitext(report_json)[0] + ".txt")
+                self.status = "ready_to_promote"
+                self.remember_trained_examples(run_id)
+            else:
+                print(f"ERROR: Benchmark of run {run_id} exited without a report")
+                self.status = "idle"
+
+    def find_benchmark_metrics(self, since: datetime = None):
+        if not os.path.exists(self.reports_dir):
+            return None
+        candidates = []
+        for f in os.listdir(self.reports_dir):
+            if f.startswith("benchmark_report_") and f.endswith(".json"):
+                path = os.path.join(self.reports_dir, f)
+                if since is None or datetime.utcfromtimestamp(os.path.getmtime(path)) >= since:
+                    candidates.append(path)
+        if not candidates:
+            return None
+        return max(candidates, key=os.path.getmtime)
 
     def get_status(self):
-        baseline = self.read_baseline_metrics()
+        baseline = self.baseline_store.get()
         return {
             "status": self.status,
+            "run_id": self.current_run_id,
+            "queued_jobs": len(self.scheduler.snapshot()["queued"]),
             "training_progress": self.training_progress,
             "evaluation_progress": self.evaluation_progress,
             "baseline_f1_non_empty": baseline['f1'],
             "baseline_exact_match": baseline['em'],
             "new_f1_non_empty": self.new_f1_non_empty,
-            "new_exact_match": self.new_exact_match
+            "new_exact_match": self.new_exact_match,
+            "train_mode": self.train_mode,
+            "cycle_seconds": self.cycle_seconds,
+            "f1_retention": self.f1_retention
         }
 
-    def read_baseline_metrics(self):
-        result = {'f1': 0.0, 'em': 0.0}
-        try:
-            # Point to the xai-adapter report by default as requested
-            report_path = r"c:\Users\vadim\Documents\Vadym\GitRep\projekt-inzynierski\model\benchmark-reports\current_baseline_report.txt"
-            with open(report_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                
-                # Parse "Exact-Match Accuracy: 0.7318 (1113/1521)"
-                import re
-                match_em = re.search(r"Exact-Match Accuracy: (\d+\.\d+)", content)
-                if match_em:
-                    result['em'] = float(match_em.group(1))
-                    
-                # Parse "Mean Document-Level F1 (excluding empty gold-label docs): 0.2847"
-                match_f1 = re.search(r"Mean Document-Level F1 \(excluding empty gold-label docs\): (\d+\.\d+)", content)
-                if match_f1:
-                    result['f1'] = float(match_f1.group(1))
-                    
-                
-            return result
-        except:
-            return result
+    def publish_status(self):
+        self.progress_bus.publish(self.get_status())
 
-    def start_manual_training(self, file_path: str):
-        if self.status not in ["idle", "deployment_success", "deployment_error", "ready_to_promote"]:
-            return False
-            
-        self.status = "training"
+    def activate_run(self, run_id: int):
+        """Points the panel state (status, progress, metrics) at another run."""
+        if run_id == self.current_run_id:
+            return
+        # Flush the outgoing run before its values are replaced
+        self.persist_state(immediate=True)
+        run = self.run_store.get_run(run_id)
+        self.current_run_id = run_id
+        self.training_progress = run.training_progress or 0
+        self.evaluation_progress = run.evaluation_progress or 0
+        self.new_f1_non_empty = run.f1_score_after or 0.0
+        self.new_exact_match = run.exact_match_after or 0.0
+        self.latest_adapter_path = run.adapter_path
+        self.load_cycle_report(run)
+        self._status = run.stage or "idle"
+
+    def load_cycle_report(self, run):
+        self.train_mode = run.train_mode or "full"
+        self.cycle_seconds = run.cycle_seconds
+        self.f1_retention = run.f1_retention
+
+    def set_run_stage(self, run_id: int, stage: str, **fields):
+        """Stage transition for any run; only the active one drives the panel."""
+        if run_id == self.current_run_id:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.status = stage
+        else:
+            columns = {
+                "training_progress": "training_progress",
+                "evaluation_progress": "evaluation_progress",
+                "new_f1_non_empty": "f1_score_after",
+                "new_exact_match": "exact_match_after",
+                "latest_adapter_path": "adapter_path",
+                "cycle_seconds": "cycle_seconds",
+                "f1_retention": "f1_retention",
+            }
+            self.run_store.update(run_id, immediate=True, stage=stage,
+                                  **{columns[name]: value for name, value in fields.items()})
+
+    def start_manual_training(self, file_path: str, priority: int = 0, mode: str = "full"):
+        """
+        Records the run and queues its training job. Returns the scheduler job.
+        mode "incremental" continues from the deployed adapter with a replay buffer.
+        """
+        run_id = self.run_store.create_run(
+            status="queued",
+            stage="queued",
+            dataset_path=file_path,
+            train_mode=mode,
+            f1_score_before=self.baseline_store.get()['f1']
+        )
+        job = self.scheduler.submit("training", {"run_id": run_id, "file_path": file_path, "mode": mode}, priority=priority)
+        self.publish_status()
+        return job
+
+    def cancel_queued_job(self, job_id: int) -> bool:
+        for job in self.scheduler.snapshot()["queued"]:
+            if job["id"] == job_id and self.scheduler.cancel(job_id):
+                self.run_store.update(job["run_id"], immediate=True, stage="cancelled")
+                self.publish_status()
+                return True
+        return False
+
+    def launch_job(self, job) -> bool:
+        # Called by the scheduler once a GPU slot is free
+        if job.kind == "training":
+            return self.launch_training(job)
+        if job.kind == "benchmark":
+            return self.launch_benchmark(job)
+        return False
+
+    def launch_training(self, job) -> bool:
+        run_id = job.payload["run_id"]
+        file_path = job.payload["file_path"]
+
+        # 1. Make the run the active one
+        self.activate_run(run_id)
+        self.run_jobs[run_id] = job
         self.training_progress = 0
         self.evaluation_progress = 0
-        
-        # 1. Record the run
-        new_run = database.TrainingRun(
-            status="running",
-            start_time=datetime.utcnow()
-        )
-        self.db.add(new_run)
-        self.db.commit()
+        self.new_f1_non_empty = 0.0
+        self.new_exact_match = 0.0
+        self.latest_adapter_path = None
+        self.train_mode = job.payload.get("mode", "full")
+        self.cycle_seconds = None
+        self.f1_retention = None
+        self.status = "training"
 
         # 2. Trigger WSL (Linux) training
-        wsl_path = file_path.replace("\\", "/").replace("c:", "/mnt/c").replace("C:", "/mnt/c")
+        extra_args = ""
+        if self.train_mode == "incremental":
+            file_path, extra_args = self.prepare_incremental_run(run_id, file_path)
+        wsl_path = to_wsl(file_path)
         
-        # Logging setup
+        # Logging setup (relative paths resolve the same on both sides, WSL starts in backend/)
         log_dir = "logs"
         os.makedirs(log_dir, exist_ok=True)
-        log_file = os.path.join(log_dir, f"training_{new_run.id}.log")
+        log_file = os.path.join(log_dir, f"training_{run_id}.log")
+        result_file = os.path.join(log_dir, f"training_{run_id}_result.json")
+        telemetry_file = os.path.join(log_dir, f"training_{run_id}_telemetry.csv")
         
         # Define model path in WSL format (Resolving Project Root)
-        current_dir = os.getcwd()
-        if os.path.basename(current_dir) == "backend":
-            project_root = os.path.dirname(current_dir)
-        else:
-            project_root = current_dir
-            
-        base_model_windows = os.path.join(project_root, "model", "bielik-4.5b-base")
-        base_model_wsl = base_model_windows.replace("\\", "/").replace("c:", "/mnt/c").replace("C:", "/mnt/c")
+        base_model_wsl = to_wsl(os.path.join(get_project_root(), "model", "bielik-4.5b-base"))
 
-        # Dynamically get Host IP for WSL to call back
-        import socket
-        try:
-            # This usually gets the LAN IP (e.g. 192.168.x.x) which is reachable from WSL
-            host_ip = socket.gethostbyname(socket.gethostname())
-        except:
-            host_ip = "127.0.0.1" # Fallback
+        output_dir = to_wsl(os.path.join(TRAINING_OUTPUT_DIR, f"run_{run_id}"))
 
-        cmd = f"wsl --exec python3 -u -m app.training.trainer --data {wsl_path} --output ./model/latest --base {base_model_wsl} --backend http://{host_ip}:8000"
+        cmd = f"wsl --exec python3 -u -m app.training.trainer --data {wsl_path} --output {output_dir} --base {base_model_wsl} --backend http://{get_host_ip()}:8000 --run-id {run_id} --result_file {to_wsl(result_file)} --batching {TRAINING_BATCHING} --batch_size {TRAINING_BATCH_SIZE} --truncation {TRUNCATION_STRATEGY} --telemetry_file {to_wsl(telemetry_file)}{extra_args}"
         
         try:
             with open(log_file, "w") as f_log:
                 f_log.write(f"--- Training started at {datetime.utcnow()} ---\n")
                 f_log.write(f"COMMAND: {cmd}\n\n")
-            
-            # Open log in append mode for the subprocess
-            f_log = open(log_file, "a")
-            process = subprocess.Popen(
-                cmd, 
-                shell=True, 
-                stdout=f_log, 
-                stderr=subprocess.STDOUT,
-                universal_newlines=True
+
+            def on_start(pid):
+                print(f"DEBUG: Training process started with PID {pid}. Logs: {log_file}")
+                self.run_store.update(run_id, immediate=True, pid=pid, host=RUN_HOST, log_path=log_file,
+                                     telemetry_path=telemetry_file)
+
+            future = self.supervisor.start(
+                f"training-{run_id}", cmd, log_file,
+                timeout=TRAINING_TIMEOUT_SECONDS,
+                result_file=result_file,
+                on_start=on_start
             )
-            print(f"DEBUG: Training process started with PID {process.pid}. Logs: {log_file}")
-            return True
-        except Exception as e:
+        except (OSError, RuntimeError) as e:
             print(f"ERROR: Failed to start training: {str(e)}")
+            self.run_jobs.pop(run_id, None)
             self.status = "idle"
-            new_run.status = "failed"
-            self.db.commit()
             return False
 
-    def update_progress(self, stage: str, value: int):
+        future.add_done_callback(lambda f: self.on_training_exit(run_id, job, f))
+        return True
+
+    def prepare_incremental_run(self, run_id: int, file_path: str):
+        """
+        Picks the adapter to continue from (the deployed one, else the newest checkpoint) and
+        mixes a replay sample of earlier training data into the upload.
+        Returns (dataset path, extra trainer args).
+        """
+        init_adapter = None
+        # Newest checkpoint of any run
+        for candidate in (DEPLOYED_ADAPTER_DIR, latest_checkpoint(os.path.join(TRAINING_OUTPUT_DIR, "*"))):
+            if candidate and os.path.exists(os.path.join(candidate, "adapter_model.safetensors")):
+                init_adapter = candidate
+                break
+        if init_adapter is None:
+            print(f"DEBUG: No adapter to continue from, run {run_id} trains from the base model")
+            self.train_mode = "full"
+            self.run_store.update(run_id, immediate=True, train_mode="full")
+            return file_path, ""
+
+        prior = self.run_store.deployed_datasets(exclude_run_id=run_id) + [REPLAY_BASE_DATASET]
+        mix_path = os.path.join(os.path.dirname(file_path), f"run_{run_id}_replay.jsonl")
+        try:
+            stats = build_replay_mix(file_path, prior, mix_path)
+        except OSError as e:
+            print(f"ERROR: Could not build replay buffer for run {run_id}: {e}")
+            mix_path, stats = file_path, {"replay_rows": 0}
+        print(f"DEBUG: Run {run_id} continues from {init_adapter} with {stats['replay_rows']} replayed examples")
+        self.run_store.update(run_id, immediate=True, init_adapter=init_adapter, replay_rows=stats["replay_rows"])
+        # Relative paths resolve the same inside WSL (started in backend/)
+        args = (f" --init_adapter {to_wsl(init_adapter)} --epochs {INCREMENTAL_EPOCHS}"
+                f" --learning_rate {INCREMENTAL_LEARNING_RATE}")
+        return mix_path, args
+
+    def on_training_exit(self, run_id: int, job, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"ERROR: Training supervisor failed: {e}")
+            result = ProcessResult(f"training-{run_id}", "failed", None)
+
+        if result.result.get("data_stats"):
+            print(f"DEBUG: Run {run_id} data stats: {json.dumps(result.result['data_stats'])}")
+            self.run_store.update(run_id, train_seconds=result.result["data_stats"].get("train_runtime"))
+
+        if self.run_jobs.get(run_id) is not job:
+            # /training/complete already handed the run over to the benchmark
+            return
+
+        if result.ok and result.result.get("adapter_path"):
+            # The trainer finished but its completion callback never reached us
+            print(f"DEBUG: Run {run_id} completed without callback, using result file")
+            self.finish_training_and_evaluate(result.result["adapter_path"], run_id)
+            return
+
+        print(f"ERROR: Training of run {run_id} ended without completing: {result.status} (code {result.returncode})")
+        self.run_jobs.pop(run_id, None)
+        self.set_run_stage(run_id, "cancelled" if result.status == "cancelled" else "idle")
+        self.scheduler.complete(job, success=False)
+
+    def update_progress(self, stage: str, value: int, run_id: int = None):
+        if run_id is not None and run_id != self.current_run_id:
+            # Another run sharing the GPU; persist without touching the panel
+            column = "training_progress" if stage == "training" else "evaluation_progress"
+            self.run_store.update(run_id, **{column: value})
+            return
         if stage == "training":
             self.training_progress = value
         elif stage == "evaluation":
             self.evaluation_progress = value
+        # Write-behind: flushed to SQLite in batches by the run store
+        self.persist_state()
+        self.publish_status()
 
-    def finish_training_and_evaluate(self, adapter_path: str):
-        self.status = "evaluating"
-        self.training_progress = 100
+    def finish_training_and_evaluate(self, adapter_path: str, run_id: int = None):
+        run_id = run_id or self.current_run_id
+        training_job = self.run_jobs.pop(run_id, None)
+        self.set_run_stage(run_id, "evaluating", training_progress=100, evaluation_progress=0,
+                           latest_adapter_path=adapter_path)
+
+        # The benchmark keeps the run's place in line, then the trainer's slot is released
+        payload = {"run_id": run_id, "adapter_path": adapter_path}
+        if training_job is not None and training_job.started_at:
+            # Wall-clock of the feedback cycle is measured up to the end of the benchmark
+            payload["cycle_started_at"] = training_job.started_at
+        self.scheduler.submit("benchmark", payload, after=training_job)
+        if training_job is not None:
+            self.scheduler.complete(training_job)
+        self.publish_status()
+
+    def launch_benchmark(self, job) -> bool:
+        run_id = job.payload["run_id"]
+        adapter_path = job.payload["adapter_path"]
+        self.activate_run(run_id)
+        self.run_jobs[run_id] = job
         self.evaluation_progress = 0
-        self.latest_adapter_path = adapter_path
+        self.status = "evaluating"
         
         # Real implementation: run benchmark script via WSL
-        import threading
-        
-        def run_benchmark():
-            try:
-                # 1. Resolve paths
-                current_dir = os.getcwd()
-                if os.path.basename(current_dir) == "backend":
-                    project_root = os.path.dirname(current_dir)
-                else:
-                    project_root = current_dir
-                    
-                # WSL Path Converter
-                def to_wsl(path):
-                    return path.replace("\\", "/").replace("c:", "/mnt/c").replace("C:", "/mnt/c")
-                
-                # Handle adapter path (could be Windows path OR WSL path from trainer)
-                if adapter_path.startswith("/mnt/"):
-                    adapter_wsl = adapter_path
-                else:
-                    # Assume relative or absolute Windows path
-                    if not os.path.isabs(adapter_path):
-                         adapter_full_win = os.path.join(project_root, adapter_path)
-                    else:
-                        adapter_full_win = adapter_path
-                    
-                    # Normalize and convert
-                    adapter_full_win = os.path.normpath(os.path.abspath(adapter_full_win))
-                    adapter_wsl = to_wsl(adapter_full_win)
-
-                base_dir_win = os.path.join(project_root, "model", "bielik-4.5b-base")
-                dataset_win = os.path.join(project_root, "model", "dataset", "mipd_test.jsonl")
-                output_dir_win = os.path.join(project_root, "model", "benchmark-reports")
-                
-                base_wsl = to_wsl(base_dir_win)
-                data_wsl = to_wsl(dataset_win)
-                output_wsl = to_wsl(output_dir_win)
-                
-                # Backend IP
-                import socket
-                try:
-                    host_ip = socket.gethostbyname(socket.gethostname())
-                except:
-                    host_ip = "127.0.0.1"
-                    
-                cmd = f"wsl --exec python3 -u -m app.training.benchmark --adapter {adapter_wsl} --base {base_wsl} --data {data_wsl} --backend http://{host_ip}:8000 --output_dir {output_wsl} --no-tqdm"
-                
-                print(f"DEBUG: Starting benchmark with command: {cmd}")
-                
-                # Setup benchmark logging
-                log_dir = "logs"
-                os.makedirs(log_dir, exist_ok=True)
-                bench_log_file = os.path.join(log_dir, f"benchmark_{int(datetime.utcnow().timestamp())}.log")
-                
-                with open(bench_log_file, "w") as f:
-                    f.write(f"--- Benchmark started at {datetime.utcnow()} ---\n")
-                    f.write(f"Command: {cmd}\n")
-
-                process = subprocess.Popen(
-                    cmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    universal_newlines=True
-                )
-                
-                # Stream output to capture F1 and log to file
-                captured_f1 = 0.0
-                
-                with open(bench_log_file, "a") as f_bench:
-                    while True:
-                        line = process.stdout.readline()
-                        if not line and process.poll() is not None:
-                            break
-                        if line:
-                            # Log to file
-                            f_bench.write(line)
-                            f_bench.flush()
-                            
-                            if "FINAL_F1_SCORE:" in line:
-                                try:
-                                    captured_f1 = float(line.split(":")[1].strip())
-                                    print(f"DEBUG: Benchmark captured F1: {captured_f1}")
-                                except:
-                                    pass
-                            
-                            if "FINAL_EXACT_MATCH:" in line:
-                                try:
-                                    captured_em = float(line.split(":")[1].strip())
-                                    print(f"DEBUG: Benchmark captured Exact Match: {captured_em}")
-                                    self.new_exact_match = captured_em
-                                except:
-                                    pass
-                            
-                process.wait()
-                
-                if process.returncode == 0:
-                    self.new_f1_non_empty = captured_f1
-                    # Since we don't stream ExactMatch perfectly here yet, we assume the report generation 
-                    # was successful and we can parse it for frontend display if we wanted to be super precise,
-                    # but for now let's just mark it ready. The frontend might need to know the report path 
-                    # to parse specific new metrics? Or we should store them in self variables.
-                    # For simplicity, let's keep it as is.
-                    self.status = "ready_to_promote"
-                    print(f"DEBUG: Evaluation done. New F1 (Strict): {self.new_f1_non_empty}")
-                else:
-                    print(f"ERROR: Benchmark failed with return code {process.returncode}")
-                    self.status = "idle" # Reset to idle on failure
-            except Exception as e:
-                print(f"ERROR: Benchmark thread failed: {e}")
-                self.status = "idle"
+        # 1. Resolve paths
+        project_root = get_project_root()
+
+        # Handle adapter path (could be Windows path OR WSL path from trainer)
+        if adapter_path.startswith("/mnt/"):
+            adapter_wsl = adapter_path
+        else:
+            # Assume relative or absolute Windows path
+            if not os.path.isabs(adapter_path):
+                adapter_full_win = os.path.join(project_root, adapter_path)
+            else:
+                adapter_full_win = adapter_path
+
+            # Normalize and convert
+            adapter_full_win = os.path.normpath(os.path.abspath(adapter_full_win))
+            adapter_wsl = to_wsl(adapter_full_win)
+
+        base_wsl = to_wsl(os.path.join(project_root, "model", "bielik-4.5b-base"))
+        data_wsl = to_wsl(os.path.join(project_root, "model", "dataset", "mipd_test.jsonl"))
+        output_wsl = to_wsl(os.path.join(project_root, "model", "benchmark-reports"))
+
+        # Setup benchmark logging
+        log_dir = "logs"
+        os.makedirs(log_dir, exist_ok=True)
+        bench_log_file = os.path.join(log_dir, f"benchmark_{int(datetime.utcnow().timestamp())}.log")
+        # Metrics come back through this file instead of grepping FINAL_F1_SCORE prints
+        result_file = os.path.join(log_dir, f"benchmark_{run_id}_result.json")
+
+        cmd = f"wsl --exec python3 -u -m app.training.benchmark --adapter {adapter_wsl} --base {base_wsl} --data {data_wsl} --backend http://{get_host_ip()}:8000 --output_dir {output_wsl} --no-tqdm --run-id {run_id} --result_file {to_wsl(result_file)} --truncation {TRUNCATION_STRATEGY}"
+
+        print(f"DEBUG: Starting benchmark with command: {cmd}")
+
+        try:
+            with open(bench_log_file, "w") as f:
+                f.write(f"--- Benchmark started at {datetime.utcnow()} ---\n")
+                f.write(f"Command: {cmd}\n")
+
+            future = self.supervisor.start(
+                f"benchmark-{run_id}", cmd, bench_log_file,
+                timeout=BENCHMARK_TIMEOUT_SECONDS,
+                result_file=result_file,
+                on_start=lambda pid: self.run_store.update(run_id, immediate=True, pid=pid, host=RUN_HOST,
+                                                          log_path=bench_log_file)
+            )
+        except (OSError, RuntimeError) as e:
+            print(f"ERROR: Failed to start benchmark: {e}")
+            self.run_jobs.pop(run_id, None)
+            self.set_run_stage(run_id, "idle")
+            return False
 
-        threading.Thread(target=run_benchmark).start()
+        future.add_done_callback(lambda f: self.on_benchmark_exit(run_id, job, f))
+        return True
 
+    def on_benchmark_exit(self, run_id: int, job, future):
+        success = False
+        try:
+            result = future.result()
+            if result.ok:
+                new_f1 = float(result.result.get("f1", 0.0))
+                new_em = float(result.result.get("em", 0.0))
+                report = self.cycle_report(run_id, job, new_f1)
+                if result.result.get("report"):
+                    # Written from WSL into reports_dir; promotion makes it the baseline
+                    self.run_store.update(run_id, report_path=os.path.join(
+                        self.reports_dir, os.path.basename(result.result["report"])))
+                self.set_run_stage(run_id, "ready_to_promote", new_f1_non_empty=new_f1,
+                                   new_exact_match=new_em, evaluation_progress=100, **report)
+                print(f"DEBUG: Evaluation done. New F1 (Strict): {new_f1}, Exact Match: {new_em}, cycle: {report}")
+                self.remember_trained_examples(run_id)
+                success = True
+            else:
+                print(f"ERROR: Benchmark {result.status} with return code {result.returncode}")
+                # Reset to idle on failure
+                self.set_run_stage(run_id, "cancelled" if result.status == "cancelled" else "idle")
+        except Exception as e:
+            print(f"ERROR: Benchmark failed: {e}")
+            self.set_run_stage(run_id, "idle")
+        finally:
+            if self.run_jobs.get(run_id) is job:
+                self.run_jobs.pop(run_id, None)
+            self.scheduler.complete(job, success=success)
+
+    def remember_trained_examples(self, run_id: int):
+        """Once a run completed, its examples count as uploaded before (failed/cancelled runs can be retried)."""
+        run = self.run_store.get_run(run_id)
+        if run is None or not run.dataset_path:
+            return
+        try:
+            count = record_trained_examples(run.dataset_path)
+            print(f"DEBUG: {count} examples of run {run_id} added to the upload dedup index")
+        except OSError as e:
+            print(f"ERROR: Could not record the examples of run {run_id} for deduplication: {e}")
+
+    def cycle_report(self, run_id: int, benchmark_job, new_f1: float) -> dict:
+        """Wall-clock of the feedback cycle and F1 kept relative to the model it started from."""
+        report = {"cycle_seconds": None, "f1_retention": None}
+        started_at = benchmark_job.payload.get("cycle_started_at")
+        if started_at is not None:
+            report["cycle_seconds"] = round((datetime.utcnow() - started_at).total_seconds(), 1)
+        run = self.run_store.get_run(run_id)
+        if run is not None and run.f1_score_before:
+            report["f1_retention"] = round(new_f1 / run.f1_score_before, 4)
+        return report
+
+    def cancel_run(self, run_id: int = None) -> bool:
+        """Stops the running (or queued) job of a run; defaults to the active run."""
+        run_id = run_id or self.current_run_id
+        job = self.run_jobs.get(run_id)
+        if job is None:
+            for queued in self.scheduler.snapshot()["queued"]:
+                if queued["run_id"] == run_id:
+                    return self.cancel_queued_job(queued["id"])
+            return False
+
+        # The exit callback does the bookkeeping for supervised processes
+        if self.supervisor.cancel(f"{job.kind}-{run_id}"):
+            return True
 
-    async def deploy_new_adapter(self, adapter_path: str):
+        # Re-attached process from a previous backend instance
+        run = self.run_store.get_run(run_id)
+        if run is not None and not on_this_host(run):
+            print(f"ERROR: Run {run_id} runs on host {run.host}, stop PID {run.pid} there; marking it cancelled")
+        elif run is not None and pid_alive(run.pid):
+            kill_process_tree(run.pid)
+        self.run_jobs.pop(run_id, None)
+        self.set_run_stage(run_id, "cancelled")
+        self.scheduler.complete(job, success=False)
+        return True
+
+
+    def step_down(self):
+        """
+        Another worker took over the training lease: launch nothing more and flush our
+        run state. Queued runs stay "queued" in the DB and running processes keep their
+        PID there, so the new leader's restore_state() picks both up.
+        """
+        self.scheduler.pause()
+        self.run_store.flush()
+
+    def snapshot_deployed_adapter(self, adapter_dir: str):
+        """Copies the live adapter aside; incremental runs continue from it (model/latest is overwritten by every run)."""
+        import shutil
+        tmp_dir = DEPLOYED_ADAPTER_DIR + ".tmp"
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            shutil.copytree(adapter_dir, tmp_dir)
+            shutil.rmtree(DEPLOYED_ADAPTER_DIR, ignore_errors=True)
+            os.replace(tmp_dir, DEPLOYED_ADAPTER_DIR)
+            print(f"DEBUG: Deployed adapter saved to {DEPLOYED_ADAPTER_DIR}")
+        except OSError as e:
+            print(f"ERROR: Could not snapshot deployed adapter {adapter_dir}: {e}")
+
+    def promotable_run(self, run_id: int = None):
+        """The run to promote: `run_id` if it is ready_to_promote, else the newest such run (None if there is none)."""
+        if run_id is not None:
+            run = self.run_store.get_run(run_id)
+            return run if run is not None and run.stage == "ready_to_promote" else None
+        ready = self.run_store.runs_in_stage("ready_to_promote")
+        return ready[-1] if ready else None
+
+    async def deploy_new_adapter(self, adapter_path: str, run_id: int = None):
         """
         Implementation of 2.5.4: Hot-Swap Logic
+        Stages are written to `run_id` (default: the active run), which may no longer be
+        the active one: the next queued upload starts as soon as the benchmark is done.
         """
+        run_id = run_id or self.current_run_id
+        if self.deploying is not None:
+            raise DeploymentConflict("A deployment is already running")
+        self.deploying = run_id
+        try:
+            return await self._deploy_new_adapter(adapter_path, run_id)
+        finally:
+            self.deploying = None
+
+    async def _deploy_new_adapter(self, adapter_path: str, run_id: int):
         # Setup logging
         log_dir = "logs"
         os.makedirs(log_dir, exist_ok=True)
@@ -268,7 +663,7 @@ class MLOpsOrchestrator:
                 f.write(f"{msg}\n")
 
         # 0. CONVERSION STEP
-        self.status = "deploying" 
+        self.set_run_stage(run_id, "deploying")
         log_deploy(f"Starting GGUF conversion for {adapter_path}")
         
         
@@ -292,44 +687,29 @@ class MLOpsOrchestrator:
         
         # We wrap in bash -c to ensure the environment variable syntax (VAR=VAL cmd) works
         # And updated model ID
-        inner_cmd = f"{env_prefix}python3 -u -m app.training.converter --adapter {adapter_path} --base-model-id speakleash/Bielik-4.5B-v3.0-Instruct --output {adapter_path}_gguf --quant_method q4_k_m"
+        inner_cmd = f"{env_prefix}python3 -u -m app.training.converter --adapter {adapter_path} --base-model-id speakleash/Bielik-4.5B-v3.0-Instruct --output {adapter_path}_gguf --quant_method {ADAPTER_QUANT_METHOD}"
         
         conversion_cmd = f'wsl --exec bash -c "{inner_cmd}"'
         
         log_deploy(f"Command: {conversion_cmd}")
 
         try:
-            import asyncio
-            # Use asyncio to prevent blocking the event loop
-            process = await asyncio.create_subprocess_shell(
-                conversion_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
-            )
-
-            # Stream output
-            with open(deploy_log_file, "a", encoding="utf-8") as f_log:
-                while True:
-                    line = await process.stdout.readline()
-                    if not line:
-                        break
-                    decoded_line = line.decode().strip()
-                    # print(f"CONVERT: {decoded_line}") # Silenced
-                    f_log.write(f"{decoded_line}\n")
-                    f_log.flush()
-
-            await process.wait()
+            # Supervised subprocess: streamed into the deploy log, bounded by a timeout, cancellable
+            result = await asyncio.wrap_future(self.supervisor.start(
+                "conversion", conversion_cmd, deploy_log_file,
+                timeout=CONVERSION_TIMEOUT_SECONDS
+            ))
             
-            if process.returncode != 0:
-                 log_deploy(f"ERROR: Conversion failed with code {process.returncode}")
-                 self.status = "ready_to_promote" 
+            if not result.ok:
+                 log_deploy(f"ERROR: Conversion {result.status} with code {result.returncode}")
+                 self.set_run_stage(run_id, "ready_to_promote") 
                  return False
             
             log_deploy("Conversion successful.")
                  
         except Exception as e:
             log_deploy(f"ERROR: Failed to run conversion: {e}")
-            self.status = "ready_to_promote"
+            self.set_run_stage(run_id, "ready_to_promote")
             return False
 
         # 1. Infer GGUF path from HF adapter path
@@ -362,12 +742,12 @@ class MLOpsOrchestrator:
                     break
         except Exception as e:
             print(f"ERROR: Could not list GGUF directory: {e}")
-            self.status = "ready_to_promote"
+            self.set_run_stage(run_id, "ready_to_promote")
             return False
             
         if not found_gguf_path:
             print("ERROR: No .gguf file found in adapter directory")
-            self.status = "ready_to_promote"
+            self.set_run_stage(run_id, "ready_to_promote")
             return False
             
         # Normalize slashes for Modelfile
@@ -391,72 +771,106 @@ class MLOpsOrchestrator:
         # 3. Tell Ollama to recreate the model with new config
         async with httpx.AsyncClient() as client:
             try:
-                # Set status to deploying
-                self.status = "deploying"
-                
                 # Read Modelfile content (just for debug logging if needed, or skip)
                 # We use the CLI now, so we just need the path.
                 
                 print(f"DEBUG: Executing 'ollama create' CLI for {modelfile_path}")
                 
-                # Use subprocess to call 'ollama create'
+                # Use 'ollama create' (argv list, no shell)
                 # This handles all the blob hashing and upload complexities automatically
                 create_cmd = ["ollama", "create", "bielik-lora-mipd", "-f", modelfile_path]
                 
-                # Check formatting/encoding of path for subprocess? 
-                # Subprocess handles arguments well.
-                
-                process = subprocess.run(
-                    create_cmd,
-                    capture_output=True,
-                    text=True,
-                    encoding='utf-8',
-                    check=False # We handle return code manually
-                )
+                # Runs on the supervisor loop, so the API keeps serving while Ollama imports blobs
+                result = await asyncio.wrap_future(self.supervisor.start(
+                    "ollama-create", create_cmd, deploy_log_file,
+                    timeout=CONVERSION_TIMEOUT_SECONDS
+                ))
                 
-                if process.returncode != 0:
-                     print(f"ERROR: Ollama create failed with code {process.returncode}")
-                     print(f"ERROR STDOUT: {process.stdout}")
-                     print(f"ERROR STDERR: {process.stderr}")
-                     raise Exception(f"Ollama CLI failed: {process.stderr}")
+                if not result.ok:
+                     print(f"ERROR: Ollama create {result.status} with code {result.returncode}, see {deploy_log_file}")
+                     raise Exception(f"Ollama CLI failed ({result.status})")
                 
                 print("DEBUG: Ollama model hot-swapped successfully (CLI).")
-                print(f"DEBUG CLI OUTPUT: {process.stdout}")
+                self.snapshot_deployed_adapter(wsl_to_win(hf_wsl_path))
                 
                 # Set status back to idle upon success
-                # Set status back to idle upon success
-                self.status = "deployment_success"
+                self.run_store.update(run_id, deployed_at=datetime.utcnow())
+                self.set_run_stage(run_id, "deployment_success")
             
             except Exception as e:
                 print(f"ERROR: Hot-swap exception: {e}")
-                self.status = "deployment_error"
+                self.set_run_stage(run_id, "deployment_error")
                 return False
             
-            # 4. SWAP REPORTS: Set the new model's report as the baseline
-            # We need to find the report file generated by the latest benchmark
-            # It is located in model/benchmark-reports/benchmark_report_{TIMESTAMP}.txt
-            # We simply find the most recent one.
-            project_root = r"c:/Users/vadim/Documents/Vadym/GitRep/projekt-inzynierski"
-            reports_dir = os.path.join(project_root, "model", "benchmark-reports")
-            baseline_report_path = os.path.join(reports_dir, "current_baseline_report.txt")
-            
-            # List files matching benchmark_report_*.txt
-            candidates = []
-            if os.path.exists(reports_dir):
-                for f in os.listdir(reports_dir):
-                    if f.startswith("benchmark_report_") and f.endswith(".txt"):
-                            candidates.append(os.path.join(reports_dir, f))
-            
-            if candidates:
-                # Sort by modification time (latest first)
-                candidates.sort(key=os.path.getmtime, reverse=True)
-                latest_report = candidates[0]
-                
-                try:
-                    import shutil
-                    shutil.copy2(latest_report, baseline_report_path)
-                    print(f"DEBUG: Baseline report updated from {latest_report}")
-                except Exception as e:
-                    print(f"ERROR: Failed to update baseline report: {e}")
-            
+            # 4. SWAP REPORTS: Set the promoted run's report and metrics as the baseline
+            # (not the newest report on disk: a later run may have been benchmarked since)
+            self.promote_baseline(run_id)
             return True
+
+    def promote_baseline(self, run_id: int):
+        """Makes the benchmark metrics recorded for `run_id` (and its report, if known) the new baseline."""
+        run = self.run_store.get_run(run_id)
+        if run is None or run.f1_score_after is None:
+            print(f"ERROR: Run {run_id} has no benchmark metrics, baseline left unchanged")
+            return
+        try:
+            if run.report_path and os.path.exists(run.report_path):
+                import shutil
+                shutil.copy2(run.report_path, os.path.join(self.reports_dir, BASELINE_REPORT_NAME))
+            # Structured copy of the metrics, so status never has to parse the report
+            self.baseline_store.update({'f1': run.f1_score_after, 'em': run.exact_match_after or 0.0},
+                                       source_report=run.report_path)
+            print(f"DEBUG: Baseline updated from run {run_id} ({run.report_path or 'no report file'})")
+            self.publish_status()
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Failed to update baseline report: {e}")
+
+    async def deploy_quantization(self, latency_budget_ms: float = None, report_path: str = None) -> dict:
+        """
+        Deploys the base + adapter precision from a quantization sweep report (default: the
+        latest) with the best F1 whose p95 latency fits the budget. Raises ValueError when
+        there is no report or no variant fits, DeploymentConflict while a run is training or
+        evaluating or another deployment is running.
+        """
+        from .quant_sweep import latest_report, select_variant, rewrite_modelfile, QUANT_LATENCY_BUDGET_MS
+        from ..serving.backends import MODELFILE_PATH
+
+        if self.deploying is not None:
+            raise DeploymentConflict("A deployment is already running")
+        if self.status not in TERMINAL_STAGES:
+            # The stage below belongs to the active run; its exit callbacks still have to see it
+            raise DeploymentConflict(f"Run {self.current_run_id} is {self.status}, deploy once it is done")
+        latency_budget_ms = latency_budget_ms or QUANT_LATENCY_BUDGET_MS
+        report_path = report_path or latest_report(self.reports_dir)
+        if not report_path:
+            raise ValueError("No quantization sweep report (run python -m app.training.quant_sweep run)")
+        with open(report_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        variant = select_variant(report, latency_budget_ms)
+        if variant is None:
+            raise ValueError(f"No variant in {os.path.basename(report_path)} meets the {latency_budget_ms:g} ms budget")
+
+        deploy_log_file = os.path.join("logs", f"deploy_quant_{int(datetime.utcnow().timestamp())}.log")
+        os.makedirs("logs", exist_ok=True)
+        print(f"DEBUG: Deploying base {variant['base_quant']} + adapter {variant['adapter_quant']} "
+              f"(F1 {variant['f1']:.4f}, p95 {variant['p95_latency_ms']} ms) from {report_path}")
+        # Set before the first await: a second deploy or a promote is turned away until we are done
+        self.deploying = "quantization"
+        self.status = "deploying"
+        try:
+            rewrite_modelfile(MODELFILE_PATH, base=variant["base"], adapter=variant["adapter"])
+            result = await asyncio.wrap_future(self.supervisor.start(
+                "ollama-create", ["ollama", "create", "bielik-lora-mipd", "-f", MODELFILE_PATH], deploy_log_file,
+                timeout=CONVERSION_TIMEOUT_SECONDS
+            ))
+            if not result.ok:
+                raise RuntimeError(f"Ollama create {result.status} with code {result.returncode}, see {deploy_log_file}")
+        except Exception:
+            self.status = "deployment_error"
+            raise
+        finally:
+            self.deploying = None
+        self.status = "deployment_success"
+        return {"report": report_path, "latency_budget_ms": latency_budget_ms,
+                **{k: variant[k] for k in ("base_quant", "adapter_quant", "base", "adapter", "f1", "em",
+                                            "tokens_per_second", "p95_latency_ms", "model_size_mb")}}
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+
+class ProgressBus:
+    """
+    In-process pub/sub for orchestrator status snapshots.
+
+    publish() is thread-safe and never blocks (the benchmark thread publishes too).
+    Subscribers only care about the newest snapshot, so every subscriber queue holds
+    a single item and a newer snapshot replaces an unread older one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._latest = None
+
+    @property
+    def latest(self):
+        return self._latest
+
+    def publish(self, snapshot: dict):
+        with self._lock:
+            if snapshot == self._latest:
+                return
+            self._latest = snapshot
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            loop, q = subscriber
+            try:
+                loop.call_soon_threadsafe(self._offer, q, snapshot)
+            except RuntimeError:
+                # Subscriber's event loop is gone
+                self._unsubscribe(subscriber)
+
+    async def stream(self, heartbeat: float = 15.0):
+        """
+        Yields snapshots for a single subscriber, starting with the current one.
+        Yields None every `heartbeat` seconds without updates so callers can send keep-alives.
+        """
+        q = asyncio.Queue(maxsize=1)
+        subscriber = (asyncio.get_running_loop(), q)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._latest is not None:
+                q.put_nowait(self._latest)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(q.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._unsubscribe(subscriber)
+
+    def _unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @staticmethod
+    def _offer(q: asyncio.Queue, snapshot: dict):
+        if q.full():
+            q.get_nowait()
+        q.put_nowait(snapshot)
@@ -0,0 +1,77 @@
+import queue
+import sys
+import threading
+import time
+
+import requests
+
+
+class ProgressReporter:
+    """
+    Non-blocking, rate-limited progress sender used by the trainer and the benchmark.
+
+    report() only drops the value into a local queue, so the training/inference loop
+    never waits on the network. A background thread coalesces pending updates
+    (latest value per stage wins) and POSTs them at most `max_rate` times per second.
+    """
+
+    def __init__(self, backend_url, max_rate=2.0, timeout=1.0, run_id=None):
+        self.backend_url = backend_url
+        self.run_id = run_id
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=1000)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="progress-reporter", daemon=True)
+        self._thread.start()
+
+    def report(self, stage, value):
+        try:
+            self._queue.put_nowait((stage, value))
+        except queue.Full:
+            # The sender is far behind; newer values will follow anyway
+            pass
+
+    def close(self, timeout=5.0):
+        """Flush the last pending values and stop the sender thread."""
+        self._closed.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        last_sent = 0.0
+        while True:
+            try:
+                stage, value = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return
+                continue
+
+            pending = {stage: value}
+
+            # Respect the rate limit; anything arriving meanwhile gets coalesced
+            wait = self.min_interval - (time.monotonic() - last_sent)
+            if wait > 0:
+                self._closed.wait(wait)
+
+            while True:
+                try:
+                    stage, value = self._queue.get_nowait()
+                    pending[stage] = value
+                except queue.Empty:
+                    break
+
+            for stage, value in pending.items():
+                self._post(stage, value)
+            last_sent = time.monotonic()
+
+    def _post(self, stage, value):
+        payload = {"stage": stage, "value": value}
+        if self.run_id is not None:
+            payload["run_id"] = self.run_id
+        try:
+            requests.post(f"{self.backend_url}/training/progress",
+                          json=payload,
+                          timeout=self.timeout)
+        except Exception as e:
+            print(f"Failed to report progress to {self.backend_url}: {e}", file=sys.stderr, flush=True)
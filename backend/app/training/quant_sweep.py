@@ -0,0 +1,282 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+from .core import evaluate_response, gold_tags, summarize_results, get_project_root
+from .truncation import Truncator, load_tokenizer, TRUNCATION_STRATEGY
+
+# Base precisions made with llama-quantize from the f16 GGUF, adapter precisions with convert_lora_to_gguf.py
+BASE_QUANTS = os.getenv("QUANT_SWEEP_BASE", "f16,q8_0,q4_k_m")
+ADAPTER_QUANTS = os.getenv("QUANT_SWEEP_ADAPTER", "f16,q8_0")
+QUANT_SWEEP_DIR = os.getenv("QUANT_SWEEP_DIR", os.path.join(get_project_root(), "model", "quant-sweep"))
+QUANT_SWEEP_SAMPLES = int(os.getenv("QUANT_SWEEP_SAMPLES", "50"))
+# The latency the deployed variant has to stay under (p95 per /analyze answer)
+QUANT_LATENCY_BUDGET_MS = float(os.getenv("QUANT_LATENCY_BUDGET_MS", "15000"))
+LLAMA_QUANTIZE = os.getenv("LLAMA_QUANTIZE", "")
+# -1 offloads every layer when llama-cpp-python is built with CUDA (what Ollama does), CPU builds ignore it
+QUANT_SWEEP_GPU_LAYERS = int(os.getenv("QUANT_SWEEP_GPU_LAYERS", "-1"))
+SWEEP_MAX_INPUT_TOKENS = 3000
+SWEEP_MAX_NEW_TOKENS = 512
+SWEEP_CTX = 4096
+BASE_MODEL_ID = "speakleash/Bielik-4.5B-v3.0-Instruct"
+
+
+def find_llama_quantize():
+    candidates = [LLAMA_QUANTIZE] if LLAMA_QUANTIZE else []
+    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    candidates += [
+        os.path.join(backend_dir, "vendor", "llama.cpp", "build", "bin", "llama-quantize"),
+        shutil.which("llama-quantize") or "",
+    ]
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    raise FileNotFoundError("llama-quantize not found (build vendor/llama.cpp or set LLAMA_QUANTIZE)")
+
+
+def quantize_base(base_f16: str, quant: str, out_dir: str) -> str:
+    """Base GGUF in `quant`; reuses an earlier file of the same name."""
+    if quant == "f16":
+        return base_f16
+    name = os.path.basename(base_f16).replace(".gguf", "")
+    for tag in ("-f16", ".f16", "-F16", ".F16"):
+        name = name.replace(tag, "")
+    output = os.path.join(out_dir, f"{name}.{quant.upper()}.gguf")
+    if not os.path.exists(output):
+        print(f"DEBUG: Quantizing base to {quant}: {output}")
+        subprocess.check_call([find_llama_quantize(), base_f16, output, quant.upper()])
+    return output
+
+
+def adapter_key(adapter_dir: str) -> str:
+    """Identifies one trained adapter: its path plus size and mtime of the weights (model/latest is reused by every run)."""
+    weights = os.path.join(adapter_dir, "adapter_model.safetensors")
+    stat = os.stat(weights)
+    fingerprint = f"{os.path.abspath(adapter_dir)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:12]
+
+
+def adapter_out_dir(adapter_dir: str, out_dir: str) -> str:
+    """Per-adapter subdirectory for its GGUFs and results, so a new run never reuses an older adapter's files."""
+    path = os.path.join(out_dir, "adapters", adapter_key(adapter_dir))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def convert_adapter(adapter_dir: str, quant: str, out_dir: str, base_model_id: str = BASE_MODEL_ID) -> str:
+    """Adapter GGUF in `quant`; reuses an earlier conversion of the same adapter only."""
+    output = os.path.join(adapter_out_dir(adapter_dir, out_dir), f"adapter.{quant.upper()}.gguf")
+    if not os.path.exists(output):
+        print(f"DEBUG: Converting adapter to {quant}: {output}")
+        subprocess.check_call([sys.executable, "-m", "app.training.converter", "--adapter", adapter_dir,
+                               "--base-model-id", base_model_id, "--output", output, "--quant_method", quant])
+    return output
+
+
+def load_test_set(path: str, limit: int = QUANT_SWEEP_SAMPLES, seed: int = 42):
+    """Same shuffled sample for every variant; gold tags parsed like the benchmark does."""
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            examples.append({"input": row["input"], "tags": gold_tags(row["output"])})
+    random.Random(seed).shuffle(examples)
+    return examples[:limit] if limit else examples
+
+
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss is in KB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def evaluate_variant(base: str, adapter: str, data: str, limit: int = QUANT_SWEEP_SAMPLES,
+                     gpu_layers: int = QUANT_SWEEP_GPU_LAYERS) -> dict:
+    """
+    Runs the test sample through llama.cpp with this base + adapter, the same prompt and
+    JSON-constrained output as serving. Meant to run in its own process (see run_variant),
+    so peak memory belongs to this variant alone.
+    """
+    from llama_cpp import Llama
+    from ..serving.backends import parse_modelfile, MODELFILE_PATH
+
+    system = parse_modelfile(MODELFILE_PATH)["system"]
+    truncator = Truncator(load_tokenizer(os.path.join(get_project_root(), "model", "bielik-4.5b-base", "tokenizer.json")),
+                          strategy=TRUNCATION_STRATEGY)
+    examples = load_test_set(data, limit)
+
+    load_started = time.perf_counter()
+    llama = Llama(model_path=base, lora_path=adapter, n_ctx=SWEEP_CTX, n_gpu_layers=gpu_layers,
+                  chat_format="chatml", verbose=False)
+    load_seconds = time.perf_counter() - load_started
+
+    results, latencies, generated_tokens, prompt_tokens = [], [], 0, 0
+    for i, example in enumerate(examples):
+        text, _ = truncator.truncate(example["input"], SWEEP_MAX_INPUT_TOKENS)
+        started = time.perf_counter()
+        completion = llama.create_chat_completion(
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": text}],
+            temperature=0.0,
+            max_tokens=SWEEP_MAX_NEW_TOKENS,
+            response_format={"type": "json_object"},
+        )
+        latencies.append(time.perf_counter() - started)
+        usage = completion.get("usage", {})
+        generated_tokens += usage.get("completion_tokens", 0)
+        prompt_tokens += usage.get("prompt_tokens", 0)
+        results.append(evaluate_response(completion["choices"][0]["message"]["content"], example["tags"]))
+        print(f"DEBUG: {os.path.basename(base)} + {os.path.basename(adapter)}: {i + 1}/{len(examples)}")
+
+    latencies.sort()
+    total_seconds = sum(latencies)
+    return dict(
+        summarize_results(results),
+        base=base,
+        adapter=adapter,
+        model_size_mb=round(sum(os.path.getsize(p) for p in (base, adapter)) / 2 ** 20, 1),
+        peak_memory_mb=peak_memory_mb(),
+        load_seconds=round(load_seconds, 2),
+        # Whole answers (prompt eval + decoding), which is what the latency budget is about
+        tokens_per_second=round(generated_tokens / total_seconds, 2) if total_seconds else 0.0,
+        prompt_tokens_per_doc=round(prompt_tokens / len(examples), 1) if examples else 0,
+        mean_latency_ms=round(total_seconds / len(latencies) * 1000, 1) if latencies else None,
+        p95_latency_ms=round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000, 1) if latencies else None,
+    )
+
+
+def run_variant(base: str, adapter: str, data: str, limit: int, out_dir: str) -> dict:
+    """evaluate_variant in a fresh interpreter (clean peak-memory reading, model freed afterwards)."""
+    result_file = os.path.join(out_dir, f"result_{os.path.basename(base)}_{os.path.basename(adapter)}.json")
+    subprocess.check_call([sys.executable, "-m", "app.training.quant_sweep", "evaluate", "--base", base,
+                           "--adapter", adapter, "--data", data, "--limit", str(limit), "--result_file", result_file])
+    with open(result_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sweep(adapter_dir: str, base_f16: str, data: str, base_quants=BASE_QUANTS, adapter_quants=ADAPTER_QUANTS,
+          limit: int = QUANT_SWEEP_SAMPLES, out_dir: str = QUANT_SWEEP_DIR) -> dict:
+    """Every base x adapter precision; a variant that fails to build or run is reported, not fatal."""
+    from .converter import lora_outtype
+
+    os.makedirs(out_dir, exist_ok=True)
+    base_quants = [q.strip().lower() for q in base_quants.split(",") if q.strip()]
+    # k-quant adapters would all come out as q8_0
+    adapter_quants = list(dict.fromkeys(lora_outtype(q.strip()) for q in adapter_quants.split(",") if q.strip()))
+    variants = []
+    for base_quant in base_quants:
+        for adapter_quant in adapter_quants:
+            entry = {"base_quant": base_quant, "adapter_quant": adapter_quant}
+            try:
+                base = quantize_base(base_f16, base_quant, out_dir)
+                adapter = convert_adapter(adapter_dir, adapter_quant, out_dir)
+                # Results sit next to the adapter's GGUFs, keyed the same way
+                entry.update(run_variant(base, adapter, data, limit, os.path.dirname(adapter)))
+            except (subprocess.CalledProcessError, OSError) as e:
+                print(f"ERROR: Variant base={base_quant} adapter={adapter_quant} failed: {e}")
+                entry["error"] = str(e)
+            variants.append(entry)
+    return {"adapter_dir": adapter_dir, "data": data, "samples": limit,
+            "date": time.strftime('%Y-%m-%d %H:%M:%S'), "variants": variants}
+
+
+def write_report(report: dict, reports_dir: str) -> str:
+    """quant_sweep_<ts>.json (read by the orchestrator) + a .txt table next to the benchmark reports."""
+    os.makedirs(reports_dir, exist_ok=True)
+    path = os.path.join(reports_dir, f"quant_sweep_{int(time.time())}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    lines = ["=" * 100, f"QUANTIZATION SWEEP: {report['samples']} documents, adapter {report['adapter_dir']}",
+             f"Date: {report['date']}", "=" * 100,
+             f"{'base':<8} {'adapter':<8} {'F1':>6} {'EM':>6} {'tok/s':>7} {'mean ms':>9} {'p95 ms':>9} {'size MB':>9} {'peak MB':>9}"]
+    for v in report["variants"]:
+        if "error" in v:
+            lines.append(f"{v['base_quant']:<8} {v['adapter_quant']:<8} failed: {v['error']}")
+            continue
+        lines.append(f"{v['base_quant']:<8} {v['adapter_quant']:<8} {v['f1']:>6.3f} {v['em']:>6.3f} {v['tokens_per_second']:>7} "
+                     f"{v['mean_latency_ms']:>9} {v['p95_latency_ms']:>9} {v['model_size_mb']:>9} {v['peak_memory_mb']!s:>9}")
+    with open(os.path.splitext(path)[0] + ".txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    print("\n".join(lines))
+    return path
+
+
+def latest_report(reports_dir: str):
+    reports = glob.glob(os.path.join(reports_dir, "quant_sweep_*.json"))
+    return max(reports, key=os.path.getmtime) if reports else None
+
+
+def select_variant(report: dict, latency_budget_ms: float = QUANT_LATENCY_BUDGET_MS):
+    """Most accurate variant (F1, then EM, then speed) whose p95 latency fits the budget, else None."""
+    fitting = [v for v in report["variants"] if "error" not in v and v["p95_latency_ms"] <= latency_budget_ms]
+    if not fitting:
+        return None
+    return max(fitting, key=lambda v: (round(v["f1"], 3), round(v["em"], 3), v["tokens_per_second"]))
+
+
+def rewrite_modelfile(path: str, base: str = None, adapter: str = None):
+    """Points the Modelfile's FROM / ADAPTER lines at other GGUFs (forward slashes, like deploy_new_adapter)."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            if base and line.startswith("FROM"):
+                line = f"FROM {base.replace(os.sep, '/')}\n"
+            elif adapter and line.startswith("ADAPTER"):
+                line = f"ADAPTER {adapter.replace(os.sep, '/')}\n"
+            f.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency/accuracy matrix of GGUF precisions for the base model and adapter")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Build every variant, benchmark it and write the report")
+    run.add_argument("--adapter", type=str, required=True, help="HF adapter directory")
+    run.add_argument("--base_f16", type=str, required=True, help="Base model GGUF in f16 (convert_hf_to_gguf.py --outtype f16)")
+    run.add_argument("--data", type=str, required=True, help="Test set (.jsonl)")
+    run.add_argument("--base_quants", type=str, default=BASE_QUANTS)
+    run.add_argument("--adapter_quants", type=str, default=ADAPTER_QUANTS)
+    run.add_argument("--limit", type=int, default=QUANT_SWEEP_SAMPLES)
+    run.add_argument("--out_dir", type=str, default=QUANT_SWEEP_DIR, help="Where the GGUF variants are kept")
+    run.add_argument("--reports_dir", type=str, default=os.path.join(get_project_root(), "model", "benchmark-reports"))
+    run.add_argument("--latency_budget_ms", type=float, default=QUANT_LATENCY_BUDGET_MS)
+    evaluate = sub.add_parser("evaluate", help="Benchmark one base + adapter pair (used by run)")
+    evaluate.add_argument("--base", type=str, required=True)
+    evaluate.add_argument("--adapter", type=str, required=True)
+    evaluate.add_argument("--data", type=str, required=True)
+    evaluate.add_argument("--limit", type=int, default=QUANT_SWEEP_SAMPLES)
+    evaluate.add_argument("--result_file", type=str, required=True)
+    args = parser.parse_args()
+
+    if args.command == "evaluate":
+        result = evaluate_variant(args.base, args.adapter, args.data, args.limit)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    report = sweep(args.adapter, args.base_f16, args.data, args.base_quants, args.adapter_quants, args.limit, args.out_dir)
+    best = select_variant(report, args.latency_budget_ms)
+    report["recommended"] = {"latency_budget_ms": args.latency_budget_ms, "variant": best}
+    path = write_report(report, args.reports_dir)
+    if best:
+        print(f"RESULT: Best under {args.latency_budget_ms:g} ms: base {best['base_quant']} + adapter {best['adapter_quant']} "
+              f"(F1 {best['f1']:.4f}, p95 {best['p95_latency_ms']} ms)")
+    else:
+        print(f"RESULT: No variant meets the {args.latency_budget_ms:g} ms budget")
+    print(f"Report written to: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import glob
+import json
+import math
+import os
+import random
+
+from .ingestion import example_hash
+
+# Replayed examples per new example, and an upper bound per run
+REPLAY_RATIO = float(os.getenv("REPLAY_RATIO", "1.0"))
+REPLAY_MAX_ROWS = int(os.getenv("REPLAY_MAX_ROWS", "500"))
+
+
+def latest_checkpoint(output_dir: str):
+    """Newest checkpoint-<step> directory written by the HF Trainer, or None."""
+    checkpoints = [p for p in glob.glob(os.path.join(output_dir, "checkpoint-*")) if os.path.isdir(p)]
+    if not checkpoints:
+        return None
+
+    def step(path):
+        suffix = os.path.basename(path).split("-")[-1]
+        return int(suffix) if suffix.isdigit() else -1
+
+    return max(checkpoints, key=lambda p: (os.path.getmtime(p), step(p)))
+
+
+def _read_rows(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict) and isinstance(row.get("input"), str) and isinstance(row.get("output"), str):
+                yield row
+
+
+def build_replay_mix(new_path: str, prior_paths: list, out_path: str,
+                     ratio: float = REPLAY_RATIO, max_rows: int = REPLAY_MAX_ROWS, seed: int = 3407) -> dict:
+    """
+    Writes `out_path` = the new examples + a uniform sample of earlier training data, so a
+    run that continues from the current adapter doesn't forget what it learned before.
+
+    Earlier files are streamed with reservoir sampling (they can be the whole base
+    training set). Rows identical to a new example are skipped. Returns mix stats.
+    """
+    new_rows = list(_read_rows(new_path))
+    new_hashes = {example_hash(r["input"], r["output"]) for r in new_rows}
+    target = min(max_rows, math.ceil(len(new_rows) * ratio))
+
+    rng = random.Random(seed)
+    reservoir, seen_hashes, candidates = [], set(), 0
+    sources = []
+    for path in prior_paths:
+        if not path or os.path.abspath(path) == os.path.abspath(new_path):
+            continue
+        if not os.path.exists(path):
+            # A missing source shrinks the replay buffer; the run still trains, but say so
+            print(f"WARNING: Replay source {path} does not exist, skipping it")
+            continue
+        sources.append(path)
+        for row in _read_rows(path):
+            digest = example_hash(row["input"], row["output"])
+            if digest in new_hashes or digest in seen_hashes:
+                continue
+            seen_hashes.add(digest)
+            candidates += 1
+            if len(reservoir) < target:
+                reservoir.append(row)
+            else:
+                j = rng.randrange(candidates)
+                if j < target:
+                    reservoir[j] = row
+
+    mix = [{"input": r["input"], "output": r["output"]} for r in new_rows + reservoir]
+    rng.shuffle(mix)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        for row in mix:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    return {
+        "new_rows": len(new_rows),
+        "replay_rows": len(reservoir),
+        "replay_candidates": candidates,
+        "replay_sources": sources,
+    }
@@ -0,0 +1,188 @@
+import atexit
+import os
+import socket
+import subprocess
+import threading
+from datetime import datetime
+
+from ..db import database
+
+# Stages after which no process is running for the run anymore ("queued" hasn't started one yet)
+TERMINAL_STAGES = {"idle", "ready_to_promote", "deployment_success", "deployment_error", "failed", "cancelled"}
+
+# TrainingRun.status summarises the stage for the history table
+RUN_STATUS_BY_STAGE = {
+    "queued": "queued",
+    "training": "running",
+    "evaluating": "running",
+    "deploying": "running",
+    "ready_to_promote": "completed",
+    "deployment_success": "completed",
+    "deployment_error": "completed",
+    "failed": "failed",
+    "cancelled": "cancelled",
+    "idle": "failed",
+}
+
+
+# Recorded next to every PID: with API workers on several hosts the leader may change host
+RUN_HOST = socket.gethostname()
+
+
+def on_this_host(run) -> bool:
+    """Whether run.pid can be checked/killed from here (rows from before the host column count as local)."""
+    return not run.host or run.host == RUN_HOST
+
+
+def pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    if os.name == "nt":
+        try:
+            out = subprocess.run(["tasklist", "/FI", f"PID eq {pid}", "/NH"],
+                                 capture_output=True, text=True, check=False)
+            return str(pid) in out.stdout
+        except OSError:
+            return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RunStateStore:
+    """
+    Persists the orchestrator state machine into TrainingRun rows.
+
+    Stage transitions are written immediately; progress updates are write-behind:
+    they are merged in memory and flushed by a background thread every
+    `flush_interval` seconds, so a trainer logging every step doesn't hit SQLite
+    on every step.
+    """
+
+    def __init__(self, session_factory=None, flush_interval: float = 2.0):
+        self.session_factory = session_factory or database.SessionLocal
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}  # run_id -> {column: value}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="run-state-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def create_run(self, **fields) -> int:
+        db = self.session_factory()
+        try:
+            run = database.TrainingRun(start_time=datetime.utcnow(), updated_at=datetime.utcnow(), **fields)
+            db.add(run)
+            db.commit()
+            return run.id
+        finally:
+            db.close()
+
+    def update(self, run_id, immediate: bool = False, **fields):
+        if run_id is None:
+            return
+        if "stage" in fields and fields["stage"] in RUN_STATUS_BY_STAGE:
+            fields.setdefault("status", RUN_STATUS_BY_STAGE[fields["stage"]])
+            if fields["status"] != "running":
+                fields.setdefault("end_time", datetime.utcnow())
+        with self._lock:
+            self._pending.setdefault(run_id, {}).update(fields)
+        if immediate:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        db = self.session_factory()
+        try:
+            for run_id, fields in pending.items():
+                fields["updated_at"] = datetime.utcnow()
+                db.query(database.TrainingRun).filter(database.TrainingRun.id == run_id).update(fields)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"ERROR: Failed to persist run state: {e}")
+            # Put the values back unless newer ones arrived meanwhile
+            with self._lock:
+                for run_id, fields in pending.items():
+                    merged = dict(fields)
+                    merged.update(self._pending.get(run_id, {}))
+                    self._pending[run_id] = merged
+        finally:
+            db.close()
+
+    def get_run(self, run_id):
+        db = self.session_factory()
+        try:
+            run = db.get(database.TrainingRun, run_id)
+            if run is not None:
+                db.expunge(run)
+            return run
+        finally:
+            db.close()
+
+    def latest_run(self):
+        """Most recent run that got past the queue."""
+        db = self.session_factory()
+        try:
+            run = (db.query(database.TrainingRun)
+                   .filter((database.TrainingRun.stage != "queued") | (database.TrainingRun.stage.is_(None)))
+                   .order_by(database.TrainingRun.id.desc())
+                   .first())
+            if run is not None:
+                db.expunge(run)
+            return run
+        finally:
+            db.close()
+
+    def runs_in_stage(self, stage: str):
+        """Runs currently in `stage`, oldest first."""
+        db = self.session_factory()
+        try:
+            runs = (db.query(database.TrainingRun)
+                    .filter(database.TrainingRun.stage == stage)
+                    .order_by(database.TrainingRun.id)
+                    .all())
+            for run in runs:
+                db.expunge(run)
+            return runs
+        finally:
+            db.close()
+
+    def deployed_datasets(self, exclude_run_id=None):
+        """
+        Upload files the live adapter was trained on, in deployment order: the last deployed
+        full run and the incremental runs deployed on top of it. Runs that were never
+        promoted, or whose deployment failed, aren't part of it.
+        """
+        db = self.session_factory()
+        try:
+            rows = (db.query(database.TrainingRun.id, database.TrainingRun.dataset_path,
+                             database.TrainingRun.train_mode)
+                    .filter(database.TrainingRun.deployed_at.isnot(None))
+                    .order_by(database.TrainingRun.deployed_at)
+                    .all())
+        finally:
+            db.close()
+        lineage = []
+        for run_id, path, mode in rows:
+            if (mode or "full") == "full":
+                # Trained from the base model: what was deployed before is gone
+                lineage = []
+            lineage.append((run_id, path))
+        return [path for run_id, path in lineage if path and run_id != exclude_run_id]
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
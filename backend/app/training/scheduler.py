@@ -0,0 +1,214 @@
+import itertools
+import os
+import subprocess
+import threading
+from datetime import datetime
+
+# Scheduler configuration (override via environment)
+GPU_SLOTS = int(os.getenv("GPU_SLOTS", "1"))
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "fifo")  # fifo | priority
+# Peak VRAM of each job kind (4-bit Bielik + LoRA + paged optimizer / inference KV cache)
+JOB_VRAM_MB = {
+    "training": int(os.getenv("TRAINING_VRAM_MB", "7000")),
+    "benchmark": int(os.getenv("BENCHMARK_VRAM_MB", "5000")),
+}
+VRAM_HEADROOM_MB = int(os.getenv("VRAM_HEADROOM_MB", "512"))
+VRAM_RETRY_SECONDS = 10.0
+
+
+def query_gpu_memory():
+    """
+    Reads (total, used, free) VRAM in MiB of the first GPU via nvidia-smi.
+    Returns None when nvidia-smi is unavailable.
+    """
+    try:
+        cmd = ["nvidia-smi", "--query-gpu=memory.total,memory.used,memory.free", "--format=csv,noheader,nounits"]
+        output = subprocess.check_output(cmd, timeout=10).decode().strip()
+        total, used, free = (int(float(v)) for v in output.splitlines()[0].split(','))
+        return {"total": total, "used": used, "free": free}
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+
+class Job:
+    def __init__(self, kind: str, payload: dict, priority: int = 0, seq: int = 0, vram_mb: int = 0):
+        self.id = None
+        self.kind = kind  # "training" | "benchmark"
+        self.payload = payload
+        self.priority = priority
+        self.seq = seq
+        self.vram_mb = vram_mb
+        self.state = "queued"  # queued, running, done, failed
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "state": self.state,
+            "run_id": self.payload.get("run_id"),
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+        }
+
+
+class GpuScheduler:
+    """
+    Queues training and benchmark jobs and starts them when a GPU slot and enough VRAM are free.
+
+    VRAM is checked twice: against the live nvidia-smi reading (other tenants, e.g. Ollama)
+    and against the declared peak of jobs we already started, because a job that is still
+    loading its model doesn't show up in nvidia-smi yet. Without a GPU probe only slots count.
+
+    `launcher(job)` must start the job without blocking and return True on success;
+    the owner reports the end of a job via complete().
+    """
+
+    def __init__(self, launcher, gpu_slots: int = GPU_SLOTS, policy: str = SCHEDULER_POLICY,
+                 vram_requirements: dict = None, headroom_mb: int = VRAM_HEADROOM_MB,
+                 probe=query_gpu_memory, retry_seconds: float = VRAM_RETRY_SECONDS):
+        if policy not in ("fifo", "priority"):
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.launcher = launcher
+        self.gpu_slots = gpu_slots
+        self.policy = policy
+        self.vram_requirements = vram_requirements or JOB_VRAM_MB
+        self.headroom_mb = headroom_mb
+        self.probe = probe
+        self.retry_seconds = retry_seconds
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._seq = itertools.count(1)
+        self._queued = []
+        self._running = {}
+        self._retry_timer = None
+        self._paused = False
+
+    def pause(self):
+        """Stops starting jobs for good (this worker lost the training lease to another one)."""
+        with self._lock:
+            self._paused = True
+            if self._retry_timer is not None:
+                self._retry_timer.cancel()
+
+    def submit(self, kind: str, payload: dict, priority: int = 0, after: Job = None) -> Job:
+        """
+        Queues a job. `after` marks a follow-up of another job (benchmark of a finished
+        training): it inherits the parent's place in line so a run's pipeline finishes
+        before the next upload starts training.
+        """
+        with self._lock:
+            seq = after.seq if after is not None else next(self._seq)
+            priority = max(priority, after.priority) if after is not None else priority
+            job = Job(kind, payload, priority=priority, seq=seq, vram_mb=self.vram_requirements.get(kind, 0))
+            job.id = next(self._ids)
+            self._queued.append(job)
+        self.dispatch()
+        return job
+
+    def adopt(self, kind: str, payload: dict) -> Job:
+        """Registers a job that is already running (re-attached after a backend restart)."""
+        with self._lock:
+            job = Job(kind, payload, seq=next(self._seq), vram_mb=self.vram_requirements.get(kind, 0))
+            job.id = next(self._ids)
+            job.state = "running"
+            job.started_at = datetime.utcnow()
+            self._running[job.id] = job
+            return job
+
+    def complete(self, job: Job, success: bool = True):
+        with self._lock:
+            if self._running.pop(job.id, None) is None:
+                return
+            job.state = "done" if success else "failed"
+        self.dispatch()
+
+    def cancel(self, job_id: int) -> bool:
+        """Removes a job that hasn't started yet."""
+        with self._lock:
+            for job in self._queued:
+                if job.id == job_id:
+                    self._queued.remove(job)
+                    job.state = "failed"
+                    return True
+        return False
+
+    def position(self, job: Job):
+        with self._lock:
+            ordered = self._ordered()
+            return ordered.index(job) + 1 if job in ordered else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "gpu_slots": self.gpu_slots,
+                "running": [j.to_dict() for j in self._running.values()],
+                "queued": [j.to_dict() for j in self._ordered()],
+            }
+
+    def dispatch(self):
+        """
+        Starts queued jobs in policy order until the head of the queue doesn't fit.
+        Jobs are picked (and their slot reserved) under the lock, but launched after
+        releasing it: launching does DB writes and file I/O, and queue reads shouldn't wait on that.
+        """
+        while True:
+            with self._lock:
+                to_start = []
+                while self._queued and not self._paused:
+                    job = self._ordered()[0]
+                    if len(self._running) >= self.gpu_slots:
+                        break
+                    if not self._vram_fits(job):
+                        # Strict ordering (no skipping ahead) so big jobs don't starve;
+                        # re-check later since other tenants may free memory.
+                        self._schedule_retry()
+                        break
+                    self._queued.remove(job)
+                    job.state = "running"
+                    job.started_at = datetime.utcnow()
+                    self._running[job.id] = job
+                    to_start.append(job)
+            if not to_start:
+                return
+
+            freed = False
+            for job in to_start:
+                try:
+                    started = self.launcher(job)
+                except Exception as e:
+                    print(f"ERROR: Failed to launch {job.kind} job {job.id}: {e}")
+                    started = False
+                if not started:
+                    with self._lock:
+                        self._running.pop(job.id, None)
+                        job.state = "failed"
+                    freed = True
+            if not freed:
+                return
+            # A failed launch gave its slot back; the next job in line may use it
+
+    def _ordered(self):
+        if self.policy == "priority":
+            return sorted(self._queued, key=lambda j: (-j.priority, j.seq, j.kind != "benchmark"))
+        return sorted(self._queued, key=lambda j: (j.seq, j.kind != "benchmark"))
+
+    def _vram_fits(self, job: Job) -> bool:
+        if not job.vram_mb:
+            return True
+        reading = self.probe() if self.probe else None
+        if reading is None:
+            return True
+        reserved = sum(j.vram_mb for j in self._running.values())
+        available = min(reading["free"], reading["total"] - reserved)
+        return available >= job.vram_mb + self.headroom_mb
+
+    def _schedule_retry(self):
+        if self._retry_timer is not None and self._retry_timer.is_alive():
+            return
+        self._retry_timer = threading.Timer(self.retry_seconds, self.dispatch)
+        self._retry_timer.daemon = True
+        self._retry_timer.start()
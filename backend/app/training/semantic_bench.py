@@ -0,0 +1,114 @@
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from .core import parse_model_output, tag_jaccard
+from .semantic_index import VectorIndex, load_embedder, SEMANTIC_CACHE_THRESHOLD, IVF_NPROBE
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3) if samples else None
+
+
+def load_rows(path):
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict) and isinstance(row.get("input"), str):
+                rows.append((row["input"], parse_model_output(row.get("output") or "")[0]))
+    return rows
+
+
+def timed_search(index, vectors, k=1):
+    latencies, results = [], []
+    for vector in vectors:
+        started = time.perf_counter()
+        results.append(index.search(vector, k=k))
+        latencies.append(time.perf_counter() - started)
+    return latencies, results
+
+
+def run(dataset, index_fraction=0.8, threshold=SEMANTIC_CACHE_THRESHOLD, scale=0, nprobe=IVF_NPROBE,
+        embedding_model="", seed=0):
+    """
+    Indexes part of a labelled dataset, queries it with the rest and reports:
+    embedding + lookup latency (flat vs IVF), the cache hit rate at `threshold` and how
+    often a hit's techniques match the query's gold labels (what "fast" mode would get right).
+    `scale` pads the index with jittered copies to see lookup latency at a larger size.
+    """
+    rows = load_rows(dataset)
+    random.Random(seed).shuffle(rows)
+    split = int(len(rows) * index_fraction)
+    indexed, queries = rows[:split], rows[split:]
+    embedder = load_embedder(embedding_model)
+
+    embed_latencies, indexed_vectors = [], []
+    for text, _ in indexed:
+        started = time.perf_counter()
+        indexed_vectors.append(embedder.embed(text))
+        embed_latencies.append(time.perf_counter() - started)
+    query_vectors = [embedder.embed(text) for text, _ in queries]
+
+    items = [(vector, {"techniques": labels}) for vector, (_, labels) in zip(indexed_vectors, indexed)]
+    rng = np.random.default_rng(seed)
+    for i in range(scale):
+        base = indexed_vectors[i % len(indexed_vectors)]
+        noisy = base + rng.normal(0, 0.05, size=base.shape).astype(np.float32)
+        items.append((noisy / np.linalg.norm(noisy), {"techniques": [], "padding": True}))
+
+    flat = VectorIndex(dim=embedder.dim, ivf_min_items=len(items) + 1)
+    flat.insert_many(items)
+    ivf = VectorIndex(dim=embedder.dim, ivf_min_items=0, nprobe=nprobe)
+    ivf.insert_many(items)
+
+    flat_latencies, flat_results = timed_search(flat, query_vectors)
+    ivf_latencies, ivf_results = timed_search(ivf, query_vectors)
+
+    hits, agreement, exact = 0, [], 0
+    for (_, labels), result in zip(queries, flat_results):
+        if result and result[0][0] >= threshold and not result[0][1].get("padding"):
+            hits += 1
+            agreement.append(tag_jaccard(labels, result[0][1]["techniques"]))
+            exact += set(labels) == set(result[0][1]["techniques"])
+    ivf_recall = [bool(f and i and f[0][1] is i[0][1]) for f, i in zip(flat_results, ivf_results)]
+
+    return {
+        "dataset": dataset,
+        "embedder": embedder.name,
+        "indexed": len(items),
+        "queries": len(queries),
+        "threshold": threshold,
+        "embed_ms": {"p50": percentile_ms(embed_latencies, 50), "p95": percentile_ms(embed_latencies, 95)},
+        "flat_search_ms": {"p50": percentile_ms(flat_latencies, 50), "p95": percentile_ms(flat_latencies, 95)},
+        "ivf_search_ms": {"p50": percentile_ms(ivf_latencies, 50), "p95": percentile_ms(ivf_latencies, 95)},
+        "ivf_nprobe": nprobe,
+        "ivf_recall_at_1": round(sum(ivf_recall) / len(ivf_recall), 3) if ivf_recall else None,
+        "hit_rate": round(hits / len(queries), 3) if queries else None,
+        "hit_tag_jaccard": round(sum(agreement) / len(agreement), 3) if agreement else None,
+        "hit_exact_match": round(exact / hits, 3) if hits else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency and hit-rate benchmark of the semantic result cache")
+    parser.add_argument("--dataset", type=str, required=True, help="Labelled JSONL (input/output rows)")
+    parser.add_argument("--index_fraction", type=float, default=0.8)
+    parser.add_argument("--threshold", type=float, default=SEMANTIC_CACHE_THRESHOLD)
+    parser.add_argument("--scale", type=int, default=0, help="Extra jittered vectors to pad the index with")
+    parser.add_argument("--nprobe", type=int, default=IVF_NPROBE)
+    parser.add_argument("--embedding_model", type=str, default="", help="sentence-transformers model (default: hashing)")
+    parser.add_argument("--output", type=str, default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.dataset, args.index_fraction, args.threshold, args.scale, args.nprobe, args.embedding_model)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,290 @@
+import base64
+import json
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from .core import parse_model_output
+from .near_dup import normalize_words
+
+EMBEDDING_DIM = 1024
+# Optional sentence-transformers model (CPU). Without it the hashing embedder is used, which is
+# lexical: fast-mode hits and evidence then need shared wording, a paraphrase with other words scores low
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+# Unrelated articles land around 0.25-0.3 with the hashing embedder
+EVIDENCE_MIN_SIMILARITY = float(os.getenv("EVIDENCE_MIN_SIMILARITY", "0.4"))
+# Below this size a flat scan is faster than probing clusters
+IVF_MIN_ITEMS = int(os.getenv("IVF_MIN_ITEMS", "20000"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+
+
+class HashingEmbedder:
+    """
+    Dependency-free text vector: word unigrams and bigrams feature-hashed into `dim`
+    buckets with sublinear term frequency, L2-normalised. Articles pushing the same
+    narrative share much of their vocabulary even when they are not copies.
+    This is a bag of words, not a sentence embedding: it knows nothing about synonyms or
+    meaning, so the "semantic" index built on it matches wording. EMBEDDING_MODEL swaps in
+    a real sentence-transformers model.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, text: str):
+        words = normalize_words(text)
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+        buckets = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        # Sign bit from the hash keeps collisions from only ever adding up
+        signs = np.where(buckets & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, buckets % self.dim, signs)
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SentenceTransformerEmbedder:
+    """sentence-transformers model on CPU (e.g. a multilingual MiniLM)."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed(self, text: str):
+        return self.model.encode(text, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def load_embedder(model_name: str = EMBEDDING_MODEL):
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            print(f"ERROR: Could not load embedding model {model_name}, using hashing embedder: {e}")
+    return HashingEmbedder()
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over normalised vectors with metadata.
+
+    Flat search is a single matrix-vector product. Once the index holds IVF_MIN_ITEMS
+    vectors, a k-means coarse quantiser (sqrt(n) lists) is trained and queries only scan
+    the `nprobe` closest lists; it is retrained whenever the index doubled. Inserts are
+    appended to a JSONL file (float16 vectors), like near_dup.MinHashIndex.
+    """
+
+    def __init__(self, path: str = None, dim: int = EMBEDDING_DIM, embedder_name: str = "",
+                 ivf_min_items: int = IVF_MIN_ITEMS, nprobe: int = IVF_NPROBE):
+        self.path = path
+        self.dim = dim
+        self.embedder_name = embedder_name
+        self.ivf_min_items = ivf_min_items
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        self._meta = []
+        self._centroids = None
+        self._lists = None
+        self._trained_at = 0
+        if path and os.path.exists(path) and not self._load():
+            self.clear()
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, vector, meta: dict):
+        self.insert_many([(vector, meta)])
+
+    def insert_many(self, items):
+        """items: iterable of (vector, meta); one append to the file for all of them."""
+        items = [(vector, meta) for vector, meta in items if np.any(vector)]
+        with self._lock:
+            for vector, meta in items:
+                self._add(vector, meta)
+            if self.path and items:
+                self._append(items)
+            self._maybe_train()
+
+    def search(self, vector, k: int = 5, threshold: float = 0.0):
+        """[(similarity, meta)] of the k nearest items at or above the threshold."""
+        with self._lock:
+            if self._size == 0 or not np.any(vector):
+                return []
+            if self._centroids is not None:
+                probe = np.argsort(-(self._centroids @ vector))[:self.nprobe]
+                candidates = np.concatenate([self._lists[c] for c in probe]) if len(probe) else np.array([], dtype=np.int64)
+                if len(candidates) == 0:
+                    return []
+                scores = self._vectors[candidates] @ vector
+            else:
+                candidates = np.arange(self._size)
+                scores = self._vectors[:self._size] @ vector
+
+            top = np.argsort(-scores)[:k]
+            return [(float(scores[i]), self._meta[candidates[i]]) for i in top if scores[i] >= threshold]
+
+    def has_meta(self, key, value) -> bool:
+        with self._lock:
+            return any(meta.get(key) == value for meta in self._meta)
+
+    def clear(self):
+        with self._lock:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._size = 0
+            self._meta = []
+            self._centroids = self._lists = None
+            self._trained_at = 0
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"header": self._header()}) + "\n")
+
+    def _header(self):
+        return {"dim": self.dim, "embedder": self.embedder_name}
+
+    def _add(self, vector, meta):
+        if self._size == len(self._vectors):
+            # Grow by doubling so appends stay amortised O(1)
+            grown = np.zeros((max(1024, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        idx = self._size
+        self._vectors[idx] = vector
+        self._meta.append(meta)
+        self._size += 1
+        if self._centroids is not None:
+            nearest = int(np.argmax(self._centroids @ vector))
+            self._lists[nearest] = np.append(self._lists[nearest], idx)
+
+    def _maybe_train(self):
+        if self._size < self.ivf_min_items or self._size < 2 * self._trained_at:
+            return
+        self._train_ivf()
+
+    def _train_ivf(self, iterations: int = 10, seed: int = 0):
+        """Spherical k-means on (a sample of) the vectors, then assigns every vector to a list."""
+        data = self._vectors[:self._size]
+        n_lists = max(1, int(np.sqrt(self._size)))
+        rng = np.random.default_rng(seed)
+        sample = data[rng.choice(self._size, size=min(self._size, n_lists * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assignment == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[c] = centroid / norm if norm else centroid
+
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assignment == c) for c in range(n_lists)]
+        self._trained_at = self._size
+        print(f"DEBUG: IVF index trained with {n_lists} lists over {self._size} vectors")
+
+    def _append(self, items):
+        new_file = not os.path.exists(self.path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            if new_file:
+                f.write(json.dumps({"header": self._header()}) + "\n")
+            for vector, meta in items:
+                encoded = base64.b64encode(np.asarray(vector, dtype=np.float16).tobytes()).decode("ascii")
+                f.write(json.dumps({"vec": encoded, "meta": meta}, ensure_ascii=False) + "\n")
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "header" in entry:
+                    if entry["header"] != self._header():
+                        print(f"DEBUG: {self.path} was built with another embedder, discarding it")
+                        return False
+                    continue
+                vector = np.frombuffer(base64.b64decode(entry["vec"]), dtype=np.float16).astype(np.float32)
+                self._add(vector, entry.get("meta") or {})
+        self._maybe_train()
+        return True
+
+
+class SemanticIndex:
+    """
+    Two vector indexes sharing one embedder: answers to earlier /analyze calls (used as a
+    cache in "fast" mode) and expert-labelled training examples (returned as evidence).
+    How semantic the matches are depends on the embedder (lexical by default, see
+    HashingEmbedder). Embedding and search are CPU-bound; call them off the event loop.
+    """
+
+    def __init__(self, cache_dir: str = "cache", embedder=None, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.embedder = embedder or load_embedder()
+        self.threshold = threshold
+        self.analyses = VectorIndex(os.path.join(cache_dir, "semantic_analyses.jsonl"),
+                                    dim=self.embedder.dim, embedder_name=self.embedder.name)
+        self.labeled = VectorIndex(os.path.join(cache_dir, "semantic_labeled.jsonl"),
+                                   dim=self.embedder.dim, embedder_name=self.embedder.name)
+
+    def embed(self, text: str):
+        return self.embedder.embed(text)
+
+    def lookup(self, text: str, model: str, fast: bool = False):
+        """(vector, evidence, cached_result or None) of an /analyze input in one call."""
+        vector = self.embed(text)
+        return vector, self.evidence(vector), self.cached_result(vector, model) if fast else None
+
+    def cached_result(self, vector, model: str):
+        """Result of the most similar earlier analysis by the same model, if similar enough."""
+        for similarity, meta in self.analyses.search(vector, k=3, threshold=self.threshold):
+            if meta.get("model") == model:
+                return similarity, meta
+        return None
+
+    def add_analysis(self, vector, model: str, result: dict, preview: str):
+        self.analyses.insert(vector, {"model": model, "result": result, "preview": preview})
+
+    def _labeled_item(self, text, techniques, source):
+        return self.embed(text), {"techniques": techniques, "preview": text[:300], "source": source}
+
+    def add_labeled(self, text: str, techniques: list, source: str):
+        self.labeled.insert(*self._labeled_item(text, techniques, source))
+
+    def index_dataset(self, path: str, source: str = None) -> int:
+        """
+        Adds the labelled rows of a training JSONL file; a file already indexed under the
+        same source name is skipped, so this is safe to call on every startup.
+        """
+        source = source or os.path.basename(path)
+        if not os.path.exists(path) or self.labeled.has_meta("source", source):
+            return 0
+        items = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(row, dict) or not isinstance(row.get("input"), str):
+                    continue
+                techniques, _, _ = parse_model_output(row.get("output") or "")
+                items.append(self._labeled_item(row["input"], techniques, source))
+        self.labeled.insert_many(items)
+        print(f"DEBUG: Indexed {len(items)} labelled examples of {path} for evidence lookup")
+        return len(items)
+
+    def evidence(self, vector, k: int = 3):
+        """Nearest labelled examples, for the frontend to show next to the model's answer."""
+        return [dict(meta, similarity=round(similarity, 3))
+                for similarity, meta in self.labeled.search(vector, k=k, threshold=EVIDENCE_MIN_SIMILARITY)]
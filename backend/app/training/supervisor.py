@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import threading
+from datetime import datetime
+
+KILL_GRACE_SECONDS = 10.0
+
+
+class ProcessResult:
+    def __init__(self, name: str, status: str, returncode, result: dict = None):
+        self.name = name
+        self.status = status  # "succeeded", "failed", "timeout", "cancelled"
+        self.returncode = returncode
+        self.result = result or {}
+
+    @property
+    def ok(self):
+        return self.status == "succeeded"
+
+    def __repr__(self):
+        return f"ProcessResult({self.name!r}, {self.status!r}, returncode={self.returncode})"
+
+
+def kill_process_tree(pid: int):
+    """Terminates a process with all its children (wsl.exe -> python inside WSL)."""
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True, check=False)
+        return
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ProcessSupervisor:
+    """
+    Runs the trainer, benchmark and converter as asyncio subprocesses on a dedicated
+    event loop thread, so they can be started from request handlers, scheduler
+    callbacks or worker threads alike.
+
+    Each process gets its output streamed line by line into its log file, an optional
+    timeout and cancellation by name. Processes are always awaited, so no handle stays
+    open and no zombie is left behind. The outcome is read from a JSON result file
+    written by the child instead of grepping its prints.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._tasks = {}  # name -> asyncio.Task
+        self._pids = {}  # name -> pid
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="process-supervisor", daemon=True)
+        self._thread.start()
+
+    def start(self, name: str, cmd, log_path: str, timeout: float = None,
+              result_file: str = None, on_line=None, on_start=None):
+        """
+        Schedules `cmd` (shell string or argv list) and returns a concurrent.futures.Future
+        resolving to a ProcessResult. Await it from async code with asyncio.wrap_future().
+        `on_start(pid)` and `on_line(line)` are called from the supervisor thread.
+        """
+        with self._lock:
+            if name in self._tasks:
+                raise RuntimeError(f"Process '{name}' is already running")
+
+        async def create_task():
+            task = asyncio.current_task()
+            with self._lock:
+                self._tasks[name] = task
+            try:
+                return await self._run(name, cmd, log_path, timeout, result_file, on_line, on_start)
+            finally:
+                with self._lock:
+                    self._tasks.pop(name, None)
+                    self._pids.pop(name, None)
+
+        return asyncio.run_coroutine_threadsafe(create_task(), self._loop)
+
+    def cancel(self, name: str) -> bool:
+        with self._lock:
+            task = self._tasks.get(name)
+        if task is None:
+            return False
+        self._loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    def is_running(self, name: str) -> bool:
+        with self._lock:
+            return name in self._tasks
+
+    def running(self) -> dict:
+        with self._lock:
+            return dict(self._pids)
+
+    async def _run(self, name, cmd, log_path, timeout, result_file, on_line, on_start):
+        if result_file and os.path.exists(result_file):
+            os.remove(result_file)
+
+        log_dir = os.path.dirname(log_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+
+        # Own process group on POSIX so the whole tree can be signalled
+        popen_kwargs = {} if os.name == "nt" else {"start_new_session": True}
+        if isinstance(cmd, str):
+            process = await asyncio.create_subprocess_shell(
+                cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, **popen_kwargs)
+        else:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, **popen_kwargs)
+
+        with self._lock:
+            self._pids[name] = process.pid
+        if on_start:
+            on_start(process.pid)
+
+        status = "failed"
+        with open(log_path, "a", encoding="utf-8") as f_log:
+            f_log.write(f"--- {name} started at {datetime.utcnow()} (PID {process.pid}) ---\n")
+            f_log.flush()
+
+            async def pump():
+                while True:
+                    line = await process.stdout.readline()
+                    if not line:
+                        break
+                    decoded = line.decode("utf-8", errors="replace").rstrip()
+                    f_log.write(f"{decoded}\n")
+                    f_log.flush()
+                    if on_line:
+                        on_line(decoded)
+                await process.wait()
+
+            try:
+                await asyncio.wait_for(pump(), timeout)
+                status = "succeeded" if process.returncode == 0 else "failed"
+            except asyncio.TimeoutError:
+                status = "timeout"
+                f_log.write(f"--- {name} timed out after {timeout}s ---\n")
+                await self._terminate(process)
+            except asyncio.CancelledError:
+                status = "cancelled"
+                f_log.write(f"--- {name} cancelled ---\n")
+                await self._terminate(process)
+            f_log.write(f"--- {name} finished: {status} (code {process.returncode}) ---\n")
+
+        result = None
+        if status == "succeeded" and result_file:
+            try:
+                with open(result_file, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"ERROR: {name} produced no readable result file {result_file}: {e}")
+                status = "failed"
+
+        return ProcessResult(name, status, process.returncode, result)
+
+    async def _terminate(self, process):
+        if process.returncode is None:
+            kill_process_tree(process.pid)
+            try:
+                await asyncio.wait_for(process.wait(), KILL_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
@@ -0,0 +1,149 @@
+import csv
+import os
+import time
+
+# Per-step training telemetry: one CSV row per optimizer step, written while the run goes.
+# Plain Python like core.py; the device probe is handed in, so this runs (and is testable) without torch.
+
+COLUMNS = ["step", "elapsed_s", "step_s", "data_wait_s", "samples", "tokens", "samples_per_s",
+           "tokens_per_s", "loss", "learning_rate", "peak_allocated_mb", "peak_reserved_mb"]
+
+
+def cuda_memory_probe(torch):
+    """Peak allocated/reserved CUDA memory since the previous call (None without a GPU)."""
+    def probe():
+        if not torch.cuda.is_available():
+            return None
+        peak = {
+            "peak_allocated_mb": round(torch.cuda.max_memory_allocated() / 2 ** 20, 1),
+            "peak_reserved_mb": round(torch.cuda.max_memory_reserved() / 2 ** 20, 1),
+        }
+        # Per-step peaks instead of the high-water mark of the whole run
+        torch.cuda.reset_peak_memory_stats()
+        return peak
+    return probe
+
+
+class StepTelemetry:
+    """
+    Records one row per optimizer step into `path` (CSV).
+
+    The trainer callback calls step_begin()/step_end() around each step and log() with
+    the Trainer's logs (loss, learning_rate); the data collator reports every batch
+    through add_batch(). Time between the end of a step and the start of the next one
+    is the dataloader wait (fetching + collating the next batches).
+    `clock` and `memory_probe` are injectable for CPU-only use.
+    """
+
+    def __init__(self, path: str, clock=time.perf_counter, memory_probe=None):
+        self.path = path
+        self.clock = clock
+        self.memory_probe = memory_probe
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+        self._writer.writeheader()
+        self._started = None
+        self._step_started = None
+        self._last_step_end = None
+        self._samples = 0
+        self._tokens = 0
+        self._pending = None
+        self.totals = {"steps": 0, "step_s": 0.0, "data_wait_s": 0.0, "samples": 0, "tokens": 0,
+                       "peak_allocated_mb": None, "peak_reserved_mb": None}
+
+    def add_batch(self, samples: int, tokens: int):
+        self._samples += samples
+        self._tokens += tokens
+
+    def step_begin(self):
+        now = self.clock()
+        if self._started is None:
+            self._started = now
+        self._step_started = now
+
+    def step_end(self, step: int):
+        now = self.clock()
+        if self._step_started is None:
+            self.step_begin()
+        # A step whose loss never got logged (logging_steps > 1) is written as is
+        self._write_pending()
+        data_wait = self._step_started - self._last_step_end if self._last_step_end is not None else 0.0
+        step_s = now - (self._last_step_end if self._last_step_end is not None else self._step_started)
+        row = {
+            "step": step,
+            "elapsed_s": round(now - self._started, 3),
+            "step_s": round(step_s, 4),
+            "data_wait_s": round(data_wait, 4),
+            "samples": self._samples,
+            "tokens": self._tokens,
+            "samples_per_s": round(self._samples / step_s, 2) if step_s > 0 else None,
+            "tokens_per_s": round(self._tokens / step_s, 1) if step_s > 0 else None,
+        }
+        memory = self.memory_probe() if self.memory_probe else None
+        if memory:
+            row.update(memory)
+            for key in ("peak_allocated_mb", "peak_reserved_mb"):
+                if memory.get(key) is not None:
+                    self.totals[key] = max(self.totals[key] or 0, memory[key])
+        self.totals["steps"] += 1
+        self.totals["step_s"] += step_s
+        self.totals["data_wait_s"] += data_wait
+        self.totals["samples"] += self._samples
+        self.totals["tokens"] += self._tokens
+        self._samples = self._tokens = 0
+        self._last_step_end = now
+        self._step_started = None
+        self._pending = row
+
+    def log(self, logs: dict):
+        """Trainer logs come right after step_end(); attaches loss and LR to that step's row."""
+        if self._pending is None or not logs:
+            return
+        if "loss" in logs:
+            self._pending["loss"] = round(float(logs["loss"]), 5)
+        if "learning_rate" in logs:
+            self._pending["learning_rate"] = float(logs["learning_rate"])
+        self._write_pending()
+
+    def close(self):
+        self._write_pending()
+        self._file.close()
+
+    def summary(self) -> dict:
+        t = self.totals
+        return {
+            "telemetry_file": self.path,
+            "steps": t["steps"],
+            "tokens_per_sec": round(t["tokens"] / t["step_s"], 1) if t["step_s"] else None,
+            "samples_per_sec": round(t["samples"] / t["step_s"], 2) if t["step_s"] else None,
+            "data_wait_share": round(t["data_wait_s"] / t["step_s"], 4) if t["step_s"] else None,
+            "peak_allocated_mb": t["peak_allocated_mb"],
+            "peak_reserved_mb": t["peak_reserved_mb"],
+        }
+
+    def _write_pending(self):
+        if self._pending is not None:
+            self._writer.writerow(self._pending)
+            # Flushed per step, so the endpoint can plot a run that is still going
+            self._file.flush()
+            self._pending = None
+
+
+def load_telemetry(path: str, max_points: int = None) -> dict:
+    """Column-oriented series from a telemetry CSV, evenly thinned to at most `max_points` rows."""
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    if max_points and len(rows) > max_points:
+        stride = len(rows) / max_points
+        # Keep the last step so a plot ends where the run is
+        rows = [rows[int(i * stride)] for i in range(max_points - 1)] + [rows[-1]]
+    series = {}
+    for column in COLUMNS:
+        values = []
+        for row in rows:
+            value = row.get(column)
+            values.append(float(value) if value not in (None, "") else None)
+        series[column] = values
+    series["step"] = [int(v) if v is not None else None for v in series["step"]]
+    return {"points": len(rows), "series": series}
@@ -1,52 +1,114 @@
 import os
-import torch
-from unsloth import FastLanguageModel
-from trl import SFTTrainer, SFTConfig
-from datasets import load_dataset
-from unsloth.chat_templates import get_chat_template, train_on_responses_only
-
-import requests
-from transformers import TrainerCallback
-
-class ProgressCallback(TrainerCallback):
-    def __init__(self, backend_url):
-        self.backend_url = backend_url
-
-    def on_log(self, args, state, control, logs=None, **kwargs):
-        if state.max_steps > 0:
-            progress = int((state.global_step / state.max_steps) * 100)
-            try:
-                # print(f"DEBUG: Reporting progress {progress}% to {self.backend_url}", file=sys.stderr, flush=True)
-                requests.post(f"{self.backend_url}/training/progress", 
-                              json={"stage": "training", "value": progress},
-                              timeout=1)
-            except Exception as e:
-                print(f"Failed to report progress to {self.backend_url}: {e}", file=sys.stderr, flush=True)
+# torch / unsloth / trl / transformers are imported in run_sft, so --help and importing this module stay fast
+from .progress_reporter import ProgressReporter
+from .dataset_cache import TokenizedDatasetCache, prepare_batching, BATCHING_MODES
+from .truncation import Truncator, HFTokenizer, STRATEGIES
+from .scheduler import query_gpu_memory
+from .telemetry import StepTelemetry, cuda_memory_probe
+
+# Slack for tokens that merge differently once the article is inside the template
+TEMPLATE_MARGIN_TOKENS = 8
+
+def progress_callback(reporter: ProgressReporter):
+    """TrainerCallback forwarding the step progress to the backend (defined here to keep transformers lazy)."""
+    from transformers import TrainerCallback
+
+    class ProgressCallback(TrainerCallback):
+        def __init__(self, reporter: ProgressReporter):
+            self.reporter = reporter
+            self.last_progress = None
+
+        def on_log(self, args, state, control, logs=None, **kwargs):
+            if state.max_steps > 0:
+                progress = int((state.global_step / state.max_steps) * 100)
+                # Only hand over changed values; the reporter coalesces and rate-limits the rest
+                if progress != self.last_progress:
+                    self.last_progress = progress
+                    self.reporter.report("training", progress)
+
+    return ProgressCallback(reporter)
+
+def telemetry_callback(telemetry: StepTelemetry):
+    """TrainerCallback feeding per-step timings, loss and LR into a StepTelemetry."""
+    from transformers import TrainerCallback
+
+    class TelemetryCallback(TrainerCallback):
+        def __init__(self, telemetry: StepTelemetry):
+            self.telemetry = telemetry
+
+        def on_step_begin(self, args, state, control, **kwargs):
+            self.telemetry.step_begin()
+
+        def on_step_end(self, args, state, control, **kwargs):
+            self.telemetry.step_end(state.global_step)
+
+        def on_log(self, args, state, control, logs=None, **kwargs):
+            self.telemetry.log(logs)
+
+    return TelemetryCallback(telemetry)
+
+def counting_collator(collator, telemetry: StepTelemetry):
+    """Wraps the data collator to report samples and real (non-padding) tokens of every batch."""
+    def collate(features):
+        batch = collator(features)
+        if "attention_mask" in batch:
+            tokens = int(batch["attention_mask"].sum())
+        else:
+            tokens = int(batch["input_ids"].numel())
+        telemetry.add_batch(len(features), tokens)
+        return batch
+    return collate
+
+def position_ids_collator(collator, padding_side: str = "right"):
+    """Pads the position_ids of packed rows, which the LM collator doesn't know about, to the batch width."""
+    def collate(features):
+        if "position_ids" not in features[0]:
+            return collator(features)
+        features = [dict(f) for f in features]
+        positions = [list(f.pop("position_ids")) for f in features]
+        batch = collator(features)
+        import torch
+        width = batch["input_ids"].shape[1]
+        padded = [[0] * (width - len(p)) + p if padding_side == "left" else p + [0] * (width - len(p))
+                  for p in positions]
+        batch["position_ids"] = torch.tensor(padded, dtype=torch.long)
+        return batch
+    return collate
 
 class ModelTrainer:
     def __init__(self, base_model="unsloth/bielik-7b-v1.1-bnb-4bit", output_dir="./model/latest"):
         self.base_model = base_model
         self.output_dir = output_dir
         self.max_seq_length = 2048
+        self.last_stats = {}
 
-    def run_sft(self, dataset_path, max_steps=60, backend_url="http://localhost:8000"):
+    def run_sft(self, dataset_path, max_steps=60, backend_url="http://localhost:8000", run_id=None,
+                batching="default", batch_size=1, cache_dir="./model/dataset_cache", truncation="head",
+                init_adapter=None, epochs=2, learning_rate=2e-4, telemetry_file=None):
         """
         Implementation of 2.2: SFT with QLoRA & Long Context
         NOTE: This requires a Linux environment (or WSL2) and a compatible GPU.
+        `batching`: "default" (arrival order), "group_by_length" or "packing".
+        `truncation`: how over-long articles are cut, see truncation.Truncator.
+        `init_adapter`: adapter (or checkpoint-*) dir to continue from instead of a fresh LoRA.
+        `telemetry_file`: per-step CSV (step time, tokens/s, loss, LR, peak memory, dataloader wait).
         """
         if os.name == 'nt':
             print("WARNING: Unsloth is optimized for Linux. Running on Windows may fail.")
 
         import sys
-        import subprocess
+        # unsloth first: it patches transformers/trl when imported
+        from unsloth import FastLanguageModel
+        import torch
+        from trl import SFTTrainer
+        from transformers import DataCollatorForLanguageModeling
+
         # DEBUG: Print REAL system VRAM via nvidia-smi
-        try:
-            cmd = "nvidia-smi --query-gpu=memory.total,memory.used,memory.free --format=csv,noheader"
-            output = subprocess.check_output(cmd, shell=True).decode().strip()
-            total, used, free = output.split(',')
-            print(f"DEBUG [nvidia-smi]: Total: {total}, Used: {used}, Free: {free}", file=sys.stderr, flush=True)
-        except Exception as e:
-            print(f"DEBUG: Could not run nvidia-smi: {e}", file=sys.stderr, flush=True)
+        vram = query_gpu_memory()
+        if vram:
+            print(f"DEBUG [nvidia-smi]: Total: {vram['total']} MiB, Used: {vram['used']} MiB, Free: {vram['free']} MiB", file=sys.stderr, flush=True)
+        else:
+            print("DEBUG: Could not run nvidia-smi", file=sys.stderr, flush=True)
 
         max_seq_length = 1024 # Increased to fit 795t data, safe with Paged AdamW
         
@@ -72,45 +134,71 @@ class ModelTrainer:
             loftq_config = None,
         )
 
-        # 3. Load Data
-        dataset = load_dataset("json", data_files=dataset_path, split="train")
+        if init_adapter:
+            # Incremental run: same LoRA layout, weights of the current adapter as the starting point
+            from peft import set_peft_model_state_dict
+            from safetensors.torch import load_file
+            weights = load_file(os.path.join(init_adapter, "adapter_model.safetensors"))
+            load_result = set_peft_model_state_dict(model, weights)
+            if getattr(load_result, "unexpected_keys", None):
+                print(f"WARNING: {len(load_result.unexpected_keys)} adapter weights did not match the LoRA config", file=sys.stderr, flush=True)
+            print(f"DEBUG: Continuing from adapter {init_adapter}", file=sys.stderr, flush=True)
+
+        # 3. Load Data (tokenized once per dataset/tokenizer/template, then memory-mapped from the cache)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        truncator = Truncator(HFTokenizer(tokenizer), strategy=truncation)
+
+        def render(input_text, output_text):
+            messages = [
+                {"role": "user", "content": input_text},
+                {"role": "assistant", "content": output_text}
+            ]
+            return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)
+
+        def format_example(input_text, output_text):
+            # The article gets whatever the chat template and the answer leave of max_seq_length
+            # (prevents OOM on 16k token articles without wasting context on short answers)
+            budget = max_seq_length - truncator.count(render("", output_text)) - TEMPLATE_MARGIN_TOKENS
+            truncated_input, _ = truncator.truncate(input_text, budget)
+            return render(truncated_input, output_text)
+
+        dataset, cache_stats = TokenizedDatasetCache(cache_dir).load(
+            dataset_path, tokenizer, format_example,
+            template_id=f"user-assistant/tokens-{truncation}", max_seq_length=max_seq_length,
+            clip_report=truncator.report
+        )
+        if "clipping" in cache_stats:
+            print(f"DEBUG: Truncation ({truncation}): {cache_stats['clipping']}", flush=True)
+        dataset, batching_stats = prepare_batching(dataset, batching, batch_size, max_seq_length,
+                                                   separator_id=tokenizer.eos_token_id)
+        print(f"DEBUG: Batching {batching}: padding ratio {batching_stats['padding_ratio']} "
+              f"(default order: {batching_stats['padding_ratio_default']})", flush=True)
         
         # 4. Setup Trainer
         from transformers import TrainingArguments
-        
-        def formatting_prompts_func(examples):
-            convos = []
-            texts = []
-            mapper = {"input": "user", "output": "assistant"}
-            for input_text, output_text in zip(examples["input"], examples["output"]):
-                # Manual Truncation: 1024 tokens ~= 4000 chars. 
-                # We limit input article to 3500 chars to save room for output and system prompts.
-                # This prevents OOM on 16k token articles.
-                truncated_input = input_text[:3500] + "...(truncated)" if len(input_text) > 3500 else input_text
-                
-                messages = [
-                    {"role": "user", "content": truncated_input},
-                    {"role": "assistant", "content": output_text}
-                ]
-                texts.append(tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False))
-            return texts
+
+        reporter = ProgressReporter(backend_url, run_id=run_id)
+        telemetry = StepTelemetry(telemetry_file or os.path.join(self.output_dir, "telemetry.csv"),
+                                  memory_probe=cuda_memory_probe(torch))
 
         trainer = SFTTrainer(
             model = model,
             tokenizer = tokenizer,
             train_dataset = dataset,
-            dataset_text_field = "text",
             max_seq_length = max_seq_length,
-            dataset_num_proc = 2,
-            packing = False,
-            formatting_func = formatting_prompts_func,
+            packing = False, # packing (if requested) is already done on the cached dataset
+            dataset_kwargs = {"skip_prepare_dataset": True},
+            data_collator = counting_collator(position_ids_collator(DataCollatorForLanguageModeling(tokenizer, mlm=False),
+                                                                    tokenizer.padding_side), telemetry),
             args = TrainingArguments(
-                per_device_train_batch_size = 1,
+                per_device_train_batch_size = batch_size,
                 gradient_accumulation_steps = 4, # Reduced from 8 to save interaction memory
                 warmup_steps = 5,
                 gradient_checkpointing = True, # CRITICAL FIX for VRAM
-                num_train_epochs = 2,
-                learning_rate = 2e-4,
+                num_train_epochs = epochs,
+                learning_rate = learning_rate,
                 fp16 = not torch.cuda.is_bf16_supported(),
                 bf16 = torch.cuda.is_bf16_supported(),
                 logging_steps = 1,
@@ -119,12 +207,29 @@ class ModelTrainer:
                 lr_scheduler_type = "linear",
                 seed = 3407,
                 output_dir = self.output_dir,
+                group_by_length = batching == "group_by_length",
+                length_column_name = "length",
             ),
-            callbacks=[ProgressCallback(backend_url)]
+            callbacks=[progress_callback(reporter), telemetry_callback(telemetry)]
         )
 
         # 5. Execute Training
-        trainer_stats = trainer.train()
+        try:
+            trainer_stats = trainer.train()
+        finally:
+            reporter.close()
+            telemetry.close()
+
+        runtime = trainer_stats.metrics.get("train_runtime") or 0
+        trained_tokens = cache_stats["tokens"] * trainer.args.num_train_epochs
+        self.last_stats = {
+            **cache_stats,
+            **batching_stats,
+            "train_runtime": runtime,
+            "train_tokens_per_sec": round(trained_tokens / runtime, 1) if runtime else None,
+            "telemetry": telemetry.summary(),
+        }
+        print(f"DEBUG: Training throughput {self.last_stats['train_tokens_per_sec']} tokens/s", flush=True)
         
         # 6. Save Adapter (HF)
         adapter_path = f"{self.output_dir}/adapter"
@@ -144,18 +249,40 @@ if __name__ == "__main__":
     parser.add_argument("--output", type=str, default="./model/latest", help="Output directory")
     parser.add_argument("--base", type=str, default="unsloth/mistral-7b-bnb-4bit", help="Base model path")
     parser.add_argument("--backend", type=str, default="http://localhost:8000", help="Backend URL")
+    parser.add_argument("--run-id", type=int, default=None, help="TrainingRun id, echoed in callbacks to the backend")
+    parser.add_argument("--batching", type=str, default="default", choices=BATCHING_MODES, help="Batch composition")
+    parser.add_argument("--batch_size", type=int, default=1, help="Per-device train batch size")
+    parser.add_argument("--cache_dir", type=str, default="./model/dataset_cache", help="Tokenized dataset cache")
+    parser.add_argument("--truncation", type=str, default="head", choices=STRATEGIES, help="How over-long articles are cut")
+    parser.add_argument("--init_adapter", type=str, default=None, help="Continue training this adapter / checkpoint dir")
+    parser.add_argument("--epochs", type=float, default=2, help="Number of training epochs")
+    parser.add_argument("--learning_rate", type=float, default=2e-4, help="Peak learning rate")
+    parser.add_argument("--result_file", type=str, default=None, help="Write the result (adapter path) as JSON here")
+    parser.add_argument("--telemetry_file", type=str, default=None, help="Per-step telemetry CSV (default: <output>/telemetry.csv)")
     args = parser.parse_args()
 
     # Note: Inside WSL, make sure path exists
     trainer_instance = ModelTrainer(base_model=args.base, output_dir=args.output)
     print(f"Starting training on {args.data}...")
-    adapter_path = trainer_instance.run_sft(dataset_path=args.data, backend_url=args.backend)
+    adapter_path = trainer_instance.run_sft(dataset_path=args.data, backend_url=args.backend, run_id=args.run_id,
+                                          batching=args.batching, batch_size=args.batch_size,
+                                          cache_dir=args.cache_dir, truncation=args.truncation,
+                                          init_adapter=args.init_adapter, epochs=args.epochs,
+                                          learning_rate=args.learning_rate, telemetry_file=args.telemetry_file)
     print(f"Training finished. Adapter saved to: {adapter_path}")
 
+    if args.result_file:
+        import json
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump({"adapter_path": adapter_path, "data_stats": trainer_instance.last_stats}, f)
+
     # Notify backend (from inside WSL to Windows Host)
     import requests
     try:
-        requests.post(f"{args.backend}/training/complete?adapter_path={adapter_path}")
+        params = {"adapter_path": adapter_path}
+        if args.run_id is not None:
+            params["run_id"] = args.run_id
+        requests.post(f"{args.backend}/training/complete", params=params)
         print("Backend notified of completion.")
     except Exception as e:
         print(f"Failed to notify backend: {e}")
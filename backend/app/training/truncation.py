@@ -0,0 +1,161 @@
+import os
+import re
+
+STRATEGIES = ("head", "head_tail", "sentence")
+# head | head_tail | sentence, same cut for training, benchmark and /analyze
+TRUNCATION_STRATEGY = os.getenv("TRUNCATION_STRATEGY", "head")
+TRUNCATION_MARKER = "...(truncated)"
+# Rough chars-per-token of the Bielik tokenizer on Polish news text, used when no
+# tokenizer is available (backend without tokenizer.json)
+CHARS_PER_TOKEN = 3.5
+# head_tail keeps this share of the budget from the start of the text
+HEAD_SHARE = 0.7
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+class HFTokenizer:
+    """Adapter for a transformers tokenizer (trainer and benchmark, inside WSL)."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.name = getattr(tokenizer, "name_or_path", type(tokenizer).__name__)
+
+    def encode(self, text: str) -> list:
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def decode(self, ids: list) -> str:
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+
+class FastTokenizer:
+    """Adapter for a `tokenizers` Tokenizer loaded from tokenizer.json (backend, no torch)."""
+
+    def __init__(self, tokenizer, name: str):
+        self.tokenizer = tokenizer
+        self.name = name
+
+    def encode(self, text: str) -> list:
+        return self.tokenizer.encode(text, add_special_tokens=False).ids
+
+    def decode(self, ids: list) -> str:
+        return self.tokenizer.decode(ids)
+
+
+class CharTokenizer:
+    """Fallback that treats every CHARS_PER_TOKEN characters as one token."""
+
+    name = f"chars/{CHARS_PER_TOKEN}"
+
+    def encode(self, text: str) -> list:
+        n_tokens = int(len(text) / CHARS_PER_TOKEN + 0.999)
+        bounds = [int(i * CHARS_PER_TOKEN) for i in range(n_tokens)] + [len(text)]
+        return [text[bounds[i]:bounds[i + 1]] for i in range(n_tokens)]
+
+    def decode(self, ids: list) -> str:
+        return "".join(ids)
+
+
+def load_tokenizer(path: str = None):
+    """
+    Loads tokenizer.json with the lightweight `tokenizers` package when both are present,
+    so the API counts the same tokens as the model; otherwise falls back to CharTokenizer.
+    """
+    if path and os.path.exists(path):
+        try:
+            from tokenizers import Tokenizer
+            return FastTokenizer(Tokenizer.from_file(path), name=path)
+        except Exception as e:
+            print(f"ERROR: Could not load tokenizer {path}: {e}")
+    return CharTokenizer()
+
+
+class ClipReport:
+    """Counts how many texts were clipped and by how much."""
+
+    def __init__(self):
+        self.total = 0
+        self.clipped = 0
+        self.tokens_in = 0
+        self.tokens_clipped = 0
+        self.max_clipped = 0
+
+    def add(self, n_tokens: int, n_clipped: int):
+        self.total += 1
+        self.tokens_in += n_tokens
+        if n_clipped > 0:
+            self.clipped += 1
+            self.tokens_clipped += n_clipped
+            self.max_clipped = max(self.max_clipped, n_clipped)
+
+    def to_dict(self):
+        return {
+            "examples": self.total,
+            "clipped_examples": self.clipped,
+            "clipped_share": round(self.clipped / self.total, 4) if self.total else 0.0,
+            "tokens_clipped": self.tokens_clipped,
+            "clipped_token_share": round(self.tokens_clipped / self.tokens_in, 4) if self.tokens_in else 0.0,
+            "max_tokens_clipped": self.max_clipped,
+        }
+
+
+class Truncator:
+    """
+    Cuts a text down to a token budget of the given tokenizer.
+
+    Strategies:
+      head      - first N tokens
+      head_tail - start and end of the text (articles often conclude with the claim)
+      sentence  - as many whole sentences from the start as fit
+    Shared by the trainer, the benchmark prompt and the /analyze endpoint so all three
+    see the same input for the same text.
+    """
+
+    def __init__(self, tokenizer, strategy: str = "head", marker: str = TRUNCATION_MARKER):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown truncation strategy: {strategy}")
+        self.tokenizer = tokenizer
+        self.strategy = strategy
+        self.marker = marker
+        self.marker_tokens = len(tokenizer.encode(marker))
+        self.report = ClipReport()
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text))
+
+    def truncate(self, text: str, max_tokens: int):
+        """Returns (text, clipped_tokens)."""
+        ids = self.tokenizer.encode(text)
+        if len(ids) <= max_tokens:
+            self.report.add(len(ids), 0)
+            return text, 0
+
+        budget = max(max_tokens - self.marker_tokens, 1)
+        if self.strategy == "head_tail":
+            head = int(budget * HEAD_SHARE)
+            tail = budget - head
+            result = (self.tokenizer.decode(ids[:head]) + self.marker +
+                      (self.tokenizer.decode(ids[-tail:]) if tail else ""))
+            kept = head + tail
+        elif self.strategy == "sentence":
+            result, kept = self._sentences(text, budget)
+            if not kept:
+                # First sentence alone is too long
+                result, kept = self.tokenizer.decode(ids[:budget]), budget
+            result += self.marker
+        else:
+            result, kept = self.tokenizer.decode(ids[:budget]) + self.marker, budget
+
+        clipped = len(ids) - kept
+        self.report.add(len(ids), clipped)
+        return result, clipped
+
+    def _sentences(self, text, budget):
+        kept_text, kept = [], 0
+        for sentence in SENTENCE_END.split(text):
+            n = len(self.tokenizer.encode(sentence + " "))
+            if kept + n > budget:
+                break
+            kept_text.append(sentence)
+            kept += n
+        return " ".join(kept_text), kept
@@ -0,0 +1,140 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+
+from app.serving.fake_upstream import create_fake_upstream
+from app.serving.router import RouterBackend, EJECT_AFTER_FAILURES
+
+CAP = 3
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeUpstreams:
+    """Fake Ollama servers (serving/fake_upstream.py) on local ports, one uvicorn thread each."""
+
+    def __init__(self, latencies_ms):
+        self.apps, self.urls, self._servers = [], [], []
+        for latency_ms in latencies_ms:
+            app = create_fake_upstream(latency_ms)
+            port = free_port()
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+            threading.Thread(target=server.run, daemon=True).start()
+            self.apps.append(app)
+            self.urls.append(f"http://127.0.0.1:{port}")
+            self._servers.append(server)
+        deadline = time.monotonic() + 10
+        while not all(server.started for server in self._servers):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake upstreams did not start")
+            time.sleep(0.05)
+
+    def state(self, i):
+        return self.apps[i].state.fake
+
+    def reset(self):
+        for app in self.apps:
+            app.state.fake.update(down=False, chats=0)
+
+    def stop(self):
+        for server in self._servers:
+            server.should_exit = True
+
+
+@pytest.fixture(scope="module")
+def upstreams():
+    fakes = FakeUpstreams([20, 20, 200])
+    yield fakes
+    fakes.stop()
+
+
+@pytest.fixture
+def router(upstreams):
+    upstreams.reset()
+    # Health checks are driven by the tests, not by the background loop
+    return RouterBackend([f"{url}|{CAP}" for url in upstreams.urls], health_interval=3600)
+
+
+def run(router, scenario):
+    async def main():
+        await router.start()
+        try:
+            return await scenario()
+        finally:
+            await router.close()
+    return asyncio.run(main())
+
+
+def test_least_outstanding_spreads_load_and_respects_caps(router):
+    peak = [0] * len(router.upstreams)
+
+    async def scenario():
+        async def sample():
+            while True:
+                for i, upstream in enumerate(router.upstreams):
+                    peak[i] = max(peak[i], upstream.outstanding)
+                await asyncio.sleep(0.002)
+
+        sampler = asyncio.create_task(sample())
+        answers = await asyncio.gather(*(router.chat(f"artykuł {i}") for i in range(60)))
+        sampler.cancel()
+        return answers
+
+    answers = run(router, scenario)
+    served = [upstream.served for upstream in router.upstreams]
+
+    assert len(answers) == 60
+    assert sum(served) == 60
+    assert max(peak) <= CAP
+    # The slow upstream holds its slots ten times longer, so it gets far fewer requests
+    assert served[2] < served[0] and served[2] < served[1]
+    assert all(upstream.outstanding == 0 for upstream in router.upstreams)
+
+
+def test_failing_upstream_is_ejected_and_its_requests_retried(router, upstreams):
+    async def scenario():
+        # Goes down after the startup health check: only failed requests can eject it
+        upstreams.state(0)["down"] = True
+        return [await router.chat(f"artykuł {i}") for i in range(30)]
+
+    answers = run(router, scenario)
+    failing = router.upstreams[0]
+
+    # Every request still got an answer from another upstream
+    assert len(answers) == 30
+    assert all(answer["upstream"] != failing.base_url for answer in answers)
+    assert failing.ejected
+    assert failing.errors == EJECT_AFTER_FAILURES
+    assert upstreams.state(0)["chats"] == EJECT_AFTER_FAILURES
+    assert router.status()["upstreams"][0]["healthy"] is False
+
+
+def test_failed_health_check_ejects_and_a_passing_one_readmits(router, upstreams):
+    async def scenario():
+        upstreams.state(1)["down"] = True
+        await router.check_health()
+        ejected = router.upstreams[1].ejected
+        served_while_ejected = [(await router.chat(f"a {i}"))["upstream"] for i in range(10)]
+
+        upstreams.state(1)["down"] = False
+        await router.check_health()
+        readmitted = not router.upstreams[1].ejected
+        served_after = await asyncio.gather(*(router.chat(f"b {i}") for i in range(30)))
+        return ejected, served_while_ejected, readmitted, [answer["upstream"] for answer in served_after]
+
+    ejected, served_while_ejected, readmitted, served_after = run(router, scenario)
+    url = router.upstreams[1].base_url
+
+    assert ejected
+    assert url not in served_while_ejected
+    assert readmitted
+    assert router.upstreams[1].failures == 0
+    assert url in served_after
@@ -0,0 +1,154 @@
+import threading
+
+from app.training.scheduler import GpuScheduler
+
+VRAM = {"training": 7000, "benchmark": 5000}
+
+
+class FakeGpu:
+    """Stands in for query_gpu_memory(); tests move `free` around."""
+
+    def __init__(self, total=8000, free=8000):
+        self.total = total
+        self.free = free
+
+    def __call__(self):
+        return {"total": self.total, "used": self.total - self.free, "free": self.free}
+
+
+def make_scheduler(launched, probe=None, **kwargs):
+    def launcher(job):
+        launched.append(job)
+        return True
+
+    kwargs.setdefault("gpu_slots", 1)
+    # Long retry interval: tests call dispatch() themselves instead of waiting for the timer
+    return GpuScheduler(launcher, vram_requirements=VRAM, headroom_mb=500, probe=probe, retry_seconds=3600, **kwargs)
+
+
+def run_ids(jobs):
+    return [job.payload["run_id"] for job in jobs]
+
+
+def test_fifo_starts_one_job_per_slot_in_submission_order():
+    launched = []
+    scheduler = make_scheduler(launched)
+    jobs = [scheduler.submit("training", {"run_id": run_id}) for run_id in (1, 2, 3)]
+
+    assert run_ids(launched) == [1]
+    assert [scheduler.position(job) for job in jobs] == [None, 1, 2]
+
+    scheduler.complete(jobs[0])
+    assert run_ids(launched) == [1, 2]
+    scheduler.complete(jobs[1])
+    assert run_ids(launched) == [1, 2, 3]
+    assert jobs[0].state == "done"
+
+
+def test_priority_policy_lets_urgent_uploads_ahead():
+    launched = []
+    scheduler = make_scheduler(launched, policy="priority")
+    running = scheduler.submit("training", {"run_id": 1})
+    scheduler.submit("training", {"run_id": 2})
+    scheduler.submit("training", {"run_id": 3}, priority=5)
+
+    scheduler.complete(running)
+    assert run_ids(launched) == [1, 3]
+
+
+def test_benchmark_keeps_its_training_runs_place_in_line():
+    launched = []
+    scheduler = make_scheduler(launched)
+    training = scheduler.submit("training", {"run_id": 1})
+    scheduler.submit("training", {"run_id": 2})
+
+    benchmark = scheduler.submit("benchmark", {"run_id": 1}, after=training)
+    scheduler.complete(training)
+    assert [(job.kind, job.payload["run_id"]) for job in launched] == [("training", 1), ("benchmark", 1)]
+
+    scheduler.complete(benchmark)
+    assert run_ids(launched) == [1, 1, 2]
+
+
+def test_waits_for_free_vram_reported_by_the_gpu():
+    launched = []
+    gpu = FakeGpu(total=8000, free=4000)  # e.g. Ollama holds half of the card
+    scheduler = make_scheduler(launched, probe=gpu)
+
+    job = scheduler.submit("training", {"run_id": 1})
+    assert launched == []
+    assert job.state == "queued"
+
+    gpu.free = 7600
+    scheduler.dispatch()
+    assert run_ids(launched) == [1]
+    scheduler.pause()
+
+
+def test_counts_vram_of_started_jobs_that_are_still_loading():
+    launched = []
+    # nvidia-smi doesn't see the first job yet: free memory still looks untouched
+    gpu = FakeGpu(total=16000, free=16000)
+    scheduler = make_scheduler(launched, probe=gpu, gpu_slots=3)
+    first = scheduler.submit("training", {"run_id": 1})
+    scheduler.submit("training", {"run_id": 2})
+    scheduler.submit("training", {"run_id": 3})
+
+    # 16000 - 7000 reserved fits one more training (7000 + 500 headroom), not two
+    assert run_ids(launched) == [1, 2]
+
+    scheduler.complete(first)
+    assert run_ids(launched) == [1, 2, 3]
+    scheduler.pause()
+
+
+def test_without_a_gpu_probe_only_slots_count():
+    launched = []
+    scheduler = make_scheduler(launched, probe=None, gpu_slots=2)
+    for run_id in (1, 2, 3):
+        scheduler.submit("training", {"run_id": run_id})
+    assert run_ids(launched) == [1, 2]
+
+
+def test_failed_launch_hands_its_slot_to_the_next_job():
+    launched = []
+
+    def launcher(job):
+        launched.append(job)
+        return job.payload["run_id"] != 1
+
+    scheduler = GpuScheduler(launcher, gpu_slots=1, probe=None)
+    scheduler.submit("training", {"run_id": 1})
+    scheduler.submit("training", {"run_id": 2})
+
+    assert run_ids(launched) == [1, 2]
+    assert [job["run_id"] for job in scheduler.snapshot()["running"]] == [2]
+    assert launched[0].state == "failed"
+
+
+def test_queue_reads_do_not_wait_for_a_launch():
+    snapshots = []
+
+    def launcher(job):
+        # Status reads come from other threads (API, trainer callbacks) while the launch is busy
+        reader = threading.Thread(target=lambda: snapshots.append(scheduler.snapshot()))
+        reader.start()
+        reader.join(timeout=2)
+        return True
+
+    scheduler = GpuScheduler(launcher, gpu_slots=1, probe=None)
+    scheduler.submit("training", {"run_id": 1})
+    assert len(snapshots) == 1
+    assert [job["run_id"] for job in snapshots[0]["running"]] == [1]
+
+
+def test_paused_scheduler_starts_nothing():
+    launched = []
+    scheduler = make_scheduler(launched)
+    running = scheduler.submit("training", {"run_id": 1})
+    scheduler.submit("training", {"run_id": 2})
+
+    scheduler.pause()
+    scheduler.complete(running)
+    assert run_ids(launched) == [1]
+    assert [job["run_id"] for job in scheduler.snapshot()["queued"]] == [2]
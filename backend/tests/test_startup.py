@@ -0,0 +1,11 @@
+import pytest
+
+from app import startup_bench
+
+
+@pytest.mark.parametrize("target", list(startup_bench.TARGETS))
+def test_entry_point_starts_within_budget(target, tmp_path, monkeypatch):
+    # Throwaway database and working directory: importing the API creates tables, cache/ and uploads/
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'startup.db'}")
+    result = startup_bench.run([target], workdir=str(tmp_path))[target]
+    assert result["ok"], f"{target}: {'; '.join(result['problems'])} (slowest imports: {result['slowest']})"
@@ -8,6 +8,8 @@ function App() {
   const [isAnalyzing, setIsAnalyzing] = useState(false)
   const [error, setError] = useState(null)
   const [showExpertMode, setShowExpertMode] = useState(false)
+  const [incrementalTraining, setIncrementalTraining] = useState(false)
+  const [fastAnalysis, setFastAnalysis] = useState(false)
   const [trainingStatus, setTrainingStatus] = useState({
     status: 'idle',
     training_progress: 0,
@@ -15,27 +17,34 @@ function App() {
     baseline_f1_non_empty: 0,
     baseline_exact_match: 0,
     new_f1_non_empty: 0,
-    new_exact_match: 0
+    new_exact_match: 0,
+    train_mode: 'full',
+    cycle_seconds: null,
+    f1_retention: null
   });
 
-  const pollInterval = useRef(null);
+  const eventSource = useRef(null);
 
   useEffect(() => {
     if (showExpertMode) {
-      pollInterval.current = setInterval(async () => {
+      // Status is pushed by the backend (SSE) instead of being polled
+      eventSource.current = new EventSource('http://localhost:8000/training/events');
+      eventSource.current.onmessage = (event) => {
         try {
-          const response = await fetch('http://localhost:8000/training/status');
-          const data = await response.json();
-          setTrainingStatus(data);
+          setTrainingStatus(JSON.parse(event.data));
         } catch (err) {
-          console.error("Failed to poll status", err);
+          console.error("Failed to parse status event", err);
         }
-      }, 2000);
+      };
+      eventSource.current.onerror = (err) => {
+        // EventSource reconnects on its own
+        console.error("Status stream error", err);
+      };
     } else {
-      if (pollInterval.current) clearInterval(pollInterval.current);
+      if (eventSource.current) eventSource.current.close();
     }
     return () => {
-      if (pollInterval.current) clearInterval(pollInterval.current);
+      if (eventSource.current) eventSource.current.close();
     };
   }, [showExpertMode]);
 
@@ -47,15 +56,29 @@ function App() {
     formData.append('file', file);
 
     try {
-      const response = await fetch('http://localhost:8000/training/upload', {
+      const mode = incrementalTraining ? 'incremental' : 'full';
+      const response = await fetch(`http://localhost:8000/training/upload?mode=${mode}`, {
         method: 'POST',
         body: formData,
       });
       if (response.ok) {
-        alert("Pomyślnie rozpoczęto trening!");
+        const data = await response.json();
+        const summary = `Nowe przykłady: ${data.stats.rows}, pominięte duplikaty: ${data.stats.duplicates_skipped}.`;
+        if (data.status === 'queued') {
+          alert(`Dodano do kolejki treningowej (pozycja ${data.position}). ${summary}`);
+        } else {
+          alert(`Pomyślnie rozpoczęto trening! ${summary}`);
+        }
       } else {
         const errorData = await response.json();
-        alert("Błąd: " + (errorData.detail || "Nieznany błąd"));
+        const detail = errorData.detail;
+        if (detail && detail.errors) {
+          // Validation errors from the upload: show the offending lines
+          const lines = detail.errors.map(err => `linia ${err.line}: ${err.error}`).join("\n");
+          alert(`Błąd: ${detail.message}\n${lines}`);
+        } else {
+          alert("Błąd: " + ((detail && detail.message) || detail || "Nieznany błąd"));
+        }
       }
     } catch (err) {
       alert("Błąd połączenia: " + err.message);
@@ -83,7 +106,7 @@ function App() {
     setIsAnalyzing(true);
     setError(null);
     try {
-      const data = await analyzeText(text);
+      const data = await analyzeText(text, fastAnalysis ? 'fast' : 'full');
       setResults(data);
     } catch (err) {
       setError(err.message);
@@ -105,6 +128,22 @@ function App() {
             <div className="file-input-wrapper">
               <input type="file" onChange={handleFileUpload} />
             </div>
+            <label>
+              <input
+                type="checkbox"
+                checked={incrementalTraining}
+                onChange={(e) => setIncrementalTraining(e.target.checked)}
+              />
+              Trening przyrostowy (od aktualnego adaptera)
+            </label>
+            <label>
+              <input
+                type="checkbox"
+                checked={fastAnalysis}
+                onChange={(e) => setFastAnalysis(e.target.checked)}
+              />
+              Szybka analiza (wynik podobnego artykułu, jeśli był analizowany)
+            </label>
           </div>
 
           <div className="progress-section">
@@ -155,6 +194,16 @@ function App() {
                 {trainingStatus.new_exact_match.toFixed(4)}
               </span>
             </div>
+
+            {trainingStatus.cycle_seconds != null && (
+              <div className="stats-row">
+                <span className="metric-label">Cykl ({trainingStatus.train_mode})</span>
+                <span className="stat-value">{Math.round(trainingStatus.cycle_seconds)} s</span>
+                <span className="stat-value">
+                  {trainingStatus.f1_retention != null ? `retencja F1 ${(trainingStatus.f1_retention * 100).toFixed(1)}%` : '-'}
+                </span>
+              </div>
+            )}
           </div>
 
           <div style={{ display: 'flex', alignItems: 'center', gap: '10px' }}>
@@ -236,6 +285,31 @@ function App() {
                 <div className="reasoning-block">
                   <p className="reasoning-text">{results.reasoning}</p>
                 </div>
+
+                {results.cachedFrom && (
+                  <p className="cache-note">
+                    Wynik podobnego, wcześniej analizowanego artykułu (podobieństwo {results.cachedFrom.similarity.toFixed(2)})
+                  </p>
+                )}
+
+                {results.evidence.length > 0 && (
+                  <div className="evidence-block">
+                    <h4>Podobne oznaczone przykłady</h4>
+                    {results.evidence.map((example, index) => (
+                      <div key={index} className="evidence-item">
+                        <div className="evidence-header">
+                          <span className="evidence-similarity">{example.similarity.toFixed(2)}</span>
+                          {example.techniques.map((tech, i) => (
+                            <span key={i} className="tech-badge has-tooltip" data-title={tech.description}>
+                              {tech.name}
+                            </span>
+                          ))}
+                        </div>
+                        <p className="evidence-preview">{example.preview}…</p>
+                      </div>
+                    ))}
+                  </div>
+                )}
               </div>
             )}
             
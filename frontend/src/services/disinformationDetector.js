@@ -53,19 +53,31 @@ const TECHNIQUE_MAPPING = {
   }
 };
 
+function mapTechnique(tag) {
+  const info = TECHNIQUE_MAPPING[tag] || {
+    name: tag,
+    description: "Nierozpoznana technika (możliwa halucynacja modelu)"
+  };
+  return {
+    name: info.name,
+    description: info.description
+  };
+}
+
 /**
  * Analyzes the provided text for disinformation techniques.
  * @param {string} text - The article text to analyze.
+ * @param {string} mode - 'fast' reuses the answer for a very similar, already analyzed article.
  * @returns {Promise<Array>} - A promise resolving to an array of detected techniques.
  */
-export async function analyzeText(text) {
+export async function analyzeText(text, mode = 'full') {
   try {
     const response = await fetch(BACKEND_URL, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ text }),
+      body: JSON.stringify({ text, mode }),
     });
 
     if (!response.ok) {
@@ -78,20 +90,20 @@ export async function analyzeText(text) {
     const tags = data.discovered_techniques || [];
 
     // Map tags to user-friendly names
-    const techniques = tags.map(tag => {
-      const info = TECHNIQUE_MAPPING[tag] || { 
-        name: tag, 
-        description: "Nierozpoznana technika (możliwa halucynacja modelu)" 
-      };
-      return {
-        name: info.name,
-        description: info.description
-      };
-    });
+    const techniques = tags.map(mapTechnique);
+
+    // Nearest expert-labelled examples from the training data
+    const evidence = (data.evidence || []).map(example => ({
+      similarity: example.similarity,
+      preview: example.preview,
+      techniques: (example.techniques || []).map(mapTechnique)
+    }));
 
     return {
       techniques: techniques,
-      reasoning: data.reasoning || "Model wygenerował nieprawidłową strukturę json." // Handle potential model typo
+      reasoning: data.reasoning || "Model wygenerował nieprawidłową strukturę json.", // Handle potential model typo
+      evidence: evidence,
+      cachedFrom: data.cached_from || null
     };
 
   } catch (error) {